@@ -0,0 +1,69 @@
+"""
+Request handling shared by the Flask server (app.py) and the ASGI server (asgi_app.py).
+"""
+import os
+import payload_codec
+from db_query import LAYOUTS, Viewport
+from live_stream import DEFAULT_LIVE_FIELDS
+from query_cache import QUERY_CACHE_ALIGN, window_blocks, slice_window, window_key
+
+
+# 'rows' sends one object per agent, the shape existing clients read,
+# 'columnar' one array per field and vts, for the clients that ask for it
+RESPONSE_LAYOUT = os.environ.get('AGENT_RESPONSE_LAYOUT', 'rows')
+
+
+def parse_viewport(value):
+    # {'bbox': [west, south, east, north], 'zoom': zoom}, the whole city if missing
+    if not value or not value.get('bbox'):
+        return None
+    return Viewport(value['bbox'], value.get('zoom'))
+
+
+def parse_time_range_request(value):
+    # [time_value, buffer_length, emission_ids(, run_id(, layout(, viewport)))], all runs if run_id is missing
+    time_value, buffer_length, emission_ids = value[:3]
+    run_id = value[3] if len(value) > 3 else None
+    layout = value[4] if len(value) > 4 and value[4] in LAYOUTS else RESPONSE_LAYOUT
+    viewport = parse_viewport(value[5]) if len(value) > 5 else None
+    return time_value, buffer_length, emission_ids, run_id, layout, viewport
+
+
+def query_time_range(agent_query, value, encoding=payload_codec.DEFAULT_ENCODING, cache=None):
+    """
+    Answers a float_req or emis_req request, encoded as negotiated by the client.
+    With a cache, the encoded payload is reused, and a missing one is cut from
+    the cached blocks aligned to the buffer length.
+    """
+    time_value, buffer_length, emission_ids, run_id, layout, viewport = parse_time_range_request(value)
+    if encoding != 'json':
+        # binary encodings are built from the columnar layout
+        layout = 'columnar'
+
+    def query(start):
+        return agent_query.query_emission_time_range(time_value=start, buffer_length=buffer_length, emission_ids=emission_ids, run_id=run_id, layout=layout, viewport=viewport)
+
+    def block(start):
+        key = window_key(run_id, start, buffer_length, emission_ids, layout, None, viewport)
+        return cache.get_or_compute(key, lambda: query(start))
+
+    def encoded_window():
+        if not QUERY_CACHE_ALIGN:
+            return payload_codec.encode(query(time_value), encoding)
+        window = {}
+        for start in window_blocks(time_value, buffer_length):
+            window.update(slice_window(block(start), time_value, buffer_length))
+        return payload_codec.encode(window, encoding)
+
+    if cache is None:
+        return payload_codec.encode(query(time_value), encoding)
+    key = window_key(run_id, time_value, buffer_length, emission_ids, layout, encoding, viewport)
+    return cache.get_or_compute(key, encoded_window)
+
+
+def parse_live_request(value):
+    # [emission_ids(, run_id)], the position and name of the agents if emission_ids is empty
+    value = value or []
+    fields = [field for field in (value[0] if value else []) if field != 'vts'] or DEFAULT_LIVE_FIELDS
+    run_id = value[1] if len(value) > 1 else None
+    return fields, run_id
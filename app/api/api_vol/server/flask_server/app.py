@@ -1,17 +1,23 @@
+import functools
 from flask_socketio import SocketIO, emit
-from flask import Flask, render_template
+from flask import Flask, render_template, request, jsonify
 from db_connection import DBConn
-from db_query import AgentQuery
+from db_query import AgentQuery, RunQuery
+from api_events import query_time_range, parse_live_request
+from live_stream import LiveChannel
+from query_cache import QueryCache, IngestListener, QUERY_CACHE_BYTES
+import payload_codec
 
 # create a database connection instance
 Conn = DBConn()
-# create a Session instance
-session = Conn.get_db_session()
+# create a session registry, every socket event gets its own session
+Session = Conn.get_scoped_session
 # get table data model
 Agents = Conn.get_db_table("agents")
 
 # create a db query instance
-agentQuery = AgentQuery(session=session, model=Agents)
+agentQuery = AgentQuery(session=Session, model=Agents)
+runQuery = RunQuery(session=Session, conn=Conn)
 # res = agentQuery.query_emission_time_range(time_value=10, buffer_length=115, emission_ids=['vts', 'vlon','vname'])
 # from pprint import pprint
 # pprint(res)
@@ -47,7 +53,15 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
 socketio = SocketIO(app, cors_allowed_origins='*')
 
-FLOATING_FIELDS = {'lon': 'vlon', 'lat': 'vlat', 'name': 'vname'}
+# payload encoding negotiated by each client, json if it never asked
+client_encodings = {}
+# frames pushed by the simulation to the live clients
+liveChannel = LiveChannel()
+# encoded windows of the stored runs and the aligned blocks they are cut from, disabled with QUERY_CACHE_BYTES=0
+queryCache = None
+if QUERY_CACHE_BYTES > 0:
+    queryCache = QueryCache(QUERY_CACHE_BYTES)
+    IngestListener(Conn.engine, queryCache).start()
 
 
 @app.route('/')
@@ -60,18 +74,75 @@ def home():
     return "Home page"
 
 
+@app.route('/cache/stats/')
+def cache_stats():
+    return jsonify(queryCache.stats() if queryCache else {})
+
+
+def with_session(handler):
+    """Releases the session of the handler, and its connection, once the event is handled."""
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            Session.remove()
+    return wrapper
+
+
+def client_encoding():
+    return client_encodings.get(request.sid, payload_codec.DEFAULT_ENCODING)
+
+
+@socketio.on('payload_encoding_req')
+def handle_payload_encoding(value):
+    # value is an encoding or a list of encodings by order of preference
+    encoding = payload_codec.negotiate(value)
+    client_encodings[request.sid] = encoding
+    emit('payload_encoding_res', {'encoding': encoding, 'available': list(payload_codec.available_encodings())})
+
+
 @socketio.on('float_req')
+@with_session
 def handle_ts(value):
-    time_value, buffer_length, emission_ids = value
-    last = agentQuery.query_emission_time_range(time_value=time_value, buffer_length=buffer_length, emission_ids=emission_ids)
-    emit('float_res', last)
+    emit('float_res', query_time_range(agentQuery, value, client_encoding(), queryCache))
 
 
 @socketio.on('emis_req')
+@with_session
 def handle_emis(value):
-    time_value, buffer_length, emission_ids = value
-    last = agentQuery.query_emission_time_range(time_value=time_value, buffer_length=buffer_length, emission_ids=emission_ids)
-    emit('emis_res', last)
+    emit('emis_res', query_time_range(agentQuery, value, client_encoding(), queryCache))
+
+
+@socketio.on('live_sub')
+def handle_live_sub(value=None):
+    fields, run_id = parse_live_request(value)
+    liveChannel.subscribe(request.sid, fields, run_id, client_encoding())
+
+
+@socketio.on('live_unsub')
+def handle_live_unsub(value=None):
+    liveChannel.unsubscribe(request.sid)
+
+
+@socketio.on('frame_pub')
+def handle_frame_pub(frame):
+    if not liveChannel.accepts(frame):
+        return
+    for sids, payload in liveChannel.publish(frame):
+        for sid in sids:
+            socketio.emit('live_frame', payload, to=sid)
+
+
+@socketio.on('cache_stats_req')
+def handle_cache_stats(value=None):
+    emit('cache_stats_res', queryCache.stats() if queryCache else {})
+
+
+@socketio.on('runs_req')
+@with_session
+def handle_runs(value=None):
+    emit('runs_res', runQuery.query_runs())
 
 
 @socketio.on('connect')
@@ -86,6 +157,8 @@ def test_connect(sid):
 def test_disconnect():
     print(50*'2')
     print('Client DISCONNECTED')
+    client_encodings.pop(request.sid, None)
+    liveChannel.unsubscribe(request.sid)
     print(50*'3')
     emit('disconnect', 'SOCKET DISCONNECTED')
 
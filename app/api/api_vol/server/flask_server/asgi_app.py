@@ -0,0 +1,175 @@
+"""
+Asyncio serving mode of the socket API, with the events and payloads of app.py.
+
+python-socketio's ASGI server runs the events on the event loop while the
+SQLAlchemy queries run in a bounded thread pool, so a slow query only holds
+one worker. Each client has at most one query in flight and at most one
+request waiting per event: a newer request of the same event replaces the
+waiting one, which is answered with req_dropped. The next query of a client
+only starts once engine.io handed its previous response to the transport, so
+a client asking faster than it consumes can neither fill the pool nor grow its
+output queue, and gets its responses in the order of its requests.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+"""
+import os
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import socketio
+from db_connection import DBConn, POOL_SIZE
+from db_query import AgentQuery, RunQuery
+from api_events import query_time_range, parse_live_request
+from live_stream import LiveChannel
+from query_cache import QueryCache, IngestListener, QUERY_CACHE_BYTES
+import payload_codec
+
+
+# threads running the queries, at most one connection of the pool each
+DB_WORKERS = int(os.environ.get('ASYNC_DB_WORKERS', POOL_SIZE))
+
+Conn = DBConn()
+Session = Conn.get_scoped_session
+Agents = Conn.get_db_table("agents")
+
+agentQuery = AgentQuery(session=Session, model=Agents)
+runQuery = RunQuery(session=Session, conn=Conn)
+
+executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+app = socketio.ASGIApp(sio)
+
+# payload encoding negotiated by each client, json if it never asked
+client_encodings = {}
+# frames pushed by the simulation to the live clients
+liveChannel = LiveChannel()
+# encoded windows of the stored runs and the aligned blocks they are cut from, disabled with QUERY_CACHE_BYTES=0
+queryCache = None
+if QUERY_CACHE_BYTES > 0:
+    queryCache = QueryCache(QUERY_CACHE_BYTES)
+    IngestListener(Conn.engine, queryCache).start()
+# requests waiting per client, the latest one of each event in arrival order,
+# and the clients with a query in flight
+pending_requests = {}
+running_clients = set()
+
+
+def with_session(func, *args):
+    try:
+        return func(*args)
+    finally:
+        Session.remove()
+
+
+async def run_query(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, with_session, func, *args)
+
+
+async def output_sent(sid):
+    """Waits until engine.io handed the packets queued for the client to its transport."""
+    try:
+        socket = sio.eio._get_socket(sio.manager.eio_sid_from_sid(sid, '/'))
+    except (KeyError, AttributeError):
+        # disconnected, or an engine.io without the socket queue
+        return
+    await socket.queue.join()
+
+
+async def answer(sid, event, value, query, res_event):
+    """
+    Queues the request of the client, replacing its request of the same event still waiting,
+    and answers the queued requests one at a time unless a query of the client is in flight.
+    Requests still waiting when the client disconnects are not queried.
+    """
+    pending = pending_requests.setdefault(sid, OrderedDict())
+    dropped = pending.pop(event, None)
+    pending[event] = (value, query, res_event)
+    if dropped is not None:
+        await sio.emit('req_dropped', {'event': event, 'value': dropped[0]}, to=sid)
+    if sid in running_clients:
+        return
+    running_clients.add(sid)
+    try:
+        while pending:
+            _, (value, query, res_event) = pending.popitem(last=False)
+            payload = await run_query(query, value)
+            await sio.emit(res_event, payload, to=sid)
+            await output_sent(sid)
+    finally:
+        running_clients.discard(sid)
+        if not pending and pending_requests.get(sid) is pending:
+            del pending_requests[sid]
+
+
+def client_encoding(sid):
+    return client_encodings.get(sid, payload_codec.DEFAULT_ENCODING)
+
+
+@sio.on('payload_encoding_req')
+async def handle_payload_encoding(sid, value):
+    # value is an encoding or a list of encodings by order of preference
+    encoding = payload_codec.negotiate(value)
+    client_encodings[sid] = encoding
+    await sio.emit('payload_encoding_res', {'encoding': encoding, 'available': list(payload_codec.available_encodings())}, to=sid)
+
+
+@sio.on('float_req')
+async def handle_ts(sid, value):
+    encoding = client_encoding(sid)
+    await answer(sid, 'float_req', value, lambda value: query_time_range(agentQuery, value, encoding, queryCache), 'float_res')
+
+
+@sio.on('emis_req')
+async def handle_emis(sid, value):
+    encoding = client_encoding(sid)
+    await answer(sid, 'emis_req', value, lambda value: query_time_range(agentQuery, value, encoding, queryCache), 'emis_res')
+
+
+@sio.on('live_sub')
+async def handle_live_sub(sid, value=None):
+    fields, run_id = parse_live_request(value)
+    liveChannel.subscribe(sid, fields, run_id, client_encoding(sid))
+
+
+@sio.on('live_unsub')
+async def handle_live_unsub(sid, value=None):
+    liveChannel.unsubscribe(sid)
+
+
+@sio.on('frame_pub')
+async def handle_frame_pub(sid, frame):
+    if not liveChannel.accepts(frame):
+        return
+    for sids, payload in liveChannel.publish(frame):
+        for live_sid in sids:
+            await sio.emit('live_frame', payload, to=live_sid)
+
+
+@sio.on('cache_stats_req')
+async def handle_cache_stats(sid, value=None):
+    await sio.emit('cache_stats_res', queryCache.stats() if queryCache else {}, to=sid)
+
+
+@sio.on('runs_req')
+async def handle_runs(sid, value=None):
+    await sio.emit('runs_res', await run_query(runQuery.query_runs), to=sid)
+
+
+@sio.event
+async def connect(sid, environ):
+    print('Client CONNECTED', sid)
+
+
+@sio.event
+async def disconnect(sid):
+    print('Client DISCONNECTED', sid)
+    client_encodings.pop(sid, None)
+    liveChannel.unsubscribe(sid)
+    pending_requests.pop(sid, OrderedDict()).clear()
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
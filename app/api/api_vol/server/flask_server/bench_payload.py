@@ -0,0 +1,109 @@
+"""
+Compares the size and encode time of the float_res / emis_res payloads: the JSON
+responses, in the former rows layout and in the columnar layout, and the binary
+encodings of payload_codec, then the same for the floating-car fields only,
+including the delta encoding. Runs on generated windows, no database needed.
+
+    python bench_payload.py --steps 115 --vehicles 5000
+"""
+import json
+import time
+import random
+import argparse
+import payload_codec
+
+
+FIELDS = ('lon', 'lat', 'name', 'vemis_co2', 'vemis_nox')
+
+
+def make_window(steps, vehicles, seed=0, turnover=0.01):
+    """Vehicles move a few metres per step, a fraction of them is replaced every step."""
+    rnd = random.Random(seed)
+    positions = {'veh%i' % i: (-73.9 + rnd.random() * 0.4, 45.4 + rnd.random() * 0.3) for i in range(vehicles)}
+    next_id = vehicles
+    columnar = {}
+    for vts in range(steps):
+        for name in rnd.sample(list(positions), int(vehicles * turnover)):
+            del positions[name]
+            positions['veh%i' % next_id] = (-73.9 + rnd.random() * 0.4, 45.4 + rnd.random() * 0.3)
+            next_id += 1
+        positions = {name: (lon + rnd.uniform(-1e-4, 1e-4), lat + rnd.uniform(-1e-4, 1e-4))
+                     for name, (lon, lat) in positions.items()}
+        columnar[vts] = {
+            'lon': [lon for lon, _ in positions.values()],
+            'lat': [lat for _, lat in positions.values()],
+            'name': list(positions),
+            'vemis_co2': [rnd.random() * 5000 for _ in range(vehicles)],
+            'vemis_nox': [rnd.random() * 2 for _ in range(vehicles)],
+        }
+    return columnar
+
+
+def floating(columnar):
+    """The fields of the floating-car feed."""
+    return {vts: {key: fields[key] for key in ('lon', 'lat', 'name')} for vts, fields in columnar.items()}
+
+
+def to_rows(columnar):
+    return {vts: [dict(zip(fields, values)) for values in zip(*fields.values())]
+            for vts, fields in columnar.items()}
+
+
+def payload_size(payload):
+    """Bytes on the wire: the JSON text, binary values replaced by Socket.IO placeholders, plus the attachments."""
+    if isinstance(payload, str):
+        return len(payload.encode('utf-8'))
+    attachments = []
+
+    def placeholder(value):
+        if isinstance(value, bytes):
+            attachments.append(len(value))
+            return {'_placeholder': True, 'num': len(attachments) - 1}
+        if isinstance(value, dict):
+            return {key: placeholder(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [placeholder(item) for item in value]
+        return value
+
+    return len(json.dumps(placeholder(payload)).encode('utf-8')) + sum(attachments)
+
+
+def measure(encode, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        payload = encode()
+        best = min(best, time.perf_counter() - t0)
+    return best, payload_size(payload)
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description="Benchmark the agent window payload encodings")
+    argParser.add_argument("-s", "--steps", type=int, default=115, help="steps per window")
+    argParser.add_argument("-v", "--vehicles", type=int, default=5000, help="vehicles per step")
+    argParser.add_argument("-r", "--repeat", type=int, default=3, help="runs per measure, the best one is reported")
+    options = argParser.parse_args()
+
+    columnar = make_window(options.steps, options.vehicles)
+    rows = to_rows(columnar)
+    floating_columnar = floating(columnar)
+    floating_rows = to_rows(floating_columnar)
+
+    cases = [
+        ('json rows', lambda: json.dumps(rows)),
+        ('json columnar', lambda: json.dumps(columnar)),
+        ('typed float32', lambda: payload_codec.encode(columnar, 'typed', 'float32')),
+        ('typed float64', lambda: payload_codec.encode(columnar, 'typed', 'float64')),
+    ]
+    if 'arrow' in payload_codec.available_encodings():
+        cases.append(('arrow float32', lambda: payload_codec.encode(columnar, 'arrow', 'float32')))
+    cases += [
+        ('float json rows', lambda: json.dumps(floating_rows)),
+        ('float typed', lambda: payload_codec.encode(floating_columnar, 'typed')),
+        ('float delta', lambda: payload_codec.encode(floating_columnar, 'delta')),
+    ]
+
+    print("%-16s %12s %12s" % ("encoding", "size (MB)", "encode (ms)"))
+    for name, encode in cases:
+        seconds, size = measure(encode, options.repeat)
+        print("%-16s %12.3f %12.1f" % (name, size / 1e6, seconds * 1000))
@@ -3,7 +3,15 @@ from sqlalchemy.engine import reflection
 from sqlalchemy import create_engine, select
 from sqlalchemy import select
 from sqlalchemy.ext.automap import automap_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+
+# connection pool of the engine, sized for the concurrent socket handlers
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 20))
+POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+# seconds after which a connection is replaced, below the server and proxy idle timeouts
+POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
 
 
 class DBConn():
@@ -39,13 +47,34 @@ class DBConn():
     def init_db_engine(self, configs):
         db_string = 'postgresql://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}'.format(
             **configs)
-        return create_engine(db_string, echo=False)
+        return create_engine(db_string, echo=False,
+                             pool_size=POOL_SIZE,
+                             max_overflow=POOL_MAX_OVERFLOW,
+                             pool_timeout=POOL_TIMEOUT,
+                             pool_recycle=POOL_RECYCLE,
+                             pool_pre_ping=True)
         
     @property
     def get_db_session(self):
         return sessionmaker(bind=self.engine)
 
+    @property
+    def get_scoped_session(self):
+        # one session per thread (per greenlet under eventlet), call remove() when the request ends
+        return scoped_session(sessionmaker(bind=self.engine))
+
     def get_db_table(self, name):
         return self.Base.classes[name]
 
+    def find_db_table(self, name):
+        """
+        Returns the model of the table, reflecting the database again if the table
+        was created after the start, None if it still does not exist.
+        """
+        if name not in self.Base.classes:
+            Base = automap_base()
+            Base.prepare(self.engine, reflect=True)
+            self.Base = Base
+        return self.Base.classes.get(name)
+
 
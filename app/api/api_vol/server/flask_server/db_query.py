@@ -1,6 +1,42 @@
+import os
+from sqlalchemy import func, literal
 from sqlalchemy.orm import load_only
 
 
+# response layouts of the time range queries, see AgentQuery.time_range_query
+LAYOUTS = ('columnar', 'rows')
+DEFAULT_LAYOUT = 'rows'
+
+FLOATING_FIELDS = {'lon': 'vlon', 'lat': 'vlat', 'name': 'vname'}
+
+SRID = 4326
+# zoom levels up to GRID_MAX_ZOOM get grid cells instead of agents
+GRID_MAX_ZOOM = int(os.environ.get('VIEWPORT_GRID_MAX_ZOOM', 12))
+GRID_CELLS_PER_TILE = int(os.environ.get('VIEWPORT_GRID_CELLS_PER_TILE', 16))
+# columns that are not summed per grid cell
+GRID_SKIPPED_COLUMNS = ('vts', 'vlon', 'vlat', 'vname', 'vtype', 'id', 'run_id')
+
+
+class Viewport():
+    """Bounding box of a map client, in degrees, and its zoom level."""
+
+    def __init__(self, bbox, zoom=None):
+        self.west, self.south, self.east, self.north = [float(value) for value in bbox]
+        self.zoom = None if zoom is None else int(zoom)
+
+    @property
+    def aggregated(self):
+        return self.zoom is not None and self.zoom <= GRID_MAX_ZOOM
+
+    @property
+    def cell_size(self):
+        # width of a web map tile at the zoom level, split in GRID_CELLS_PER_TILE cells
+        return 360.0 / 2 ** self.zoom / GRID_CELLS_PER_TILE
+
+    def key(self):
+        return (self.west, self.south, self.east, self.north, self.zoom)
+
+
 class DBQuery():
     def __init__(self, session=None, model=None):
         if model and session:
@@ -17,33 +53,127 @@ class AgentQuery(DBQuery):
     def __init__(self, session=None, model=None):
         super().__init__(session=session, model=model)
         
-    def query_floating_time_range(self, time_value, buffer_length):
-        model = self.model
-        queried_data = self.session.query(model).filter(model.vts < time_value+buffer_length).filter(model.vts >= time_value)
-        res = {}
-        for el in queried_data:
-            pack = {'lon':el.vlon, 'lat':el.vlat, 'name':el.vname }
-            if el.vts in res:
-                res[el.vts].append(pack)
-            else:
-                res[el.vts] = [pack]
-        return res
-    
-    def query_emission_time_range(self, time_value, buffer_length, emission_ids = []):
+    def filter_run(self, query, run_id=None):
+        if run_id is None:
+            return query
+        return query.filter(self.model.run_id == run_id)
+
+    def filter_viewport(self, query, viewport=None):
+        if viewport is None:
+            return query
+        envelope = func.ST_MakeEnvelope(viewport.west, viewport.south, viewport.east, viewport.north, SRID)
+        # bounding box overlap, answered by the GiST index on geom
+        return query.filter(self.model.geom.op('&&')(envelope))
+
+    @staticmethod
+    def aggregate_by_vts(expressions, layout):
+        """
+        Aggregates of one vts group.
+        columnar: one array per expression, aligned across expressions
+        rows: one json object per agent, the response shape of the first versions
+        """
+        if layout == 'rows':
+            pairs = [arg for key, expr in expressions.items() for arg in (literal(key), expr)]
+            return [func.json_agg(func.json_build_object(*pairs)).label('rows')]
+        # aggregates of one group read the same rows in the same order, so the arrays stay aligned
+        return [func.array_agg(expr).label(key) for key, expr in expressions.items()]
+
+    def time_range_query(self, time_value, buffer_length, fields, run_id=None, layout=DEFAULT_LAYOUT, viewport=None):
+        """
+        Groups the rows of the time window by vts in SQL, one result row per vts.
+        fields maps the keys of the response to the columns of the model.
+        Only the agents inside the viewport are returned, as grid cells at low zoom.
+        """
+        if layout not in LAYOUTS:
+            raise ValueError('layout must be one of %s' % (LAYOUTS,))
+        if viewport is not None and viewport.aggregated:
+            return self.grid_query(time_value, buffer_length, fields, run_id, layout, viewport)
         model = self.model
+        entities = self.aggregate_by_vts({key: model.__dict__[col] for key, col in fields.items()}, layout)
         queried_data = (self.session
-                            .query(model)
+                            .query(model.vts, *entities)
                             .filter(model.vts < time_value+buffer_length)
                             .filter(model.vts >= time_value)
-                            .with_entities(*[model.__dict__[col] for col in emission_ids]) # filter by columns in emission_ids list
                         )
+        queried_data = self.filter_viewport(self.filter_run(queried_data, run_id), viewport)
+        return queried_data.group_by(model.vts).order_by(model.vts)
 
-        res = {}
-    
-        for el in queried_data:
-            pack = {i:el.__getattribute__(i) for i in emission_ids}
-            if el.vts in res:
-                res[el.vts].append(pack)
-            else:
-                res[el.vts] = [pack]
-        return res
\ No newline at end of file
+    def grid_query(self, time_value, buffer_length, fields, run_id, layout, viewport):
+        """
+        Counts the agents per grid cell and vts, with the sum of the requested numeric columns.
+        Cells are returned by their center, under the keys of vlon and vlat, with a count.
+        """
+        model = self.model
+        cell = viewport.cell_size
+        lon_key = next((key for key, col in fields.items() if col == 'vlon'), 'lon')
+        lat_key = next((key for key, col in fields.items() if col == 'vlat'), 'lat')
+        sums = {key: col for key, col in fields.items() if col not in GRID_SKIPPED_COLUMNS}
+
+        gx = func.floor(model.vlon / cell).label('gx')
+        gy = func.floor(model.vlat / cell).label('gy')
+        cells = (self.session
+                    .query(model.vts.label('vts'), gx, gy, func.count().label('count'),
+                           *[func.sum(model.__dict__[col]).label(key) for key, col in sums.items()])
+                    .filter(model.vts < time_value+buffer_length)
+                    .filter(model.vts >= time_value)
+                )
+        cells = self.filter_viewport(self.filter_run(cells, run_id), viewport).group_by(model.vts, gx, gy).subquery()
+
+        expressions = {lon_key: (cells.c.gx + 0.5) * cell, lat_key: (cells.c.gy + 0.5) * cell, 'count': cells.c.count}
+        expressions.update({key: cells.c[key] for key in sums})
+        return (self.session
+                    .query(cells.c.vts, *self.aggregate_by_vts(expressions, layout))
+                    .group_by(cells.c.vts)
+                    .order_by(cells.c.vts))
+
+    def query_floating_time_range(self, time_value, buffer_length, run_id=None, layout=DEFAULT_LAYOUT, viewport=None):
+        queried_data = self.time_range_query(time_value, buffer_length, FLOATING_FIELDS, run_id=run_id, layout=layout, viewport=viewport)
+        return self.pack_time_range(queried_data, layout)
+
+    def query_emission_time_range(self, time_value, buffer_length, emission_ids = [], run_id=None, layout=DEFAULT_LAYOUT, viewport=None):
+        if layout == 'columnar':
+            # vts is the key of every group
+            fields = {col: col for col in emission_ids if col != 'vts'}
+        else:
+            fields = {col: col for col in emission_ids}
+        queried_data = self.time_range_query(time_value, buffer_length, fields, run_id=run_id, layout=layout, viewport=viewport)
+        return self.pack_time_range(queried_data, layout)
+
+    @staticmethod
+    def pack_time_range(queried_data, layout):
+        if layout == 'rows':
+            return {el.vts: el.rows for el in queried_data}
+        return {el.vts: {key: value for key, value in el._asdict().items() if key != 'vts'} for el in queried_data}
+
+
+class RunQuery(DBQuery):
+    """
+    Queries the runs table. Its model is reflected on the first query that finds
+    the table, the API may start before the backend created it.
+    """
+
+    def __init__(self, session=None, conn=None, name='runs'):
+        if not (session and conn):
+            raise Exception('must have a valid session and database connection')
+        self.session = session
+        self.conn = conn
+        self.name = name
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self.conn.find_db_table(self.name)
+        return self._model
+
+    def query_runs(self):
+        model = self.model
+        if model is None:
+            # no run was stored yet
+            return []
+        return [{'run_id': run.run_id,
+                 'config_file': run.config_file,
+                 'seed': run.seed,
+                 'started_at': run.started_at.isoformat() if run.started_at else None,
+                 'finished_at': run.finished_at.isoformat() if run.finished_at else None}
+                for run in self.session.query(model).order_by(model.run_id)]
@@ -0,0 +1,122 @@
+"""
+Delta encoding of the floating-car windows (the 'delta' payload encoding).
+
+Positions are quantized to POSITION_SCALE degrees and vehicles are numbered by
+a small integer index, their names being sent once per window. The first step
+of a window, and every KEYFRAME_INTERVAL steps, is a keyframe with absolute
+positions. The other steps only carry the vehicles that exited, the vehicles
+that entered with their absolute position, and an int16 position delta for
+every vehicle that stayed. A step whose deltas do not fit in int16 is sent as
+a keyframe.
+
+    {'encoding': 'delta', 'scale': 1e-06, 'names': ['veh0', 'veh1', ...], 'frames': [
+        {'vts': 0, 'key': True, 'ids': int32, 'lon': int32, 'lat': int32},
+        {'vts': 5, 'exit': int32, 'dlon': int16, 'dlat': int16,
+         'enter': int32, 'enter_lon': int32, 'enter_lat': int32},
+        ...]}
+
+All arrays are little-endian bytes. A client keeps the ordered list of active
+vehicle ids: a keyframe replaces it with ids. A delta frame removes the exit
+ids, keeping the order of the others, adds dlon/dlat to them in that order,
+then appends the enter ids. Fields other than the position and the name are
+sent per frame under 'fields', in the order of the active list, as float32
+arrays or as lists for text fields.
+"""
+import os
+import sys
+from array import array
+
+
+POSITION_SCALE = float(os.environ.get('DELTA_POSITION_SCALE', 1e-6))
+KEYFRAME_INTERVAL = int(os.environ.get('DELTA_KEYFRAME_INTERVAL', 20))
+
+LON_KEYS = ('lon', 'vlon')
+LAT_KEYS = ('lat', 'vlat')
+NAME_KEYS = ('name', 'vname')
+
+_INT16_MIN, _INT16_MAX = -2**15, 2**15 - 1
+
+
+def _pack(typecode, values):
+    data = array(typecode, values)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+
+def _pack_floats(values):
+    try:
+        return _pack('f', values)
+    except TypeError:
+        return _pack('f', [float('nan') if value is None else value for value in values])
+
+
+def _find_key(fields, keys):
+    for key in keys:
+        if key in fields:
+            return key
+    return None
+
+
+def position_keys(columnar):
+    """Returns the (lon, lat, name) keys of the window, None if it cannot be delta encoded."""
+    for fields in columnar.values():
+        keys = (_find_key(fields, LON_KEYS), _find_key(fields, LAT_KEYS), _find_key(fields, NAME_KEYS))
+        return keys if None not in keys else None
+    return None
+
+
+def _delta_frame(vts, active, positions, current):
+    stay = [vid for vid in active if vid in current]
+    exits = [vid for vid in active if vid not in current]
+    enters = [vid for vid in current if vid not in positions]
+    dlon = [current[vid][0] - positions[vid][0] for vid in stay]
+    dlat = [current[vid][1] - positions[vid][1] for vid in stay]
+    if stay and (min(dlon) < _INT16_MIN or max(dlon) > _INT16_MAX or min(dlat) < _INT16_MIN or max(dlat) > _INT16_MAX):
+        return None, None
+    frame = {'vts': vts, 'exit': _pack('i', exits), 'dlon': _pack('h', dlon), 'dlat': _pack('h', dlat),
+             'enter': _pack('i', enters),
+             'enter_lon': _pack('i', [current[vid][0] for vid in enters]),
+             'enter_lat': _pack('i', [current[vid][1] for vid in enters])}
+    return frame, stay + enters
+
+
+def encode_delta(columnar, keyframe_interval=KEYFRAME_INTERVAL, scale=POSITION_SCALE):
+    keys = position_keys(columnar)
+    if keys is None:
+        raise ValueError('the delta encoding needs the position and the name of the vehicles')
+    lon_key, lat_key, name_key = keys
+
+    index = {}
+    frames = []
+    active, positions = [], {}
+    for step, vts in enumerate(sorted(columnar)):
+        fields = columnar[vts]
+        ids = [index.setdefault(name, len(index)) for name in fields[name_key]]
+        lons = [int(round(lon / scale)) for lon in fields[lon_key]]
+        lats = [int(round(lat / scale)) for lat in fields[lat_key]]
+        # insertion ordered, the enter ids follow the order of the step
+        current = dict(zip(ids, zip(lons, lats)))
+
+        frame = None
+        if step % keyframe_interval != 0:
+            frame, order = _delta_frame(vts, active, positions, current)
+        if frame is None:
+            frame = {'vts': vts, 'key': True, 'ids': _pack('i', list(current)),
+                     'lon': _pack('i', [lon for lon, _ in current.values()]),
+                     'lat': _pack('i', [lat for _, lat in current.values()])}
+            order = list(current)
+
+        extra = [key for key in fields if key not in keys]
+        if extra:
+            row_of = {vid: row for row, vid in enumerate(ids)}
+            rows = [row_of[vid] for vid in order]
+            frame['fields'] = {key: _pack_floats([fields[key][row] for row in rows])
+                               if not isinstance(next(iter(fields[key]), None), str)
+                               else [fields[key][row] for row in rows]
+                               for key in extra}
+
+        frames.append(frame)
+        active, positions = order, current
+
+    return {'encoding': 'delta', 'scale': scale, 'names': list(index), 'frames': frames}
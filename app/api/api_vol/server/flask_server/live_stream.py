@@ -0,0 +1,57 @@
+"""
+In-memory pub/sub of the simulation frames.
+
+store_traffic_flow.py publishes every step with the frame_pub event, a frame being
+
+    {'run_id': 3, 'vts': 120, 'token': ..., 'columns': {'vname': [...], 'vlon': [...], ...}}
+
+and the server pushes it to the clients that sent live_sub, as a live_frame event
+shaped like a one step float_res / emis_res response, without a database round trip.
+frame_pub is a socket event any client can send, so frames are only accepted with
+LIVE_PUBLISH_TOKEN, shared by the API and the backend. Without it nothing is published.
+"""
+import os
+import hmac
+import payload_codec
+
+
+LIVE_PUBLISH_TOKEN = os.environ.get('LIVE_PUBLISH_TOKEN')
+DEFAULT_LIVE_FIELDS = ('vlon', 'vlat', 'vname')
+
+
+class LiveChannel():
+
+    def __init__(self, token=LIVE_PUBLISH_TOKEN):
+        self.token = token
+        # sid -> (fields, run_id, encoding)
+        self.subscribers = {}
+
+    def subscribe(self, sid, fields=DEFAULT_LIVE_FIELDS, run_id=None, encoding=payload_codec.DEFAULT_ENCODING):
+        """Subscribes the client to the frames of run_id, of every run if None."""
+        self.subscribers[sid] = (tuple(fields), run_id, encoding)
+
+    def unsubscribe(self, sid):
+        self.subscribers.pop(sid, None)
+
+    def accepts(self, frame):
+        # frames are only accepted with the token of the publisher, and never without one
+        token = frame.get('token') if isinstance(frame, dict) else None
+        if not self.token or not isinstance(token, str):
+            return False
+        return hmac.compare_digest(token.encode(), self.token.encode())
+
+    def publish(self, frame):
+        """
+        Returns [(sids, payload)] for the subscribers of the frame, encoded once per
+        set of fields and encoding rather than once per client.
+        """
+        groups = {}
+        for sid, (fields, run_id, encoding) in list(self.subscribers.items()):
+            if run_id is None or run_id == frame['run_id']:
+                groups.setdefault((fields, encoding), []).append(sid)
+        columns = frame['columns']
+        messages = []
+        for (fields, encoding), sids in groups.items():
+            window = {frame['vts']: {field: columns[field] for field in fields if field in columns}}
+            messages.append((sids, payload_codec.encode(window, encoding)))
+        return messages
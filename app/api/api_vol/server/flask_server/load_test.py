@@ -0,0 +1,74 @@
+"""
+Load test of the socket API: concurrent clients send float_req and wait for
+float_res, the latency of every round trip is reported as p50/p99.
+Needs a running server and the python-socketio client.
+
+    python load_test.py --url http://localhost:8000 --clients 50 --requests 20
+"""
+import time
+import random
+import argparse
+import threading
+import socketio
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_client(url, requests, buffer_length, emission_ids, max_vts, latencies, errors, start):
+    client = socketio.Client()
+    received = threading.Event()
+    client.on('float_res', lambda data: received.set())
+    rnd = random.Random()
+    try:
+        client.connect(url)
+    except Exception as err:
+        errors.append(str(err))
+        start.wait()
+        return
+    start.wait()
+    try:
+        for _ in range(requests):
+            received.clear()
+            t0 = time.perf_counter()
+            client.emit('float_req', [rnd.randrange(max_vts), buffer_length, emission_ids])
+            if received.wait(timeout=60):
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors.append('timeout')
+    finally:
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description="Load test the float_req event with concurrent socket clients")
+    argParser.add_argument("-u", "--url", default='http://localhost:8000')
+    argParser.add_argument("-c", "--clients", type=int, default=50)
+    argParser.add_argument("-n", "--requests", type=int, default=20, help="requests per client")
+    argParser.add_argument("-b", "--buffer-length", type=int, default=115)
+    argParser.add_argument("--max-vts", type=int, default=3600, help="window starts are drawn in [0, max-vts)")
+    argParser.add_argument("--fields", default='vts,vlon,vlat,vname')
+    options = argParser.parse_args()
+
+    latencies, errors = [], []
+    start = threading.Barrier(options.clients + 1)
+    threads = [threading.Thread(target=run_client,
+                                args=(options.url, options.requests, options.buffer_length, options.fields.split(','),
+                                      options.max_vts, latencies, errors, start))
+               for _ in range(options.clients)]
+    for thread in threads:
+        thread.start()
+    # every client is connected before the first request
+    start.wait()
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+
+    print("clients %i, requests %i, errors %i, %.1f requests/s" % (
+        options.clients, len(latencies), len(errors), len(latencies) / elapsed))
+    if latencies:
+        print("p50 %.1f ms, p99 %.1f ms, max %.1f ms" % (
+            percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, max(latencies) * 1000))
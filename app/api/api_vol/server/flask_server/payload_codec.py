@@ -0,0 +1,140 @@
+"""
+Encodings of the agent time windows sent with the float_res and emis_res events.
+
+json    the dict returned by AgentQuery, serialized to JSON by Socket.IO
+typed   one little-endian typed array per column, sent as Socket.IO binary attachments
+arrow   an Arrow IPC stream of the same columns, only if pyarrow is installed
+delta   keyframes and quantized position deltas, see delta_codec. Windows without
+        the position and the name of the vehicles are sent as typed
+
+typed and arrow flatten the columnar layout of AgentQuery into row aligned columns
+with a vts column. A typed payload looks like
+
+    {'encoding': 'typed', 'length': 3, 'columns': [
+        {'name': 'vts', 'dtype': 'int32', 'data': b'...'},
+        {'name': 'lon', 'dtype': 'float32', 'data': b'...'},
+        {'name': 'name', 'dtype': 'utf8', 'offsets': b'...', 'data': b'...'}]}
+
+Integer columns (vts, id, run_id, count) are int32, the others float32 or float64.
+A client reads the columns with new Int32Array(data) and new Float32Array(data).
+The i-th string is data[offsets[i]:offsets[i + 1]] decoded as utf-8.
+"""
+import os
+import sys
+from array import array
+import delta_codec
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+ENCODINGS = ('json', 'typed', 'arrow', 'delta')
+DEFAULT_ENCODING = 'json'
+FLOAT_DTYPES = ('float32', 'float64')
+FLOAT_DTYPE = os.environ.get('PAYLOAD_FLOAT_DTYPE', 'float32')
+
+TEXT_COLUMNS = ('name', 'vname', 'vtype')
+# integer columns of the agents table, and the agent count of the grid cells
+INTEGER_COLUMNS = ('vts', 'id', 'run_id', 'count')
+
+_TYPECODES = {'int32': 'i', 'float32': 'f', 'float64': 'd'}
+
+
+def available_encodings():
+    return tuple(encoding for encoding in ENCODINGS if encoding != 'arrow' or pyarrow is not None)
+
+
+def negotiate(requested):
+    """Returns the first of the requested encodings that the server supports, json otherwise."""
+    if isinstance(requested, str):
+        requested = [requested]
+    available = available_encodings()
+    for encoding in requested or ():
+        if encoding in available:
+            return encoding
+    return DEFAULT_ENCODING
+
+
+def column_dtype(name, float_dtype=FLOAT_DTYPE):
+    if name in TEXT_COLUMNS:
+        return 'utf8'
+    if name in INTEGER_COLUMNS:
+        return 'int32'
+    return float_dtype
+
+
+def flatten(columnar):
+    """{vts: {field: [values]}} to {'vts': [...], field: [...]} with one value per agent."""
+    columns = {'vts': []}
+    for vts, fields in columnar.items():
+        length = 0
+        for key, values in fields.items():
+            columns.setdefault(key, []).extend(values)
+            length = len(values)
+        columns['vts'].extend([vts] * length)
+    return columns
+
+
+def _typed_buffer(values, dtype):
+    try:
+        data = array(_TYPECODES[dtype], values)
+    except TypeError:
+        # NULL values of the float columns
+        data = array(_TYPECODES[dtype], [float('nan') if value is None else value for value in values])
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+
+def _text_buffers(values):
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return _typed_buffer(offsets, 'int32'), b''.join(encoded)
+
+
+def encode_typed(columnar, float_dtype=FLOAT_DTYPE):
+    columns = flatten(columnar)
+    header = []
+    for name, values in columns.items():
+        column = {'name': name, 'dtype': column_dtype(name, float_dtype)}
+        if column['dtype'] == 'utf8':
+            column['offsets'], column['data'] = _text_buffers(values)
+        else:
+            column['data'] = _typed_buffer(values, column['dtype'])
+        header.append(column)
+    return {'encoding': 'typed', 'length': len(columns['vts']), 'columns': header}
+
+
+def encode_arrow(columnar, float_dtype=FLOAT_DTYPE):
+    if pyarrow is None:
+        raise ImportError('the arrow encoding needs pyarrow')
+    types = {'utf8': pyarrow.string(), 'int32': pyarrow.int32(),
+             'float32': pyarrow.float32(), 'float64': pyarrow.float64()}
+    columns = flatten(columnar)
+    batch = pyarrow.RecordBatch.from_arrays(
+        [pyarrow.array(values, type=types[column_dtype(name, float_dtype)]) for name, values in columns.items()],
+        names=list(columns))
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return {'encoding': 'arrow', 'length': batch.num_rows, 'data': sink.getvalue().to_pybytes()}
+
+
+def encode(columnar, encoding=DEFAULT_ENCODING, float_dtype=FLOAT_DTYPE):
+    """Encodes a columnar AgentQuery result, json returns it unchanged."""
+    if encoding == 'json':
+        return columnar
+    if encoding == 'typed':
+        return encode_typed(columnar, float_dtype)
+    if encoding == 'arrow':
+        return encode_arrow(columnar, float_dtype)
+    if encoding == 'delta':
+        if delta_codec.position_keys(columnar) is None:
+            return encode_typed(columnar, float_dtype)
+        return delta_codec.encode_delta(columnar)
+    raise ValueError('unknown payload encoding "%s", use one of %s' % (encoding, ENCODINGS))
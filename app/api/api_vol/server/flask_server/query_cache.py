@@ -0,0 +1,177 @@
+"""
+LRU cache of the encoded time window payloads of float_req / emis_req.
+
+Entries are the payloads as sent, already encoded, keyed on the exact window and
+encoding, so a hit is neither queried nor encoded again. A missing payload is cut
+from the query results of the one or two blocks of the buffer length aligned on
+its multiples (QUERY_CACHE_ALIGN=1), cached as well with no encoding, so viewers
+replaying a run at different positions inside a buffer share the queries and
+still get exactly the window they asked for. Entries are evicted least recently
+used first once their estimated size exceeds QUERY_CACHE_BYTES.
+
+The agent writers of the backend send a notification on the agents_ingest channel
+with the run id when they commit rows. IngestListener invalidates the entries of
+that run, and the entries of queries over every run.
+"""
+import os
+import math
+import time
+import select
+import threading
+from collections import OrderedDict
+
+
+QUERY_CACHE_BYTES = int(os.environ.get('QUERY_CACHE_BYTES', 256 * 1024 * 1024))
+QUERY_CACHE_ALIGN = os.environ.get('QUERY_CACHE_ALIGN', '1') != '0'
+INGEST_CHANNEL = 'agents_ingest'
+
+
+def align_window(time_value, buffer_length):
+    if buffer_length <= 0:
+        return time_value
+    return (int(time_value) // int(buffer_length)) * int(buffer_length)
+
+
+def window_blocks(time_value, buffer_length):
+    """Starts of the aligned blocks of buffer_length overlapping [time_value, time_value + buffer_length)."""
+    if int(buffer_length) <= 0:
+        return [time_value]
+    step = int(buffer_length)
+    return list(range(align_window(time_value, step), math.ceil(time_value + buffer_length), step))
+
+
+def slice_window(window, time_value, buffer_length):
+    """The vts of a {vts: value} result inside [time_value, time_value + buffer_length)."""
+    return {vts: value for vts, value in window.items() if time_value <= vts < time_value + buffer_length}
+
+
+def window_key(run_id, time_value, buffer_length, emission_ids, layout, encoding, viewport=None):
+    # encoding is None for the aligned blocks, not encoded
+    return (run_id, time_value, buffer_length, tuple(emission_ids), layout, encoding,
+            None if viewport is None else viewport.key())
+
+
+def estimate_size(payload):
+    """Approximate memory of a payload: bytes and strings by length, other values 8 bytes each."""
+    if isinstance(payload, (bytes, str)):
+        return len(payload)
+    if isinstance(payload, dict):
+        return sum(estimate_size(key) + estimate_size(value) for key, value in payload.items())
+    if isinstance(payload, (list, tuple)):
+        if payload and not isinstance(payload[0], (bytes, str, dict, list, tuple)):
+            return 8 * len(payload)
+        return sum(estimate_size(value) for value in payload)
+    return 8
+
+
+class QueryCache():
+
+    def __init__(self, max_bytes=QUERY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, payload, size=None):
+        size = estimate_size(payload) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (payload, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        # computed outside of the lock, concurrent misses of one key may both query
+        payload = self.get(key)
+        if payload is None:
+            payload = compute()
+            self.put(key, payload)
+        return payload
+
+    def invalidate_run(self, run_id):
+        """Drops the entries of the run and of the queries over every run."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] is None or key[0] == run_id]:
+                self.bytes -= self._entries.pop(key)[1]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_ratio': self.hits / lookups if lookups else 0.0,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+class IngestListener():
+    """Invalidates the cache on the notifications of the agent writers, from a daemon thread."""
+
+    def __init__(self, engine, cache, channel=INGEST_CHANNEL, timeout=5.0):
+        self.engine = engine
+        self.cache = cache
+        self.channel = channel
+        self.timeout = timeout
+        self._thread = threading.Thread(target=self._run, name='ingest-listener', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _listen(self):
+        conn = self.engine.raw_connection()
+        # never returned to the pool with autocommit and LISTEN on
+        conn.detach()
+        try:
+            dbapi_conn = conn.connection
+            dbapi_conn.autocommit = True
+            dbapi_conn.cursor().execute('LISTEN {}'.format(self.channel))
+            while True:
+                if select.select([dbapi_conn], [], [], self.timeout) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    notify = dbapi_conn.notifies.pop(0)
+                    try:
+                        self.cache.invalidate_run(int(notify.payload))
+                    except ValueError:
+                        self.cache.clear()
+        finally:
+            conn.close()
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as err:
+                # rows committed while disconnected are unknown, start over
+                print('ingest listener:', err)
+                self.cache.clear()
+                time.sleep(self.timeout)
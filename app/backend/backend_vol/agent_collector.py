@@ -0,0 +1,138 @@
+import traci
+import numpy as np
+import traci.constants as tc
+from sumo_backend import traci_exception
+
+
+# variables read for every vehicle, emissions in the order of the agents table
+EMISSION_VARIABLES = (tc.VAR_CO2EMISSION, tc.VAR_COEMISSION, tc.VAR_HCEMISSION,
+                      tc.VAR_NOXEMISSION, tc.VAR_PMXEMISSION, tc.VAR_NOISEEMISSION,
+                      tc.VAR_FUELCONSUMPTION)
+AGENT_VARIABLES = (tc.VAR_POSITION, tc.VAR_VEHICLECLASS) + EMISSION_VARIABLES
+
+
+def _getters(conn):
+    vehicle = conn.vehicle
+    return {
+        tc.VAR_POSITION: vehicle.getPosition,
+        tc.VAR_VEHICLECLASS: vehicle.getVehicleClass,
+        tc.VAR_CO2EMISSION: vehicle.getCO2Emission,
+        tc.VAR_COEMISSION: vehicle.getCOEmission,
+        tc.VAR_HCEMISSION: vehicle.getHCEmission,
+        tc.VAR_NOXEMISSION: vehicle.getNOxEmission,
+        tc.VAR_PMXEMISSION: vehicle.getPMxEmission,
+        tc.VAR_NOISEEMISSION: vehicle.getNoiseEmission,
+        tc.VAR_FUELCONSUMPTION: vehicle.getFuelConsumption,
+    }
+
+
+class PerCallCollector():
+    """
+    Reads every agent variable with its own TraCI getter call.
+    With a GeoConverter the positions of a step are converted to lon/lat in
+    one call, otherwise each one goes through simulation.convertGeo.
+    """
+
+    def __init__(self, conn=traci, converter=None):
+        self.conn = conn
+        self.converter = converter
+        self._getters = _getters(conn)
+
+    def _values(self, vehicleID, variables):
+        return {var: self._getters[var](vehicleID) for var in variables}
+
+    def vehicle_values(self):
+        """Returns {vehicleID: {variable: value}} for the vehicles in the simulation."""
+        return {vehicleID: self._values(vehicleID, AGENT_VARIABLES)
+                for vehicleID in self.conn.vehicle.getIDList()}
+
+    def _lon_lat(self, positions):
+        if self.converter is None:
+            return [self.conn.simulation.convertGeo(x, y) for x, y in positions]
+        if not positions:
+            return []
+        xs, ys = np.array(positions, dtype=float).T
+        lons, lats = self.converter.to_lon_lat(xs, ys)
+        return zip(lons.tolist(), lats.tolist())
+
+    def collect(self, step):
+        """Returns the rows of the agents table for the current simulation step."""
+        values = self.vehicle_values()
+        lon_lat = self._lon_lat([v[tc.VAR_POSITION] for v in values.values()])
+        rows = []
+        for (vehicleID, v), (vlon, vlat) in zip(values.items(), lon_lat):
+            rows.append((vehicleID, step, v[tc.VAR_VEHICLECLASS], vlon, vlat) +
+                        tuple(round(v[var], 3) for var in EMISSION_VARIABLES))
+        return rows
+
+
+class SubscriptionCollector(PerCallCollector):
+    """
+    Subscribes each vehicle to the agent variables once, when it enters the simulation,
+    and reads all of them with a single getAllSubscriptionResults() call per step.
+    Variables the server refuses to subscribe, or that have no subscription result
+    yet for a vehicle, are read with the per call getters.
+    """
+
+    def __init__(self, conn=traci, converter=None):
+        super().__init__(conn, converter)
+        self.subscribed = None
+        self.fallback = ()
+        self._refused = traci_exception(conn)
+        self._known = set()
+
+    def _resolve_variables(self, vehicleID):
+        # Each subscribe call replaces the previous one for the same vehicle,
+        # so variables are probed one at a time before the final subscription
+        subscribed = []
+        for var in AGENT_VARIABLES:
+            try:
+                self.conn.vehicle.subscribe(vehicleID, (var,))
+                subscribed.append(var)
+            except self._refused:
+                pass
+        self.subscribed = tuple(subscribed)
+        self.fallback = tuple(var for var in AGENT_VARIABLES if var not in subscribed)
+        if self.fallback:
+            print("TraCI could not subscribe variables %s, reading them per call" %
+                  ", ".join(hex(var) for var in self.fallback))
+
+    def _subscribe(self, vehicleID):
+        if self.subscribed is None:
+            try:
+                self.conn.vehicle.subscribe(vehicleID, AGENT_VARIABLES)
+                self.subscribed = AGENT_VARIABLES
+                return
+            except self._refused:
+                self._resolve_variables(vehicleID)
+        if self.subscribed:
+            self.conn.vehicle.subscribe(vehicleID, self.subscribed)
+
+    def vehicle_values(self):
+        vehicleIDs = self.conn.vehicle.getIDList()
+        for vehicleID in vehicleIDs:
+            if vehicleID not in self._known:
+                self._subscribe(vehicleID)
+        self._known = set(vehicleIDs)
+
+        results = self.conn.vehicle.getAllSubscriptionResults()
+        values = {}
+        for vehicleID in vehicleIDs:
+            vehicle_values = dict(results.get(vehicleID, ()))
+            # refused variables, and every variable of a vehicle with no subscription result yet
+            missing = tuple(var for var in AGENT_VARIABLES if var not in vehicle_values)
+            if missing:
+                vehicle_values.update(self._values(vehicleID, missing))
+            values[vehicleID] = vehicle_values
+        return values
+
+
+COLLECTORS = ('subscription', 'percall')
+
+
+def make_agent_collector(kind, conn=traci, converter=None):
+    if kind == 'subscription':
+        return SubscriptionCollector(conn, converter)
+    if kind == 'percall':
+        return PerCallCollector(conn, converter)
+    raise ValueError('unknown agent collector "%s", use one of %s' % (kind, COLLECTORS))
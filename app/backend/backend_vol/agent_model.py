@@ -0,0 +1,66 @@
+import os
+from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import create_engine
+from sqlalchemy.orm import declarative_base
+from geoalchemy2 import Geometry
+
+
+################## DB ##################
+
+def get_db_string():
+    db_name = 'postgres'
+    db_user = os.environ['POSTGRES_USER']
+    db_pass = os.environ['POSTGRES_PASSWORD']
+    db_host = os.environ['POSTGRES_HOST']
+    db_port = os.environ['POSTGRES_PORT']
+    return 'postgresql://{}:{}@{}:{}/{}'.format(
+        db_user, db_pass, db_host, db_port, db_name)
+
+
+def get_db_engine():
+    return create_engine(get_db_string())
+
+
+Base = declarative_base()
+
+# srid of the geom column, a point built from vlon and vlat
+SRID = 4326
+
+# order of the columns collected per vehicle, run_id and geom are set by the agent writers
+AGENT_COLUMNS = ('vname', 'vts', 'vtype', 'vlon', 'vlat',
+                 'vemis_co2', 'vemis_co', 'vemis_hc', 'vemis_nox',
+                 'vemis_pm25', 'vemis_noise', 'vfuel')
+
+
+class AgentMixin():
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer)
+    vname = Column(String)
+    vts = Column(Integer)
+    vtype = Column(String)
+    vlon = Column(Float)
+    vlat = Column(Float)
+    vemis_co2 = Column(Float)
+    vemis_co = Column(Float)
+    vemis_hc = Column(Float)
+    vemis_nox = Column(Float)
+    vemis_pm25 = Column(Float)
+    vemis_noise = Column(Float)
+    vfuel = Column(Float)
+    # indexed with GiST by agent_schema.py
+    geom = Column(Geometry('POINT', srid=SRID, spatial_index=False))
+
+    def __repr__(self):
+        return "<User(id='%s', vname='%s', vts='%s', vtype='%s', vlon='%s', vlat='%s')>" % (
+            self.id, self.vname, self.vts, self.vtype, self.vlon, self.vlat)
+
+
+class Agent(AgentMixin, Base):
+    __tablename__ = 'agents'
+
+
+def point_ewkt(lon, lat):
+    """geom value of a position, None if the position is unknown."""
+    if lon is None or lat is None:
+        return None
+    return 'SRID={};POINT({!r} {!r})'.format(SRID, float(lon), float(lat))
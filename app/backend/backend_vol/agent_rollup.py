@@ -0,0 +1,158 @@
+"""
+Pre-aggregated emissions of the agents, per grid cell and time bucket.
+
+agents_rollup_1min, agents_rollup_15min and agents_rollup_1h hold, per run,
+bucket (first vts of the bucket) and grid cell of ROLLUP_CELL_DEGREES, the
+number of agent samples and the sums of the emission columns. Each table has
+the cell center as a geom point with a GiST index, so martin publishes them as
+tile layers.
+
+AgentRollups is updated by the agent writer after each flush: the 1 min buckets
+whose rows are all committed are aggregated from the agents table, then added
+to the 15 min and 1 h buckets they belong to. finish rolls the last, partial,
+bucket once the run is over.
+
+    python agent_rollup.py rebuild 3
+"""
+import os
+import argparse
+from sqlalchemy import text
+
+
+# seconds of the buckets, by table suffix, finest first
+RESOLUTIONS = {'1min': 60, '15min': 900, '1h': 3600}
+CELL_DEGREES = float(os.environ.get('ROLLUP_CELL_DEGREES', 0.005))
+ROLLUP_COLUMNS = ('vemis_co2', 'vemis_co', 'vemis_hc', 'vemis_nox', 'vemis_pm25', 'vfuel')
+
+ROLLUP_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    run_id integer NOT NULL,
+    bucket integer NOT NULL,
+    cell_x integer NOT NULL,
+    cell_y integer NOT NULL,
+    samples integer NOT NULL,
+    {sums},
+    geom geometry(Point, 4326),
+    PRIMARY KEY (run_id, bucket, cell_x, cell_y)
+)
+"""
+
+ROLLUP_INDEX = "CREATE INDEX IF NOT EXISTS {table}_geom_gist ON {table} USING gist (geom)"
+
+# sums of the select are added to the rows of the buckets already rolled
+UPSERT = """
+INSERT INTO {table} AS r (run_id, bucket, cell_x, cell_y, samples, {columns}, geom)
+SELECT run_id, bucket, cell_x, cell_y, samples, {columns},
+       ST_SetSRID(ST_MakePoint((cell_x + 0.5) * :cell, (cell_y + 0.5) * :cell), 4326)
+FROM ({select}) s
+ON CONFLICT (run_id, bucket, cell_x, cell_y) DO UPDATE SET
+    samples = r.samples + EXCLUDED.samples, {updates}
+"""
+
+FROM_AGENTS = """
+SELECT run_id, vts / {seconds} * {seconds} AS bucket,
+       floor(vlon / :cell)::integer AS cell_x, floor(vlat / :cell)::integer AS cell_y,
+       count(*) AS samples, {sums}
+FROM {source}
+WHERE run_id = :run_id AND vts >= :start AND vts < :end AND vlon IS NOT NULL AND vlat IS NOT NULL
+GROUP BY 1, 2, 3, 4
+"""
+
+FROM_ROLLUP = """
+SELECT run_id, bucket / {seconds} * {seconds} AS bucket, cell_x, cell_y,
+       sum(samples) AS samples, {sums}
+FROM {source}
+WHERE run_id = :run_id AND bucket >= :start AND bucket < :end
+GROUP BY 1, 2, 3, 4
+"""
+
+
+def rollup_table(resolution, table='agents'):
+    return '{}_rollup_{}'.format(table, resolution)
+
+
+def create_rollup_tables(conn, table='agents'):
+    sums = ',\n    '.join('{} double precision'.format(col) for col in ROLLUP_COLUMNS)
+    for resolution in RESOLUTIONS:
+        conn.execute(text(ROLLUP_DDL.format(table=rollup_table(resolution, table), sums=sums)))
+        conn.execute(text(ROLLUP_INDEX.format(table=rollup_table(resolution, table))))
+
+
+def delete_rollups(conn, run_id, table='agents'):
+    for resolution in RESOLUTIONS:
+        rollup = rollup_table(resolution, table)
+        if conn.execute(text("SELECT to_regclass(:table)"), {'table': rollup}).scalar() is not None:
+            conn.execute(text("DELETE FROM {} WHERE run_id = :run_id".format(rollup)), {'run_id': run_id})
+
+
+def _upsert_sql(target, select, seconds, source):
+    columns = ', '.join(ROLLUP_COLUMNS)
+    sums = ', '.join('sum({0}) AS {0}'.format(col) for col in ROLLUP_COLUMNS)
+    updates = ', '.join('{0} = coalesce(r.{0}, 0) + coalesce(EXCLUDED.{0}, 0)'.format(col) for col in ROLLUP_COLUMNS)
+    return text(UPSERT.format(table=target, columns=columns, updates=updates,
+                              select=select.format(seconds=seconds, source=source, sums=sums)))
+
+
+class AgentRollups():
+    """Rolls the committed agents of one run up into the rollup tables."""
+
+    def __init__(self, engine, run_id, table='agents', cell_degrees=CELL_DEGREES):
+        self.engine = engine
+        self.run_id = run_id
+        self.table = table
+        self.cell_degrees = cell_degrees
+        self.rolled_until = 0
+        resolutions = list(RESOLUTIONS.items())
+        finest, seconds = resolutions[0]
+        self.bucket_seconds = seconds
+        self._statements = [_upsert_sql(rollup_table(finest, table), FROM_AGENTS, seconds, table)]
+        for resolution, seconds in resolutions[1:]:
+            self._statements.append(_upsert_sql(rollup_table(resolution, table), FROM_ROLLUP, seconds,
+                                                rollup_table(finest, table)))
+        with engine.begin() as conn:
+            create_rollup_tables(conn, table)
+
+    def on_flush(self, committed_vts):
+        """
+        Rolls the buckets ending at or before committed_vts, the greatest vts written.
+        Rows of that vts may still be buffered, the rows of the previous ones are all committed.
+        """
+        end = int(committed_vts) // self.bucket_seconds * self.bucket_seconds
+        self.roll(end)
+
+    def roll(self, end):
+        """Rolls the agents from the end of the previous roll up to vts end, excluded."""
+        if end <= self.rolled_until:
+            return
+        params = {'run_id': self.run_id, 'start': self.rolled_until, 'end': end, 'cell': self.cell_degrees}
+        with self.engine.begin() as conn:
+            for statement in self._statements:
+                conn.execute(statement, params)
+        self.rolled_until = end
+
+    def finish(self, last_vts):
+        """Rolls the remaining rows, up to last_vts included, once the run is over."""
+        end = int(last_vts) + 1
+        self.roll(-(-end // self.bucket_seconds) * self.bucket_seconds)
+
+    def rebuild(self):
+        """Rolls every row of the run again, after deleting its rollups."""
+        with self.engine.begin() as conn:
+            delete_rollups(conn, self.run_id, self.table)
+            last_vts = conn.execute(text("SELECT max(vts) FROM {} WHERE run_id = :run_id".format(self.table)),
+                                    {'run_id': self.run_id}).scalar()
+        self.rolled_until = 0
+        if last_vts is not None:
+            self.finish(last_vts)
+
+
+if __name__ == '__main__':
+    from agent_model import get_db_engine
+
+    argParser = argparse.ArgumentParser(description="Manage the emission rollups of the agents table")
+    argParser.add_argument("command", choices=('rebuild',))
+    argParser.add_argument("run_id", type=int, help="run whose rollups are rebuilt")
+    argParser.add_argument("-t", "--table", default='agents')
+    options = argParser.parse_args()
+
+    AgentRollups(get_db_engine(), options.run_id, options.table).rebuild()
@@ -0,0 +1,280 @@
+"""
+Schema management of the agents table and of the simulation runs.
+
+Every run of store_traffic_flow.py is a row of the runs table. agents is a native
+postgres table partitioned by run_id, each run partition being partitioned by
+ranges of simulation time (vts). The parent carries a BRIN index on vts, a
+btree on (vname, vts) and a GiST index on the geom point of the agents, that
+postgres adds to every partition.
+
+    python agent_schema.py create
+    python agent_schema.py runs
+    python agent_schema.py list 3
+    python agent_schema.py detach 3
+    python agent_schema.py attach 3
+    python agent_schema.py delete 3
+    python agent_schema.py migrate
+"""
+import os
+import argparse
+from sqlalchemy import text
+from agent_rollup import delete_rollups
+
+
+PARTITION_STEPS = int(os.environ.get('AGENT_PARTITION_STEPS', 3600))
+
+# also created by the SQLConnection of legacy_code/sumoplustools, both save their runs here
+RUNS_DDL = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id serial PRIMARY KEY,
+    config_file text,
+    seed integer,
+    started_at timestamp with time zone DEFAULT now(),
+    finished_at timestamp with time zone
+)
+"""
+
+AGENTS_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id serial,
+    run_id integer NOT NULL,
+    vname varchar,
+    vts integer NOT NULL,
+    vtype varchar,
+    vlon double precision,
+    vlat double precision,
+    vemis_co2 double precision,
+    vemis_co double precision,
+    vemis_hc double precision,
+    vemis_nox double precision,
+    vemis_pm25 double precision,
+    vemis_noise double precision,
+    vfuel double precision,
+    geom geometry(Point, 4326),
+    PRIMARY KEY (id, run_id, vts)
+) PARTITION BY LIST (run_id)
+"""
+
+# created on the parent, postgres adds them to every partition
+AGENTS_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS {table}_vts_brin ON {table} USING brin (vts) WITH (pages_per_range = 32)",
+    "CREATE INDEX IF NOT EXISTS {table}_vname_vts_idx ON {table} (vname, vts)",
+    "CREATE INDEX IF NOT EXISTS {table}_geom_gist ON {table} USING gist (geom)",
+)
+
+
+def table_kind(conn, table):
+    """Returns 'p' for a partitioned table, 'r' for a plain table and None if missing."""
+    return conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+                        {'table': table}).scalar()
+
+
+def has_column(conn, table, column):
+    return conn.execute(text("""
+        SELECT count(*) FROM information_schema.columns
+        WHERE table_name = :table AND column_name = :column"""),
+        {'table': table, 'column': column}).scalar() > 0
+
+
+def run_partition_name(table, run_id):
+    return '{}_r{}'.format(table, int(run_id))
+
+
+def create_run_partition(conn, table, run_id):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({}) PARTITION BY RANGE (vts)".format(
+        run_partition_name(table, run_id), table, int(run_id))))
+
+
+class AgentPartitions():
+    """Creates, lists, attaches and detaches the vts range partitions of one run."""
+
+    def __init__(self, engine, run_id, table='agents', partition_steps=PARTITION_STEPS):
+        self.engine = engine
+        self.run_id = run_id
+        self.table = table
+        self.parent = run_partition_name(table, run_id)
+        self.partition_steps = partition_steps
+        self._known = set()
+
+    def bounds(self, vts):
+        start = (int(vts) // self.partition_steps) * self.partition_steps
+        return start, start + self.partition_steps
+
+    def partition_name(self, start):
+        return '{}_p{}'.format(self.parent, start)
+
+    def ensure(self, vts):
+        """Creates the partition holding vts if it does not exist yet. Cheap once created."""
+        start, end = self.bounds(vts)
+        if start in self._known:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})".format(
+                self.partition_name(start), self.parent, start, end)))
+        self._known.add(start)
+
+    def list(self):
+        """Returns [(partition name, bound expression)] ordered by name."""
+        with self.engine.connect() as conn:
+            return list_partitions(conn, self.parent)
+
+    def detach(self, name):
+        with self.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE {} DETACH PARTITION {}".format(self.parent, name)))
+        self._known.clear()
+
+    def attach(self, name, start, end):
+        with self.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})".format(
+                self.parent, name, int(start), int(end))))
+
+
+def list_partitions(conn, parent):
+    return conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:parent)
+        ORDER BY c.relname"""), {'parent': parent}).fetchall()
+
+
+def create_agents_table(conn, table='agents'):
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+    conn.execute(text(AGENTS_DDL.format(table=table)))
+    for ddl in AGENTS_INDEXES:
+        conn.execute(text(ddl.format(table=table)))
+
+
+def ensure_agents_table(engine, table='agents'):
+    """
+    Creates the runs table, the partitioned agents table and its indexes if missing.
+    Raises a RuntimeError if an agents table without runs or without geom is found,
+    see migrate_agents_table.
+    """
+    with engine.begin() as conn:
+        if table_kind(conn, table) is not None:
+            for column in ('run_id', 'geom'):
+                if not has_column(conn, table, column):
+                    raise RuntimeError('table "%s" has no %s, run "python agent_schema.py migrate" first' % (table, column))
+        conn.execute(text(RUNS_DDL))
+        create_agents_table(conn, table)
+
+
+def create_run(engine, config_file, seed=None, table='agents', partition_steps=PARTITION_STEPS):
+    """Registers a new run and creates its partition. Returns the partitions of the run."""
+    ensure_agents_table(engine, table)
+    with engine.begin() as conn:
+        run_id = conn.execute(text("INSERT INTO runs (config_file, seed) VALUES (:config_file, :seed) RETURNING run_id"),
+                              {'config_file': config_file, 'seed': seed}).scalar()
+        create_run_partition(conn, table, run_id)
+    return AgentPartitions(engine, run_id, table, partition_steps)
+
+
+def finish_run(engine, run_id):
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE runs SET finished_at = now() WHERE run_id = :run_id"), {'run_id': run_id})
+
+
+def list_runs(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT run_id, config_file, seed, started_at, finished_at FROM runs ORDER BY run_id")).fetchall()
+
+
+def delete_run(engine, run_id, table='agents'):
+    """Drops the partition of the run, with all of its rows, its rollups and its metadata."""
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS {}".format(run_partition_name(table, run_id))))
+        delete_rollups(conn, run_id, table)
+        conn.execute(text("DELETE FROM runs WHERE run_id = :run_id"), {'run_id': run_id})
+
+
+def detach_run(engine, run_id, table='agents'):
+    """Detaches the run partition, its rows stay in the standalone table agents_r<run_id>."""
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE {} DETACH PARTITION {}".format(table, run_partition_name(table, run_id))))
+
+
+def attach_run(engine, run_id, table='agents'):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES IN ({})".format(
+            table, run_partition_name(table, run_id), int(run_id))))
+
+
+def migrate_agents_table(engine, table='agents'):
+    """
+    Moves an agents table without run_id, partitioned or not, into run 0 of a new
+    agents table partitioned by run, then fills geom if the table has none.
+    """
+    migrate_runs(engine, table)
+    migrate_geometry(engine, table)
+
+
+def migrate_geometry(engine, table='agents'):
+    """Adds geom to an agents table without it, built from vlon and vlat, and its GiST index."""
+    with engine.begin() as conn:
+        if table_kind(conn, table) is None or has_column(conn, table, 'geom'):
+            return
+        add_geometry_column(conn, table)
+        conn.execute(text(AGENTS_INDEXES[-1].format(table=table)))
+
+
+def add_geometry_column(conn, table):
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+    conn.execute(text("ALTER TABLE {} ADD COLUMN geom geometry(Point, 4326)".format(table)))
+    conn.execute(text("UPDATE {} SET geom = ST_SetSRID(ST_MakePoint(vlon, vlat), 4326) WHERE vlon IS NOT NULL AND vlat IS NOT NULL".format(table)))
+
+
+def migrate_runs(engine, table='agents'):
+    legacy = run_partition_name(table, 0)
+    with engine.begin() as conn:
+        kind = table_kind(conn, table)
+        if kind is None or has_column(conn, table, 'run_id'):
+            return
+        conn.execute(text(RUNS_DDL))
+        conn.execute(text("ALTER TABLE {} RENAME TO {}".format(table, legacy)))
+        # free the index names used by the new parent
+        for suffix in ('pkey', 'vts_brin', 'vname_vts_idx', 'geom_gist'):
+            conn.execute(text("ALTER INDEX IF EXISTS {0}_{2} RENAME TO {1}_{2}".format(table, legacy, suffix)))
+        conn.execute(text("ALTER TABLE {} ADD COLUMN run_id integer NOT NULL DEFAULT 0".format(legacy)))
+        if kind == 'r':
+            conn.execute(text("ALTER TABLE {} ALTER COLUMN vts SET NOT NULL".format(legacy)))
+        # a partition has the columns of its parent
+        if not has_column(conn, legacy, 'geom'):
+            add_geometry_column(conn, legacy)
+        create_agents_table(conn, table)
+        conn.execute(text("INSERT INTO runs (run_id, config_file) VALUES (0, 'migrated') ON CONFLICT DO NOTHING"))
+        conn.execute(text("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES IN (0)".format(table, legacy)))
+        # new ids continue after the migrated ones
+        conn.execute(text("SELECT setval(pg_get_serial_sequence('{}', 'id'), (SELECT coalesce(max(id), 0) + 1 FROM {}), false)".format(
+            table, legacy)))
+
+
+if __name__ == '__main__':
+    from agent_model import get_db_engine
+
+    argParser = argparse.ArgumentParser(description="Manage the runs and partitions of the agents table")
+    argParser.add_argument("command", choices=('create', 'runs', 'list', 'attach', 'detach', 'delete', 'migrate'))
+    argParser.add_argument("run_id", nargs='?', type=int, help="run of the list, attach, detach and delete commands")
+    argParser.add_argument("-t", "--table", default='agents')
+    options = argParser.parse_args()
+
+    if options.command in ('list', 'attach', 'detach', 'delete') and options.run_id is None:
+        argParser.error("%s needs a run id" % options.command)
+
+    engine = get_db_engine()
+    if options.command == 'migrate':
+        migrate_agents_table(engine, options.table)
+    ensure_agents_table(engine, options.table)
+
+    if options.command == 'attach':
+        attach_run(engine, options.run_id, options.table)
+    elif options.command == 'detach':
+        detach_run(engine, options.run_id, options.table)
+    elif options.command == 'delete':
+        delete_run(engine, options.run_id, options.table)
+    elif options.command == 'list':
+        for name, bound in AgentPartitions(engine, options.run_id, options.table).list():
+            print(name, bound)
+
+    if options.command != 'list':
+        for run in list_runs(engine):
+            print(*run)
@@ -0,0 +1,297 @@
+import io
+import csv
+import time
+import queue
+import struct
+import threading
+from abc import ABC, abstractmethod
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from agent_model import Agent, AGENT_COLUMNS, SRID, point_ewkt
+
+
+DEFAULT_FLUSH_ROWS = 100000
+DEFAULT_FLUSH_SECONDS = 5.0
+# notified with the run id on every commit, the API invalidates its cached windows of the run
+INGEST_CHANNEL = 'agents_ingest'
+
+# postgres binary COPY framing
+_PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_PGCOPY_TRAILER = struct.pack('>h', -1)
+_PGCOPY_NULL = struct.pack('>i', -1)
+
+_TEXT_COLUMNS = ('vname', 'vtype')
+_INT_COLUMNS = ('vts',)
+_LON, _LAT = AGENT_COLUMNS.index('vlon'), AGENT_COLUMNS.index('vlat')
+_VTS = AGENT_COLUMNS.index('vts')
+# little-endian EWKB point with a srid
+_EWKB_POINT = struct.Struct('<BIIdd')
+_EWKB_POINT_TYPE = 0x20000001
+
+
+def _encode_text(value):
+    data = str(value).encode('utf-8')
+    return struct.pack('>i', len(data)) + data
+
+
+def _encode_int4(value):
+    return struct.pack('>ii', 4, int(value))
+
+
+def _encode_float8(value):
+    return struct.pack('>id', 8, float(value))
+
+
+def _encode_point(lon, lat):
+    if lon is None or lat is None:
+        return _PGCOPY_NULL
+    return struct.pack('>i', _EWKB_POINT.size) + _EWKB_POINT.pack(1, _EWKB_POINT_TYPE, SRID, lon, lat)
+
+
+def _column_encoder(column):
+    if column in _TEXT_COLUMNS:
+        return _encode_text
+    if column in _INT_COLUMNS:
+        return _encode_int4
+    return _encode_float8
+
+
+class AgentWriter(ABC):
+    """
+    Buffers rows of the agents table and writes them when either the row
+    threshold or the time threshold is reached.
+    Rows are tuples ordered as AGENT_COLUMNS, run_id is added to every row when given
+    and geom is built from vlon and vlat.
+    After each write, the flush listeners are called with the greatest vts written
+    so far, see agent_rollup.
+    """
+
+    def __init__(self, run_id=None, max_rows=DEFAULT_FLUSH_ROWS, max_seconds=DEFAULT_FLUSH_SECONDS):
+        self.run_id = run_id
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.rows_written = 0
+        self.flush_listeners = []
+        self.last_vts = None
+        self._pending = 0
+        self._pending_vts = None
+        self._last_flush = time.monotonic()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def add(self, row):
+        self._append(row)
+        self._pending += 1
+        if self._pending_vts is None or row[_VTS] > self._pending_vts:
+            self._pending_vts = row[_VTS]
+        if self.max_rows and self._pending >= self.max_rows:
+            self.flush()
+
+    def add_rows(self, rows):
+        """Adds the rows of one step."""
+        for row in rows:
+            self.add(row)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        # checked once per step rather than once per row
+        if self._pending == 0 or self.max_seconds is None:
+            return
+        if time.monotonic() - self._last_flush >= self.max_seconds:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._write()
+            self.rows_written += self._pending
+            self._pending = 0
+            if self.last_vts is None or self._pending_vts > self.last_vts:
+                self.last_vts = self._pending_vts
+            self._pending_vts = None
+            for listener in self.flush_listeners:
+                listener(self.last_vts)
+        self._last_flush = time.monotonic()
+
+    def close(self, flush=True):
+        """Writes the pending rows, unless flush is False, e.g. after a failed write."""
+        if flush:
+            self.flush()
+
+    @abstractmethod
+    def _append(self, row):
+        """Buffers one row until the next write."""
+
+    @abstractmethod
+    def _write(self):
+        """Writes the buffered rows and commits them."""
+
+
+class OrmAgentWriter(AgentWriter):
+    """Adds one ORM object per row and commits the session on flush."""
+
+    def __init__(self, session, model=Agent, **kwargs):
+        super().__init__(**kwargs)
+        self.session = session
+        self.model = model
+
+    def _append(self, row):
+        self.session.add(self.model(run_id=self.run_id, geom=point_ewkt(row[_LON], row[_LAT]),
+                                    **dict(zip(AGENT_COLUMNS, row))))
+
+    def _write(self):
+        if self.run_id is not None:
+            # delivered on commit
+            self.session.execute(text("SELECT pg_notify(:channel, :run_id)"),
+                                 {'channel': INGEST_CHANNEL, 'run_id': str(self.run_id)})
+        self.session.commit()
+
+    def close(self, flush=True):
+        try:
+            super().close(flush)
+        finally:
+            self.session.close()
+
+
+class CopyAgentWriter(AgentWriter):
+    """
+    Buffers rows column by column and flushes them with COPY FROM STDIN,
+    either in CSV or in postgres binary format.
+    """
+    FORMATS = ('csv', 'binary')
+
+    def __init__(self, engine, table=Agent.__tablename__, copy_format='csv', **kwargs):
+        if copy_format not in self.FORMATS:
+            raise ValueError('copy format must be one of %s' % (self.FORMATS,))
+        super().__init__(**kwargs)
+        self.table = table
+        self.copy_format = copy_format
+        columns = AGENT_COLUMNS + (() if self.run_id is None else ('run_id',)) + ('geom',)
+        self._encoders = [_column_encoder(col) for col in AGENT_COLUMNS]
+        self._field_count = struct.pack('>h', len(columns))
+        self._run_field = b'' if self.run_id is None else _encode_int4(self.run_id)
+        self._copy_sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT {})'.format(
+            table, ', '.join(columns), copy_format)
+        self._conn = engine.raw_connection()
+        self._reset_columns()
+
+    def _reset_columns(self):
+        self._columns = tuple([] for _ in AGENT_COLUMNS)
+
+    def _append(self, row):
+        for column, value in zip(self._columns, row):
+            column.append(value)
+
+    def _csv_buffer(self):
+        buf = io.StringIO()
+        run = () if self.run_id is None else (self.run_id,)
+        rows = (row + run + (point_ewkt(row[_LON], row[_LAT]),) for row in zip(*self._columns))
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+        return buf
+
+    def _binary_buffer(self):
+        parts = [_PGCOPY_HEADER]
+        encoders = self._encoders
+        field_count, run_field = self._field_count, self._run_field
+        for row in zip(*self._columns):
+            parts.append(field_count)
+            for encode, value in zip(encoders, row):
+                parts.append(_PGCOPY_NULL if value is None else encode(value))
+            parts.append(run_field)
+            parts.append(_encode_point(row[_LON], row[_LAT]))
+        parts.append(_PGCOPY_TRAILER)
+        return io.BytesIO(b''.join(parts))
+
+    def _write(self):
+        buf = self._binary_buffer() if self.copy_format == 'binary' else self._csv_buffer()
+        cursor = self._conn.cursor()
+        try:
+            cursor.copy_expert(self._copy_sql, buf)
+            if self.run_id is not None:
+                cursor.execute("SELECT pg_notify(%s, %s)", (INGEST_CHANNEL, str(self.run_id)))
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        self._conn.commit()
+        self._reset_columns()
+
+    def close(self, flush=True):
+        try:
+            super().close(flush)
+        finally:
+            self._conn.close()
+
+
+class BackgroundAgentWriter():
+    """
+    Runs an agent writer in a background thread so the simulation loop does not
+    wait on the database. add_rows only blocks when max_steps steps are waiting,
+    which bounds the memory used when the database falls behind.
+    An error of the writer is raised by the next add_rows or by close.
+    """
+
+    def __init__(self, writer, max_steps=64):
+        self.writer = writer
+        self._steps = queue.Queue(maxsize=max_steps)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='agent-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def rows_written(self):
+        return self.writer.rows_written
+
+    @property
+    def last_vts(self):
+        return self.writer.last_vts
+
+    def add_rows(self, rows):
+        self._raise_error()
+        self._steps.put(rows)
+
+    def _run(self):
+        while True:
+            rows = self._steps.get()
+            if rows is None:
+                break
+            if self._error is not None:
+                # drain the queue, the error is reported to the simulation thread
+                continue
+            try:
+                self.writer.add_rows(rows)
+            except Exception as err:
+                self._error = err
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError('agent writer failed') from self._error
+
+    def close(self):
+        self._steps.put(None)
+        self._thread.join()
+        if self._error is not None:
+            # the failed rows are still pending, writing them again would fail the same way
+            self.writer.close(flush=False)
+            self._raise_error()
+        self.writer.close()
+
+
+WRITERS = ('orm', 'copy', 'copy-binary')
+
+
+def make_agent_writer(kind, engine, **kwargs):
+    """
+    Returns the agent writer named by kind: 'orm', 'copy' (CSV) or 'copy-binary'.
+    Remaining keyword arguments are passed to the writer.
+    """
+    if kind == 'orm':
+        return OrmAgentWriter(sessionmaker(bind=engine)(), **kwargs)
+    if kind == 'copy':
+        return CopyAgentWriter(engine, copy_format='csv', **kwargs)
+    if kind == 'copy-binary':
+        return CopyAgentWriter(engine, copy_format='binary', **kwargs)
+    raise ValueError('unknown agent writer "%s", use one of %s' % (kind, WRITERS))
@@ -0,0 +1,123 @@
+"""
+Compares the latency of the time window query of AgentQuery on an unpartitioned
+agents table and on the partitioned, BRIN indexed one.
+
+    python bench_agent_query.py --rows 100000000 --vehicles 20000
+"""
+import argparse
+import random
+import time
+from sqlalchemy import text
+from agent_model import get_db_engine
+from agent_schema import AgentPartitions, create_agents_table, create_run_partition
+
+
+PLAIN_TABLE = 'agents_bench_plain'
+PARTITIONED_TABLE = 'agents_bench_part'
+
+PLAIN_DDL = """
+CREATE TABLE {table} (
+    id serial PRIMARY KEY,
+    vname varchar, vts integer, vtype varchar,
+    vlon double precision, vlat double precision,
+    vemis_co2 double precision, vemis_co double precision, vemis_hc double precision,
+    vemis_nox double precision, vemis_pm25 double precision, vemis_noise double precision,
+    vfuel double precision
+)
+"""
+
+# the partitioned table holds a single run
+BENCH_RUN = 0
+
+FILL_SQL = """
+INSERT INTO {table} ({run_column}vname, vts, vtype, vlon, vlat, vemis_co2, vemis_co, vemis_hc,
+                     vemis_nox, vemis_pm25, vemis_noise, vfuel)
+SELECT {run_value}'veh' || (g % :vehicles), g / :vehicles, 'passenger',
+       -73.9 + random() * 0.4, 45.4 + random() * 0.3,
+       random() * 5000, random() * 100, random(), random() * 2, random() * 0.1, 50 + random() * 30, random() * 2
+FROM generate_series(:start, :stop - 1) g
+"""
+
+WINDOW_SQL = "SELECT vts, vlon, vlat, vname FROM {table} WHERE vts >= :start AND vts < :stop{run_filter}"
+
+
+def run_sql(sql, table, **kwargs):
+    if table == PARTITIONED_TABLE:
+        return sql.format(table=table, run_column='run_id, ', run_value='%i, ' % BENCH_RUN,
+                          run_filter=' AND run_id = %i' % BENCH_RUN, **kwargs)
+    return sql.format(table=table, run_column='', run_value='', run_filter='', **kwargs)
+
+
+def fill(engine, table, rows, vehicles, chunk):
+    for start in range(0, rows, chunk):
+        stop = min(start + chunk, rows)
+        with engine.begin() as conn:
+            conn.execute(text(run_sql(FILL_SQL, table)),
+                         {'vehicles': vehicles, 'start': start, 'stop': stop})
+        print("  %s: %i / %i rows" % (table, stop, rows))
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE {}".format(table)))
+
+
+def create_tables(engine, rows, vehicles, partition_steps):
+    drop_tables(engine)
+    with engine.begin() as conn:
+        conn.execute(text(PLAIN_DDL.format(table=PLAIN_TABLE)))
+        create_agents_table(conn, PARTITIONED_TABLE)
+        create_run_partition(conn, PARTITIONED_TABLE, BENCH_RUN)
+    partitions = AgentPartitions(engine, BENCH_RUN, PARTITIONED_TABLE, partition_steps)
+    for vts in range(0, rows // vehicles + 1, partition_steps):
+        partitions.ensure(vts)
+
+
+def drop_tables(engine):
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS {}, {}".format(PLAIN_TABLE, PARTITIONED_TABLE)))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def measure(engine, table, windows, buffer_length):
+    latencies = []
+    with engine.connect() as conn:
+        for start in windows:
+            t0 = time.perf_counter()
+            conn.execute(text(run_sql(WINDOW_SQL, table)),
+                         {'start': start, 'stop': start + buffer_length}).fetchall()
+            latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description="Benchmark the agents time window query")
+    argParser.add_argument("-r", "--rows", type=int, default=100000000)
+    argParser.add_argument("--vehicles", type=int, default=20000, help="vehicles per simulation step")
+    argParser.add_argument("-b", "--buffer-length", type=int, default=115, help="steps per queried window")
+    argParser.add_argument("-q", "--queries", type=int, default=50)
+    argParser.add_argument("--partition-steps", type=int, default=3600)
+    argParser.add_argument("--chunk", type=int, default=5000000, help="rows inserted per transaction")
+    argParser.add_argument("--reuse", action='store_true', help="query tables left by a previous --keep run")
+    argParser.add_argument("--keep", action='store_true', help="keep the benchmark tables")
+    options = argParser.parse_args()
+
+    engine = get_db_engine()
+    if not options.reuse:
+        create_tables(engine, options.rows, options.vehicles, options.partition_steps)
+        fill(engine, PLAIN_TABLE, options.rows, options.vehicles, options.chunk)
+        fill(engine, PARTITIONED_TABLE, options.rows, options.vehicles, options.chunk)
+
+    last_step = options.rows // options.vehicles
+    rnd = random.Random(0)
+    windows = [rnd.randrange(0, max(1, last_step - options.buffer_length)) for _ in range(options.queries)]
+
+    print("%-20s %10s %10s %10s" % ("table", "p50 (ms)", "p95 (ms)", "max (ms)"))
+    for table in (PLAIN_TABLE, PARTITIONED_TABLE):
+        latencies = measure(engine, table, windows, options.buffer_length)
+        print("%-20s %10.1f %10.1f %10.1f" % (table, percentile(latencies, 50) * 1000,
+                                              percentile(latencies, 95) * 1000, max(latencies) * 1000))
+
+    if not options.keep:
+        drop_tables(engine)
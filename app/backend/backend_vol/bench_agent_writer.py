@@ -0,0 +1,66 @@
+"""
+Compares rows per second of the agent writers against a scratch copy of the agents table.
+
+    python bench_agent_writer.py --rows 200000 --vehicles 5000
+"""
+import argparse
+import random
+import time
+from agent_model import AgentMixin, Base, get_db_engine
+from agent_writer import make_agent_writer, WRITERS
+
+
+class BenchAgent(AgentMixin, Base):
+    __tablename__ = 'agents_bench'
+
+
+def synthetic_rows(nr_rows, nr_vehicles):
+    rnd = random.Random(0)
+    for i in range(nr_rows):
+        step, veh = divmod(i, nr_vehicles)
+        yield ('veh%i' % veh, step, 'passenger',
+               round(rnd.uniform(-73.9, -73.5), 6), round(rnd.uniform(45.4, 45.7), 6),
+               round(rnd.uniform(0, 5000), 3), round(rnd.uniform(0, 100), 3),
+               round(rnd.uniform(0, 1), 3), round(rnd.uniform(0, 2), 3),
+               round(rnd.uniform(0, 0.1), 3), round(rnd.uniform(50, 80), 3),
+               round(rnd.uniform(0, 2), 3))
+
+
+def run(kind, engine, rows, nr_vehicles, max_rows):
+    BenchAgent.__table__.drop(engine, checkfirst=True)
+    BenchAgent.__table__.create(engine)
+    if kind == 'orm':
+        writer = make_agent_writer(kind, engine, model=BenchAgent, max_rows=max_rows)
+    else:
+        writer = make_agent_writer(kind, engine, table=BenchAgent.__tablename__, max_rows=max_rows)
+
+    t0 = time.perf_counter()
+    for step_start in range(0, len(rows), nr_vehicles):
+        for row in rows[step_start:step_start + nr_vehicles]:
+            writer.add(row)
+        writer.maybe_flush()
+    writer.close()
+    elapsed = time.perf_counter() - t0
+
+    BenchAgent.__table__.drop(engine)
+    return elapsed
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description="Benchmark the agents table writers")
+    argParser.add_argument("-r", "--rows", type=int, default=100000,
+                           help="number of rows written by each writer")
+    argParser.add_argument("--vehicles", type=int, default=5000,
+                           help="number of vehicles per simulation step")
+    argParser.add_argument("--flush-rows", type=int, default=100000,
+                           help="row threshold before a flush")
+    argParser.add_argument("-w", "--writers", type=str, default=",".join(WRITERS),
+                           help="comma separated writers to benchmark")
+    options = argParser.parse_args()
+
+    engine = get_db_engine()
+    rows = list(synthetic_rows(options.rows, options.vehicles))
+    print("%-12s %10s %12s" % ("writer", "seconds", "rows/s"))
+    for kind in options.writers.split(","):
+        elapsed = run(kind.strip(), engine, rows, options.vehicles, options.flush_rows)
+        print("%-12s %10.2f %12.0f" % (kind, elapsed, len(rows) / elapsed))
@@ -0,0 +1,92 @@
+"""
+Publishes the agents of every simulation step to the live channel of the API
+(frame_pub event), which pushes them to the subscribed socket clients.
+
+Frames are sent from a background thread so the simulation never waits on the
+network. When the API falls behind, the oldest waiting frames are dropped:
+live clients only need the latest one, the database keeps every step.
+"""
+import os
+import queue
+import threading
+from agent_model import AGENT_COLUMNS
+
+
+# API receiving the frames, e.g. http://api_container:8000, no live stream if unset
+LIVE_STREAM_URL = os.environ.get('LIVE_STREAM_URL')
+# secret shared with the API, which refuses the frames without it
+LIVE_PUBLISH_TOKEN = os.environ.get('LIVE_PUBLISH_TOKEN')
+DEFAULT_MAX_FRAMES = 8
+
+
+def rows_to_columns(rows):
+    """Agent rows, ordered as AGENT_COLUMNS, to one list per column without vts."""
+    if rows:
+        columns = dict(zip(AGENT_COLUMNS, (list(column) for column in zip(*rows))))
+    else:
+        columns = {column: [] for column in AGENT_COLUMNS}
+    del columns['vts']
+    return columns
+
+
+class NullPublisher():
+    """Publisher used when the live stream is disabled."""
+    dropped = 0
+
+    def publish(self, vts, rows):
+        pass
+
+    def close(self):
+        pass
+
+
+class FramePublisher():
+
+    def __init__(self, url, run_id, token=LIVE_PUBLISH_TOKEN, max_frames=DEFAULT_MAX_FRAMES):
+        import socketio
+        self.run_id = run_id
+        self.token = token
+        self.dropped = 0
+        self.client = socketio.Client()
+        self.client.connect(url)
+        self._frames = queue.Queue(maxsize=max_frames)
+        self._thread = threading.Thread(target=self._run, name='frame-publisher', daemon=True)
+        self._thread.start()
+
+    def publish(self, vts, rows):
+        frame = {'run_id': self.run_id, 'vts': vts, 'token': self.token, 'columns': rows_to_columns(rows)}
+        while True:
+            try:
+                self._frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self._frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                break
+            try:
+                self.client.emit('frame_pub', frame)
+            except Exception:
+                # disconnected from the API, the frame is lost for live clients only
+                self.dropped += 1
+
+    def close(self):
+        self._frames.put(None)
+        self._thread.join()
+        self.client.disconnect()
+
+
+def make_frame_publisher(run_id, url=LIVE_STREAM_URL, token=LIVE_PUBLISH_TOKEN, **kwargs):
+    if not url:
+        return NullPublisher()
+    if not token:
+        print('LIVE_STREAM_URL is set without LIVE_PUBLISH_TOKEN, the live stream is disabled')
+        return NullPublisher()
+    return FramePublisher(url, run_id, token=token, **kwargs)
@@ -0,0 +1,39 @@
+import os
+import numpy as np
+import pyproj
+from xml.etree import ElementTree as ET
+
+
+class GeoConverter():
+    """
+    Converts SUMO network coordinates to lon/lat for whole arrays of positions,
+    using the projection and offset of the network's <location> element.
+    """
+
+    def __init__(self, proj_parameter, net_offset):
+        if proj_parameter == '!':
+            raise ValueError('the network has no geo projection')
+        self.proj = pyproj.Proj(proj_parameter)
+        self.offset_x, self.offset_y = net_offset
+
+    @classmethod
+    def from_net_file(cls, net_file):
+        for _, elem in ET.iterparse(net_file):
+            if elem.tag == 'location':
+                offset = tuple(float(v) for v in elem.get('netOffset').split(','))
+                return cls(elem.get('projParameter'), offset)
+            if elem.tag == 'edge':
+                break
+        raise ValueError('no location element in %s' % net_file)
+
+    @classmethod
+    def from_sumocfg(cls, sumocfg):
+        net_elem = ET.parse(sumocfg).getroot().find('input').find('net-file')
+        net_file = os.path.join(os.path.dirname(sumocfg), net_elem.get('value'))
+        return cls.from_net_file(net_file)
+
+    def to_lon_lat(self, x, y):
+        """Returns the lon and lat arrays of the x and y arrays."""
+        x = np.asarray(x, dtype=float) - self.offset_x
+        y = np.asarray(y, dtype=float) - self.offset_y
+        return self.proj(x, y, inverse=True)
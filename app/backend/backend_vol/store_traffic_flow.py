@@ -1,56 +1,52 @@
 
-import traci
-from sqlalchemy import Column, Integer, String, Float
-from sqlalchemy.orm import declarative_base
+import argparse
 import os
 import sys
 import time
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from agent_model import get_db_engine
+from agent_schema import create_run, finish_run
+from agent_collector import make_agent_collector
+from geo_converter import GeoConverter
+from agent_rollup import AgentRollups
+from agent_writer import make_agent_writer, BackgroundAgentWriter, DEFAULT_FLUSH_ROWS, DEFAULT_FLUSH_SECONDS
+from frame_publisher import make_frame_publisher
+from sumo_backend import BACKENDS, get_default_backend, start_simulation
+
+
+argParser = argparse.ArgumentParser(description="Run the Montreal scenario and store the agents")
+argParser.add_argument("-b", "--backend", choices=BACKENDS, default=get_default_backend(),
+                       help="traci (socket) or libsumo (in-process), defaults to SUMO_BACKEND")
+argParser.add_argument("-c", "--sumo-config", default='sumo-scenarios/Montreal/montreal.sumocfg',
+                       help="SUMO configuration of the run")
+argParser.add_argument("--seed", type=int, default=os.environ.get('SUMO_SEED'),
+                       help="random seed given to SUMO and stored with the run, defaults to SUMO_SEED")
+options = argParser.parse_args()
 
 
 ################## DB ##################
 
-db_name = 'postgres'
-db_user = os.environ['POSTGRES_USER']
-db_pass = os.environ['POSTGRES_PASSWORD']
-db_host = os.environ['POSTGRES_HOST']
-db_port = os.environ['POSTGRES_PORT']
-
-# Connect to the database
-db_string = 'postgresql://{}:{}@{}:{}/{}'.format(
-    db_user, db_pass, db_host, db_port, db_name)
-db = create_engine(db_string)
-
-
-Base = declarative_base()
-
-
-class Agent(Base):
-    __tablename__ = 'agents'
-    id = Column(Integer, primary_key=True)
-    vname = Column(String)
-    vts = Column(Integer)
-    vtype = Column(String)
-    vlon = Column(Float)
-    vlat = Column(Float)
-    vemis_co2 = Column(Float)
-    vemis_co = Column(Float)
-    vemis_hc = Column(Float)
-    vemis_nox = Column(Float)
-    vemis_pm25 = Column(Float)
-    vemis_noise = Column(Float)
-    vfuel = Column(Float)
-
-    def __repr__(self):
-        return "<User(id='%s', vname='%s', vts='%s', vtype='%s', vlon='%s', vlat='%s')>" % (
-            self.id, self.vname, self.vts, self.vtype, self.vlon, self.vlat)
-
-
-Base.metadata.create_all(db)
-
-Session = sessionmaker(bind=db)
-session = Session()
+db = get_db_engine()
+# every execution is a new run with its own partition of agents,
+# split in vts ranges that are created as the simulation advances
+partitions = create_run(db, os.path.abspath(options.sumo_config), options.seed)
+print("run", partitions.run_id)
+
+# AGENT_WRITER selects how rows reach the agents table: orm, copy or copy-binary
+writer = make_agent_writer(os.environ.get('AGENT_WRITER', 'copy'), db,
+                           run_id=partitions.run_id,
+                           max_rows=int(os.environ.get('AGENT_FLUSH_ROWS', DEFAULT_FLUSH_ROWS)),
+                           max_seconds=float(os.environ.get('AGENT_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)))
+# emissions per grid cell and 1 min, 15 min and 1 h bucket, rolled after each flush unless AGENT_ROLLUPS=0
+rollups = None
+if os.environ.get('AGENT_ROLLUPS', '1') != '0':
+    rollups = AgentRollups(db, partitions.run_id)
+    writer.flush_listeners.append(rollups.on_flush)
+# the database is written from a background thread unless AGENT_WRITE_ASYNC=0
+if os.environ.get('AGENT_WRITE_ASYNC', '1') != '0':
+    writer = BackgroundAgentWriter(writer)
+
+# every step is pushed to the live clients of the API when LIVE_STREAM_URL is set
+publisher = make_frame_publisher(partitions.run_id)
 
 
 #################### SUMO ####################
@@ -64,63 +60,42 @@ if 'SUMO_HOME' in os.environ:
 else:
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
-# import traci
-# import libsumo
-
-sumoCmd = [sumo_binary_path, '-c', 'sumo-scenarios/Montreal/montreal.sumocfg']
+sumo_cfg = options.sumo_config
+sumoCmd = [sumo_binary_path, '-c', sumo_cfg]
+if options.seed is not None:
+    sumoCmd += ['--seed', str(options.seed)]
 print(sumoCmd)
-traci.start(sumoCmd)
+sumo = start_simulation(sumoCmd, options.backend)
+# AGENT_COLLECTOR selects how vehicle variables are read: subscription or percall
+collector = make_agent_collector(os.environ.get('AGENT_COLLECTOR', 'subscription'), sumo,
+                                 GeoConverter.from_sumocfg(sumo_cfg))
 step = 0
 nr_steps_per_run = 5
 tt = time.time()
 while step < 5000:
-    [traci.simulationStep() for el in range(nr_steps_per_run)]
-    # traci.simulationStep()
+    [sumo.simulationStep() for el in range(nr_steps_per_run)]
+    # sumo.simulationStep()
     # step += nr_steps_per_run
     if step % 60 == 0:
         print(round(time.time()-tt, 1), " seconds")
         tt = time.time()
     # print("--> ", step, "  ---   ", round(t0-tt, 1), " seconds")
     # continue
-    vehicleIDS = traci.vehicle.getIDList()
-    for vehicleID in vehicleIDS:
-        x, y = traci.vehicle.getPosition(vehicleID)
-        vlon, vlat = traci.simulation.convertGeo(x, y)
-        vtype = traci.vehicle.getVehicleClass(vehicleID)
-        emiss_co2 = round(traci.vehicle.getCO2Emission(vehicleID), 3)
-        emiss_co = round(traci.vehicle.getCOEmission(vehicleID), 3)
-        emiss_hc = round(traci.vehicle.getHCEmission(vehicleID), 3)
-        emiss_nox = round(traci.vehicle.getNOxEmission(vehicleID), 3)
-        emiss_pm25 = round(traci.vehicle.getPMxEmission(vehicleID), 3)
-        emiss_noise = round(traci.vehicle.getNoiseEmission(vehicleID), 3)
-        fuel = round(traci.vehicle.getFuelConsumption(vehicleID), 3)
-
-        # print( vehicleID )
-        # print( x, y )
-        # print( vlon, vlat )
-        # print( emiss_class )
-        # print( "---------------------------------" )
-
-        session.add(Agent(vname=vehicleID,
-                          vts=step,
-                          vtype=vtype,
-                          vlon=vlon,
-                          vlat=vlat,
-                          vemis_co2=emiss_co2,
-                          vemis_co=emiss_co,
-                          vemis_hc=emiss_hc,
-                          vemis_nox=emiss_nox,
-                          vemis_pm25=emiss_pm25,
-                          vemis_noise=emiss_noise,
-                          vfuel=fuel,
-                          ))
-    session.commit()
+    partitions.ensure(step)
+    rows = collector.collect(step)
+    publisher.publish(step, rows)
+    writer.add_rows(rows)
     # break
-    print("--> ", step, "  ---   ", len(vehicleIDS))
+    print("--> ", step, "  ---   ", len(rows))
     # print("--> ", step, "  ---   ")
     # break
     step += nr_steps_per_run
     # time.sleep(.002)
 
 
-traci.close()
+publisher.close()
+writer.close()
+if rollups is not None and writer.last_vts is not None:
+    rollups.finish(writer.last_vts)
+sumo.close()
+finish_run(db, partitions.run_id)
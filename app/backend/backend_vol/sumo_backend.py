@@ -0,0 +1,31 @@
+import os
+import traci
+
+
+BACKENDS = ('traci', 'libsumo')
+
+
+def get_default_backend():
+    return os.environ.get('SUMO_BACKEND', 'traci')
+
+
+def start_simulation(sumoCmd, backend=None):
+    """
+    Starts SUMO and returns the module driving it: traci talks to a sumo
+    process over a socket, libsumo runs the simulation in-process.
+    Both expose the same domains (vehicle, simulation, ...), simulationStep and close.
+    """
+    backend = backend or get_default_backend()
+    if backend == 'libsumo':
+        import libsumo
+        libsumo.start(sumoCmd)
+        return libsumo
+    if backend == 'traci':
+        traci.start(sumoCmd)
+        return traci
+    raise ValueError('unknown SUMO backend "%s", use one of %s' % (backend, BACKENDS))
+
+
+def traci_exception(conn):
+    """Exception raised by conn for a refused command."""
+    return getattr(conn, 'TraCIException', traci.TraCIException)
@@ -8,6 +8,7 @@ import warnings
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools import verbose
+from sumoplustools.OD2Trips import odTensor
 
 # createFunctionMatrix.py --matrices Montreal/ODdata --prefix "mtl_hour,qc_18_hour" --extension ".npy" --output-file Montreal/ODFunctions/hour_function --verbose
 # createFunctionMatrix.py --matrices Montreal/ODdata --prefix "mtl_wday" --extension ".npy" --output-file Montreal/ODFunctions/wday_function --verbose
@@ -34,8 +35,8 @@ def fillOptions(argParser):
                             metavar="STR[,STR]", type=str, default="",
                             help="processes only matrices with the prefix. If multiple prefixes provided, then the files are group by prefix then combined appropriately. Any prefix must filter the exact same number of files as all other prefixes")
     argParser.add_argument("-e", "--extension", 
-                            metavar="FILE", type=str, default=".npy",
-                            help="processes only matrices with the extension")
+                            metavar="FILE", type=str, default=odTensor.EXTENSION,
+                            help="processes only matrices with the extension, OD tensors (.odt) or numpy files of one time each (.npy)")
     argParser.add_argument("-o", "--output-file",
                             metavar="FILE", type=str,
                             help="function matrix is save to FILE. If not provided it is saved to the matrices directory under function.npy")
@@ -58,50 +59,49 @@ if __name__ == "__main__":
     folder = options.matrices
     prefixes = options.prefix.split(",")
     
-    combinedMatricesPerTime = None
-    matricesPerPrefix = []
+    tensorsPerPrefix = []
     for prefix in prefixes:
-        files = [folder + os.sep + f for f in os.listdir(folder) if prefix in f[0:len(prefix)] and options.extension in f[-len(options.extension):]]
+        files = sorted(folder + os.sep + f for f in os.listdir(folder) if prefix in f[0:len(prefix)] and options.extension in f[-len(options.extension):])
         if len(files) == 0:
             warnings.warn('No files loaded from folder "%s", with prefix "%s" and extension "%s"\n Skipping this prefix' % (folder, prefix, options.extension))
             continue
-        matricesPerTime = [np.load(f) for f in files]
-        matricesPerPrefix += [matricesPerTime]
-        if combinedMatricesPerTime is None:
-            combinedMatricesPerTime = [np.zeros(odMatrix.shape) for odMatrix in matricesPerTime]
+        # The slices of the files one after the other, in the order of their names
+        tensorsPerPrefix += [odTensor.concatenate([odTensor.read(f) for f in files])]
     
-    if len(matricesPerPrefix) == 0:
+    if len(tensorsPerPrefix) == 0:
         warnings.warn('No matrices loaded from folder "%s"\n Terminating process' % (folder))
         exit()
     
     if options.verbose:
         verbose.writeToConsole(done=True)
     
-    for matricesPerTime in matricesPerPrefix:
-        for t in range(len(matricesPerTime)):
-            combinedMatricesPerTime[t] += matricesPerTime[t]
+    combinedTensor = odTensor.add(tensorsPerPrefix)
     
     if options.verbose:
         verbose.writeToConsole(done=True)
 
-    xs = np.array(list(range(len(combinedMatricesPerTime)))).reshape((-1,1))
+    timeCount, zones, _ = combinedTensor.shape
+    xs = np.array(list(range(timeCount))).reshape((-1,1))
     xs = PolynomialFeatures(degree=len(xs) - 1).fit_transform(xs)
 
-    function = np.zeros((combinedMatricesPerTime[0].shape[0], combinedMatricesPerTime[0].shape[1]), dtype='O')
-    for i in range(combinedMatricesPerTime[0].shape[0]):
-        for j in range(combinedMatricesPerTime[0].shape[1]):
-            data = []
-            for time in range(len(combinedMatricesPerTime)):
-                data += [combinedMatricesPerTime[time][i,j]]
-            if (i == 13 and j == 13):
-                print(data)
-            data = np.array(data) + 1
-            model = LinearRegression().fit(xs, data)
-            function[i,j] = model
+    # Trips over time of the OD pairs with trips at any time, the other pairs all share the model of no trips
+    entries = [combinedTensor.getEntries(time) for time in range(timeCount)]
+    pairs = np.unique(np.concatenate([origins.astype(np.int64) * zones + destinations for origins, destinations, _ in entries]))
+    data = np.zeros((timeCount, len(pairs)))
+    for time, (origins, destinations, counts) in enumerate(entries):
+        data[time, np.searchsorted(pairs, origins.astype(np.int64) * zones + destinations)] = counts
+    data += 1
 
-            if options.verbose:
-                completedCoords = (i,j)
-                verbose.writeToConsole(verboseValue=completedCoords)
+    function = np.zeros((zones, zones), dtype='O')
+    function.fill(LinearRegression().fit(xs, np.ones(timeCount)))
+    for p, pair in enumerate(pairs.tolist()):
+        i, j = divmod(pair, zones)
+        model = LinearRegression().fit(xs, data[:, p])
+        function[i,j] = model
+
+        if options.verbose:
+            completedCoords = (i,j)
+            verbose.writeToConsole(verboseValue=completedCoords)
 
     if options.verbose:
         verbose.writeToConsole(done=True)
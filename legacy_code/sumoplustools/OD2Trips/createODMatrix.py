@@ -1,14 +1,79 @@
 import os, sys
 import argparse
-import sumolib
 import numpy as np
+import pandas as pd
 import geopandas as gpd
-import time
-from shapely.geometry import Polygon, Point
+import shapely
 from xml.etree import ElementTree as ET
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools import verbose
+from sumoplustools import netCache
+from sumoplustools.OD2Trips import odTensor
+
+def readTAZShapes(net, tazFile) -> (np.ndarray, np.ndarray):
+    """
+    Returns the ids of the TAZ of tazFile and their polygons in geo coordinates (lon, lat).
+    The vertices of every polygon are converted in one call
+    """
+    tazIDs = []
+    coords = []
+    counts = []
+    for _, elem in ET.iterparse(tazFile):
+        if elem.tag != "taz":
+            continue
+        tazIDs += [int(elem.get("id").split("_")[1])]
+        shape = [position.split(",") for position in elem.get("shape").split()]
+        coords += shape
+        counts += [len(shape)]
+        elem.clear()
+    coords = np.array(coords, dtype=float).reshape(-1, 2)
+    lons, lats = net.convertXY2LonLat(coords[:, 0], coords[:, 1])
+    rings = shapely.linearrings(np.column_stack((lons, lats)), indices=np.repeat(np.arange(len(counts)), counts))
+    return np.array(tazIDs, dtype=np.int64), shapely.polygons(rings)
+
+def assignTAZ(tree: shapely.STRtree, tazIDs: np.ndarray, lons, lats) -> np.ndarray:
+    """
+    Returns the id of the TAZ within which each point (lon, lat) is, -1 for points in no TAZ.
+    A point within several TAZ is given the first of them in the TAZ file
+    """
+    pointIdx, tazIdx = tree.query(shapely.points(lons, lats), predicate="within")
+    first = np.full(len(lons), len(tazIDs), dtype=np.int64)
+    np.minimum.at(first, pointIdx, tazIdx)
+    return np.append(tazIDs, -1)[first]
+
+def getTimeIndexes(times: pd.Series, timeFormat: str, field: str) -> np.ndarray:
+    """
+    Returns the minute, hour or day of week (Sunday 0) of each time string parsed with timeFormat, as field is M, H or D,
+    -1 for times that cannot be parsed. Hours over 23 at the start of a time are taken modulo 24
+    """
+    times = times.astype(str)
+    dates = pd.to_datetime(times, format=timeFormat, errors="coerce")
+    # Retry the failed times starting with an hour past midnight, as 25:10 for 01:10 the next day
+    hours = pd.to_numeric(times.str[:2], errors="coerce")
+    retry = dates.isna() & (hours > 23)
+    if retry.any():
+        wrapped = (hours[retry].astype(int) % 24).map("{:02d}".format) + times[retry].str[2:]
+        dates[retry] = pd.to_datetime(wrapped, format=timeFormat, errors="coerce")
+    if field == "M":
+        indexes = dates.dt.minute
+    elif field == "H":
+        indexes = dates.dt.hour
+    else:
+        indexes = (dates.dt.dayofweek + 1) % 7
+    return indexes.fillna(-1).to_numpy(dtype=np.int64)
+
+def getEndPoints(geometries) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+    """
+    Returns the coordinates of the first and last points of each line, a MultiLineString giving one per part, and the index of the geometry of each line.
+    Geometries that are not lines are skipped
+    """
+    geometries = np.asarray(geometries)
+    lines = np.isin(shapely.get_type_id(geometries), [shapely.GeometryType.LINESTRING, shapely.GeometryType.MULTILINESTRING])
+    parts, geomIdx = shapely.get_parts(geometries[lines], return_index=True)
+    starts = shapely.get_coordinates(shapely.get_point(parts, 0))
+    ends = shapely.get_coordinates(shapely.get_point(parts, -1))
+    return starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1], np.flatnonzero(lines)[geomIdx]
 
 def fillOptions(argParser):
     argParser.add_argument("-n", "--sumo-net-file", 
@@ -22,7 +87,7 @@ def fillOptions(argParser):
                             help="OD trip data in FILE that uses geometry column by default (mandatory)")
     argParser.add_argument("-o", "--output-file",
                             metavar="FILE", type=str, default="tazMatrix",
-                            help="OD matrix is save to FILE")
+                            help="OD matrices are saved to the OD tensor FILE, a .odt directory")
     argParser.add_argument("--ori-lon", 
                             metavar="STR", type=str,
                             help="OD column that contains the origin's longitude. Uses the geometry column if omitted")
@@ -63,64 +128,41 @@ if __name__ == "__main__":
         verbose.addVerboseSteps(["extracting data from SUMO network file", "extracting data from TAZ file", "extracting data from OD matrix"])
         verbose.writeToConsole()
 
-    net = sumolib.net.readNet(options.sumo_net_file)
+    net = netCache.readNet(options.sumo_net_file)
 
     if options.verbose:
         verbose.writeToConsole(done=True)
 
-    tazXMLIter = ET.iterparse(options.taz_add_file)
-    tazShapes = {}
-    tazShapes['taz_id'] = []
-    tazShapes['geometry'] = []
-    for _, elem in tazXMLIter:
-        if elem.tag != "taz":
-            continue
-        
-        taz_id = int(elem.get("id").split("_")[1])
-        polygon = []
-        for position in elem.get("shape").split():
-            x, y = position.split(",")
-            x, y = float(x.strip()), float(y.strip())
-
-            lon, lat = net.convertXY2LonLat(x, y)
-            polygon += [(lon, lat)]
-        tazShapes['taz_id'] += [taz_id]
-        tazShapes['geometry'] += [Polygon(polygon)]
-
-        elem.clear()
-        del elem
-    del tazXMLIter
+    tazIDs, tazPolygons = readTAZShapes(net, options.taz_add_file)
+    tazTree = shapely.STRtree(tazPolygons)
     
     # Add OD matrices based on time
-    tazMatrices = [np.zeros((len(tazShapes['taz_id']),len(tazShapes['taz_id'])))]
+    matrixCount = 1
+    field = None
     if options.time_col:
-        field = options.time_field
-        if field.upper().startswith("M"):
-            r = 59
-            time_format = "%M"
-        elif field.upper().startswith("H"):
-            r = 23
-            time_format = "%H"
-        elif field.upper().startswith("D"):
-            r = 6
-            time_format = "%w"
+        field = options.time_field.upper()[:1]
+        if field == "M":
+            matrixCount = 60
+        elif field == "H":
+            matrixCount = 24
+        elif field == "D":
+            matrixCount = 7
         else:
             argParser.print_help()
             argParser.error("--time-field given is not valid: use given types")
-        for _ in range(r):
-            tazMatrices += [np.zeros((len(tazShapes['taz_id']),len(tazShapes['taz_id'])))]
+    # Time, origin and destination of every trip, summed into the OD tensor once read
+    entries = []
     
     if options.verbose:
         verbose.writeToConsole(done=True)
-        v_od_collected = 1
+        v_od_collected = 0
 
     if (options.ori_lon and options.ori_lat and options.dest_lon and options.dest_lat):
         useGeom = False
     else:
         useGeom = True
 
-    columns = None
-    chunksize = 10 * 10**3
+    chunksize = 100 * 10**3
     chunk_idx = -1
     while True:
         chunk_idx += 1
@@ -137,77 +179,35 @@ if __name__ == "__main__":
             if od_data.empty:
                 continue
 
-        # Convert geometry to geocoordinates
+        # Matrix of each row, based on its time
+        if options.time_col:
+            matrixIdx = getTimeIndexes(od_data[options.time_col], options.time_format, field)
+        else:
+            matrixIdx = np.zeros(len(od_data), dtype=np.int64)
+
+        # Origin and destination points of the whole chunk
         if useGeom:
+            # Convert geometry to geocoordinates
             od_data.to_crs(epsg=4326, inplace=True)
-        
-        if columns is None:
-            columns = od_data.columns.tolist()
-        
-        # Iterate for each row in dataframe
-        for row_tuple in od_data.itertuples(index=False):
-            if options.time_col:
-                timeStr = row_tuple[columns.index(options.time_col)]
-                try:
-                    dTime = time.strptime(timeStr, options.time_format)
-                except ValueError as e:
-                    descr = e.args[0]
-                    if "bad directive" in descr:
-                        continue
-                    elif "unconverted" in descr:
-                        try:
-                            if int(timeStr[:2]) > 23:
-                                timeStr = timeStr.replace(timeStr[:2], "%i" % (int(timeStr[:2]) % 24), 1)
-                                dTime = time.strptime(timeStr, options.time_format)
-                            else:
-                                continue
-                        except:
-                            continue
-
-                matrixIdx = int(time.strftime(time_format, dTime)) % len(tazMatrices)
-            else:
-                matrixIdx = 0
-
-            toAdd = []
-            if useGeom:
-                geom = row_tuple.geometry
-                if geom.geom_type == 'MultiLineString':
-                    for line in geom:
-                        toAdd += [(Point(line.coords[0]), Point(line.coords[-1]))]
-                elif geom.geom_type == 'LineString':
-                    toAdd += [(Point(geom.coords[0]), Point(geom.coords[-1]))]
-                else:
-                    continue
-            else:
-                oriLon = float(row_tuple[columns.index(options.ori_lon)])
-                oriLat = float(row_tuple[columns.index(options.ori_lat)])
-                desLon = float(row_tuple[columns.index(options.dest_lon)])
-                desLat = float(row_tuple[columns.index(options.dest_lat)])
-
-                toAdd += [(Point(oriLon, oriLat), Point(desLon, desLat))]
-
-            for points in toAdd:
-                oriTAZ_id = None
-                desTAZ_id = None
-                for taz_id, od_poly in zip(tazShapes['taz_id'],tazShapes['geometry']):
-                    if oriTAZ_id and desTAZ_id:
-                        break
-                    if points[0].within(od_poly):
-                        oriTAZ_id = taz_id
-                    if points[1].within(od_poly):
-                        desTAZ_id = taz_id
-                if not (oriTAZ_id and desTAZ_id):
-                    continue
-                
-                tazMatrices[matrixIdx][oriTAZ_id, desTAZ_id] += 1
-                if options.verbose:
-                    verbose.writeToConsole(verboseValue=v_od_collected)
-                    v_od_collected += 1
+            oriLons, oriLats, desLons, desLats, rows = getEndPoints(od_data.geometry.to_numpy())
+            matrixIdx = matrixIdx[rows]
+        else:
+            oriLons = od_data[options.ori_lon].to_numpy(dtype=float)
+            oriLats = od_data[options.ori_lat].to_numpy(dtype=float)
+            desLons = od_data[options.dest_lon].to_numpy(dtype=float)
+            desLats = od_data[options.dest_lat].to_numpy(dtype=float)
+
+        oriTAZ = assignTAZ(tazTree, tazIDs, oriLons, oriLats)
+        desTAZ = assignTAZ(tazTree, tazIDs, desLons, desLats)
+        found = (matrixIdx >= 0) & (oriTAZ >= 0) & (desTAZ >= 0)
+        entries += [(matrixIdx[found].astype(np.int32), oriTAZ[found].astype(np.int32), desTAZ[found].astype(np.int32))]
+        if options.verbose:
+            v_od_collected += int(found.sum())
+            verbose.writeToConsole(verboseValue=v_od_collected)
 
     if options.verbose:
         verbose.writeToConsole(done=True)
 
-    for idx, tazMatrix in enumerate(tazMatrices):
-        np.save("%s_" % os.path.splitext(options.output_file)[0] + ("%i" % idx).zfill(2), tazMatrix)
-
-
+    columns = [np.concatenate(column) for column in zip(*entries)] if entries else [np.empty(0, dtype=np.int32)] * 3
+    tazTensor = odTensor.ODTensor.fromEntries(*columns, 1, (matrixCount, len(tazIDs), len(tazIDs)), field)
+    tazTensor.save(os.path.splitext(options.output_file)[0])
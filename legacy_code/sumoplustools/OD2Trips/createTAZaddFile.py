@@ -1,11 +1,11 @@
 import os, sys
 import argparse
-import sumolib
 import geopandas as gpd
 from xml.etree import ElementTree as ET
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools import verbose
+from sumoplustools import netCache
 
 def fillOptions(argParser):
     argParser.add_argument("-n", "--sumo-net-file", 
@@ -36,7 +36,7 @@ if __name__ == "__main__":
         verbose.addVerboseSteps(["extracting data from SUMO network file", "extracting data from cencus tracts shape file"])
         verbose.writeToConsole()
 
-    net = sumolib.net.readNet(options.sumo_net_file)
+    net = netCache.readNet(options.sumo_net_file)
     if options.verbose:
         verbose.writeToConsole(done=True)
     tracts = gpd.read_file(options.census_tracts_file)
@@ -8,11 +8,16 @@ import matplotlib.pyplot as plt
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools import verbose
+from sumoplustools import netCache
+from sumoplustools.OD2Trips import odTensor
 
 def fillOptions(argParser):
     argParser.add_argument("-m", "--matrix", 
                             metavar="FILE", type=str, required=True,
-                            help="displays matrix from numpy FILE or all matrices from DIR (mandatory)")
+                            help="displays matrices from the OD tensor or numpy FILE or all of them from DIR (mandatory)")
+    argParser.add_argument("--time", 
+                            metavar="INT", type=int,
+                            help="displays only the trips of the time slice INT of the OD tensors. Displays the trips over all times if omitted")
     argParser.add_argument("-r", "--reference", 
                             metavar="FILE", type=str,
                             help="references the matrix indeces with a geometry in geoJson format")
@@ -57,8 +62,7 @@ if __name__ == "__main__":
             verbose.addVerboseSteps(["extracting data from SUMO network file", "extracting data from TAZ file", "extracting data from OD matrix", "displaying matrices"])
             verbose.writeToConsole()
 
-        import sumolib
-        net = sumolib.net.readNet(options.sumo_net_file)
+        net = netCache.readNet(options.sumo_net_file)
 
         if options.verbose:
             verbose.writeToConsole(done=True)
@@ -91,19 +95,23 @@ if __name__ == "__main__":
             verbose.writeToConsole(done=True)
 
         
-    if os.path.isdir(options.matrix):
-        matrices = []
-        for f in [f for f in os.listdir(options.matrix) if '.npy' in f[-4:]]:
-            matrices += [(os.path.split(f)[1][:-4], np.load(os.path.join(options.matrix,f)))]
+    if os.path.isdir(options.matrix) and not odTensor.isTensor(options.matrix):
+        paths = [os.path.join(options.matrix, f) for f in sorted(os.listdir(options.matrix)) if f.endswith('.npy') or f.endswith(odTensor.EXTENSION)]
     else:
-        matrices = [(os.path.split(options.matrix)[1][:-4], np.load(options.matrix))]
+        paths = [options.matrix]
+    # Tensors are memory-mapped, only the slices displayed are read
+    matrices = [(os.path.splitext(os.path.basename(os.path.normpath(path)))[0], odTensor.read(path)) for path in paths]
     
     if options.verbose:
         verbose.writeToConsole(done=True)
 
-    for name, tazMatrix in matrices:
-        tazShapes["ori_trips"] = np.sum(tazMatrix, axis=1).tolist()
-        tazShapes["des_trips"] = np.sum(tazMatrix, axis=0).tolist()
+    for name, tazTensor in matrices:
+        # Numpy files are a single time slice
+        time = options.time if len(tazTensor) > 1 else None
+        oriTrips = tazTensor.getOriginTotals(time)
+        desTrips = tazTensor.getDestinationTotals(time)
+        tazShapes["ori_trips"] = oriTrips.tolist()
+        tazShapes["des_trips"] = desTrips.tolist()
 
         fig, axs = plt.subplots(2,2)
         fig.suptitle("Trips for file %s" % name)
@@ -114,8 +122,8 @@ if __name__ == "__main__":
         axs[1,0].set_xlabel("TAZ ID")
         axs[1,0].set_ylabel("# Trips")
         axs[1,1].set_xlabel("TAZ ID")
-        axs[1,0].bar(tazShapes['taz_id'], np.sum(tazMatrix, axis=1))
-        axs[1,1].bar(tazShapes['taz_id'], np.sum(tazMatrix, axis=0))
+        axs[1,0].bar(tazShapes['taz_id'], oriTrips)
+        axs[1,1].bar(tazShapes['taz_id'], desTrips)
 
     plt.show()
 
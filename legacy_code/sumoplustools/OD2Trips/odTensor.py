@@ -0,0 +1,205 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+
+# Bumped when the arrays of a tensor change
+FORMAT_VERSION = 1
+EXTENSION = ".odt"
+_META_FILE = "meta.json"
+_ARRAYS = ("indptr", "destinations", "counts")
+
+class ODTensor():
+    """
+    OD matrices of the trips between zones over a time dimension (minutes, hours or days of week), stored sparsely.\n
+    Each time slice is a CSR matrix whose rows are the origins: the trips from origin o at time t are the entries
+    indptr[t, o]:indptr[t, o + 1] of destinations and counts, the entries being sorted by time, origin and destination.
+    Saved as a directory of .npy files that read memory-maps, so that a slice, or the row of an origin, only reads its own entries.
+
+    Parameters
+    ----------
+    indptr : numpy.ndarray
+        (times, zones + 1) positions of the first entry of each origin of each time slice
+
+    destinations : numpy.ndarray
+        Destination zone of each entry
+
+    counts : numpy.ndarray
+        Number of trips of each entry
+
+    zones : int
+        Number of origin and destination zones
+
+    timeField : str
+        Time field of the slices, M (minute), H (hour) or D (day of week), None for a single slice
+    """
+    def __init__(self, indptr, destinations, counts, zones: int, timeField: str=None):
+        self.indptr = indptr
+        self.destinations = destinations
+        self.counts = counts
+        self.zones = zones
+        self.timeField = timeField
+
+    @classmethod
+    def fromEntries(cls, times, origins, destinations, counts, shape, timeField: str=None):
+        """
+        Returns the tensor of shape (times, zones, zones) from the coordinates and counts of its entries, in any order.
+        The counts of repeated coordinates are summed
+        """
+        timeCount, zones, _ = shape
+        keys = (np.asarray(times, dtype=np.int64) * zones + np.asarray(origins, dtype=np.int64)) * zones + np.asarray(destinations, dtype=np.int64)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.zeros(len(keys), dtype=np.float64)
+        np.add.at(sums, inverse, np.broadcast_to(np.asarray(counts, dtype=np.float64), inverse.shape))
+        # Position of the first entry of each (time, origin) row, keys being sorted
+        rows = np.searchsorted(keys // zones, np.arange(timeCount * zones + 1, dtype=np.int64))
+        indptr = np.column_stack((rows[:-1].reshape(timeCount, zones), rows[zones::zones]))
+        return cls(indptr, (keys % zones).astype(np.int32), sums, zones, timeField)
+
+    @classmethod
+    def fromDense(cls, matrices, timeField: str=None):
+        """Returns the tensor of the dense matrices, an array (times, zones, zones) or a list of (zones, zones)"""
+        matrices = np.asarray(matrices)
+        if matrices.ndim == 2:
+            matrices = matrices[np.newaxis]
+        times, origins, destinations = np.nonzero(matrices)
+        return cls.fromEntries(times, origins, destinations, matrices[times, origins, destinations], matrices.shape, timeField)
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self.indptr), self.zones, self.zones)
+
+    def __len__(self):
+        return len(self.indptr)
+
+    def nnz(self, time: int=None) -> int:
+        """Returns the number of entries of the time slice, of all of them if omitted"""
+        if time is None:
+            return int(self.indptr[-1, -1])
+        return int(self.indptr[time, -1] - self.indptr[time, 0])
+
+    def getEntries(self, time: int) -> (np.ndarray, np.ndarray, np.ndarray):
+        """Returns the origins, the destinations and the counts of the entries of the time slice"""
+        rows = np.asarray(self.indptr[time])
+        start, end = rows[0], rows[-1]
+        origins = np.repeat(np.arange(self.zones, dtype=np.int32), np.diff(rows))
+        return origins, np.asarray(self.destinations[start:end]), np.asarray(self.counts[start:end])
+
+    def getMatrix(self, time: int) -> np.ndarray:
+        """Returns the dense (zones, zones) matrix of the time slice"""
+        matrix = np.zeros((self.zones, self.zones), dtype=np.float64)
+        origins, destinations, counts = self.getEntries(time)
+        matrix[origins, destinations] = counts
+        return matrix
+
+    def toDense(self) -> np.ndarray:
+        """Returns the dense (times, zones, zones) array of every slice, only for small tensors"""
+        return np.stack([self.getMatrix(time) for time in range(len(self))]) if len(self) else np.zeros(self.shape)
+
+    def getOrigin(self, origin: int, time: int=None) -> np.ndarray:
+        """
+        Returns the trips from the origin to each destination at the time, an array (zones,),
+        or at every time if omitted, an array (times, zones)
+        """
+        times = range(len(self)) if time is None else [time]
+        trips = np.zeros((len(times), self.zones), dtype=np.float64)
+        for i, t in enumerate(times):
+            start, end = self.indptr[t, origin], self.indptr[t, origin + 1]
+            trips[i, self.destinations[start:end]] = self.counts[start:end]
+        return trips if time is None else trips[0]
+
+    def getDestination(self, destination: int, time: int=None) -> np.ndarray:
+        """
+        Returns the trips from each origin to the destination at the time, an array (zones,),
+        or at every time if omitted, an array (times, zones). Reads the entries of the slices, rows are by origin
+        """
+        times = range(len(self)) if time is None else [time]
+        trips = np.zeros((len(times), self.zones), dtype=np.float64)
+        for i, t in enumerate(times):
+            origins, destinations, counts = self.getEntries(t)
+            found = destinations == destination
+            trips[i, origins[found]] = counts[found]
+        return trips if time is None else trips[0]
+
+    def getOriginTotals(self, time: int=None) -> np.ndarray:
+        """Returns the trips started in each zone at the time, or over every time if omitted"""
+        times = range(len(self)) if time is None else [time]
+        totals = np.zeros(self.zones, dtype=np.float64)
+        for t in times:
+            origins, _, counts = self.getEntries(t)
+            totals += np.bincount(origins, weights=counts, minlength=self.zones)
+        return totals
+
+    def getDestinationTotals(self, time: int=None) -> np.ndarray:
+        """Returns the trips ended in each zone at the time, or over every time if omitted"""
+        times = range(len(self)) if time is None else [time]
+        totals = np.zeros(self.zones, dtype=np.float64)
+        for t in times:
+            _, destinations, counts = self.getEntries(t)
+            totals += np.bincount(destinations, weights=counts, minlength=self.zones)
+        return totals
+
+    def save(self, path):
+        """
+        Writes the tensor in the directory path, EXTENSION being added if missing.
+        The directory is written next to path then renamed, so that a tensor is never read half written
+        """
+        path = getPath(path)
+        parentDir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parentDir, exist_ok=True)
+        tmpDir = tempfile.mkdtemp(dir=parentDir)
+        try:
+            for name in _ARRAYS:
+                np.save(os.path.join(tmpDir, name + ".npy"), getattr(self, name))
+            with open(os.path.join(tmpDir, _META_FILE), "w") as f:
+                json.dump({"version": FORMAT_VERSION, "zones": self.zones, "timeField": self.timeField}, f)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.replace(tmpDir, path)
+        finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+        return path
+
+def getPath(path) -> str:
+    """Returns path with EXTENSION"""
+    return path if path.endswith(EXTENSION) else path + EXTENSION
+
+def isTensor(path) -> bool:
+    return os.path.isfile(os.path.join(path, _META_FILE))
+
+def read(path) -> ODTensor:
+    """
+    Returns the tensor saved in the directory path, its arrays memory-mapped.
+    A .npy file of a dense matrix, as written by createODMatrix before, is read as a tensor of one slice
+    """
+    if not isTensor(path):
+        if os.path.isfile(path) and path.endswith(".npy"):
+            return ODTensor.fromDense(np.load(path))
+        path = getPath(path)
+    with open(os.path.join(path, _META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError('OD tensor "%s" has format version %s, expected %i' % (path, meta.get("version"), FORMAT_VERSION))
+    arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in _ARRAYS]
+    return ODTensor(*arrays, meta["zones"], meta.get("timeField"))
+
+def _fromSlices(slices, shape, timeField) -> ODTensor:
+    # slices gives the time of a slice and its entries, see ODTensor.getEntries
+    columns = [(np.full(len(origins), time), origins, destinations, counts) for time, (origins, destinations, counts) in slices]
+    columns = [np.concatenate(column) for column in zip(*columns)] if columns else [np.empty(0, dtype=np.int64)] * 4
+    return ODTensor.fromEntries(*columns, shape, timeField)
+
+def concatenate(tensors, timeField: str=None) -> ODTensor:
+    """Returns the tensor of the slices of the tensors one after the other, as the .npy matrices of one time each"""
+    offsets = np.cumsum([0] + [len(tensor) for tensor in tensors])
+    zones = max(tensor.zones for tensor in tensors)
+    slices = ((offset + time, tensor.getEntries(time)) for offset, tensor in zip(offsets.tolist(), tensors) for time in range(len(tensor)))
+    return _fromSlices(slices, (int(offsets[-1]), zones, zones), timeField)
+
+def add(tensors) -> ODTensor:
+    """Returns the sum of the tensors, the slices of the same time being added"""
+    times = max(len(tensor) for tensor in tensors)
+    zones = max(tensor.zones for tensor in tensors)
+    slices = ((time, tensor.getEntries(time)) for tensor in tensors for time in range(len(tensor)))
+    return _fromSlices(slices, (times, zones, zones), tensors[0].timeField)
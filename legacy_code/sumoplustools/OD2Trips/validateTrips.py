@@ -1,7 +1,10 @@
+import os, sys
 import argparse
-import sumolib
 from xml.etree import ElementTree as ET
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools import netCache
+
 def fillOptions(argParser):
     argParser.add_argument("-n", "--sumo-network-file", 
                             metavar="FILE", type=str, required=True,
@@ -21,7 +24,7 @@ def parse_args(args=None):
 if __name__ == "__main__":
     options, argParser = parse_args()
 
-    net = sumolib.net.readNet(options.sumo_network_file)
+    net = netCache.readNet(options.sumo_network_file)
 
     # Remove trips where vehicle cannot travel on edges
     tree = ET.parse(options.trips_file)
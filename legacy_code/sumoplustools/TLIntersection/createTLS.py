@@ -1,10 +1,13 @@
-import os
+import os, sys
 import argparse
-import sumolib
 import pandas as pd
 from xml.etree import ElementTree as ET
 from shapely.geometry import polygon
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools import netHandler
+from sumoplustools import netCache
+
 def fillOptions(argParser):
     argParser.add_argument("-n", "--sumo-net-file", 
                             metavar="FILE", type=str, required=True,
@@ -33,7 +36,7 @@ if __name__ == "__main__":
         argParser.error("CSV file not found")
 
 
-    net = sumolib.net.readNet(options.sumo_net_file)
+    net = netCache.readNet(options.sumo_net_file)
     df = pd.read_csv(options.csv_file)
 
     topElem = ET.Element("nodes")
@@ -41,11 +44,12 @@ if __name__ == "__main__":
     xmin,ymin,xmax,ymax = net.getBoundary()
     boundary = polygon.Polygon([(xmin,ymin),(xmax,ymin),(xmax,ymax),(xmin,ymax),(xmin,ymin)])
         
-    for _, row in df.iterrows():
-        lon, lat = row['long'], row['lat']
-        x, y = net.convertLonLat2XY(lon,lat)
+    xs, ys = net.convertLonLat2XY(df['long'].to_numpy(dtype=float), df['lat'].to_numpy(dtype=float))
+    # Surrounding edges of every traffic light, in one query
+    pointsEdges = netHandler.getClosestEdgesOfPoints(net, xs, ys, radius=100)
+    for x, y, edges in zip(xs.tolist(), ys.tolist(), pointsEdges):
         # Check each surrounding edge for nodes
-        for edge in net.getNeighboringEdge(x, y, radius=100):
+        for edge in edges:
             # Check if the from node contains the traffic light
             node = edge.getFromNode()
             if node:
@@ -1,6 +1,5 @@
 import os, sys
 import argparse
-import sumolib
 import numpy as np
 import geopandas as gpd
 from xml.etree import ElementTree as ET
@@ -10,6 +9,7 @@ from shapely import ops
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools import netHandler
 from sumoplustools import verbose
+from sumoplustools import netCache
 
 def fillOptions(argParser):
     argParser.add_argument("-n", "--net-file", 
@@ -41,7 +41,7 @@ if __name__ == "__main__":
         verbose.writeToConsole()
     
     # Initialize data from user
-    net = sumolib.net.readNet(options.net_file)
+    net = netCache.readNet(options.net_file)
     netEdges = net.getEdges()
     if options.verbose:
         verbose.writeToConsole(done=True)
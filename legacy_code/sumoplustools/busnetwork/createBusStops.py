@@ -1,6 +1,5 @@
 import os, sys
 import argparse
-import sumolib
 import geopandas as gpd
 from shapely.geometry import polygon
 from xml.etree import ElementTree as ET
@@ -8,6 +7,7 @@ from xml.etree import ElementTree as ET
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools import netHandler
 from sumoplustools import verbose
+from sumoplustools import netCache
 
 def fillOptions(argParser):
     argParser.add_argument("-n", "--net-file", 
@@ -36,7 +36,7 @@ if __name__ == "__main__":
         verbose.writeToConsole()
     
     # Initialize data from user
-    net = sumolib.net.readNet(options.net_file)
+    net = netCache.readNet(options.net_file)
     if options.verbose:
         verbose.writeToConsole(done=True)
     busStop_df = gpd.read_file(options.bus_stops)
@@ -45,21 +45,16 @@ if __name__ == "__main__":
         verbose.writeToConsole(done=True)
         stopsDone = 0
     root = ET.Element("routes")
-    stopLanes = []
+    stopLanes = set()
 
-    # Get each bus stop point and a SUMO busStop element for each of them
-    for _, row in busStop_df.iterrows():
-        point = row["geometry"]
-        routes_id = row["route_id"]
-        lon, lat = point.x, point.y
-        stop_x, stop_y = net.convertLonLat2XY(lon, lat)
-
-        # If stop_id != code_id, then stop is a metro station door/exit, it is not a bus stop
-        if str(row["stop_id"]) != str(row["stop_code"]):
-            continue
+    # If stop_id != code_id, then stop is a metro station door/exit, it is not a bus stop
+    busStop_df = busStop_df[busStop_df["stop_id"].astype(str) == busStop_df["stop_code"].astype(str)]
+    stops_x, stops_y = net.convertLonLat2XY(busStop_df.geometry.x.to_numpy(), busStop_df.geometry.y.to_numpy())
+    # Get each edge that allows buses near every bus stop, in one query
+    stopsEdges = netHandler.getClosestEdgesOfPoints(net, stops_x, stops_y, radius=500, allows="bus")
 
-        # Get each edge that allows buses near the bus stop
-        edges = netHandler.getClosestEdges(net, lon, lat, radius=500, allows="bus", geoCoords=True)
+    # Get each bus stop point and a SUMO busStop element for each of them
+    for routes_id, stop_x, stop_y, edges in zip(busStop_df["route_id"], stops_x, stops_y, stopsEdges):
         for edge in edges:
             # Check if lane has a bus stop already and the bus can fit
             if edge and not (edge.getLane(idx=0).getID() in stopLanes) and edge.getLane(idx=0).getLength() > netHandler.sizeOfBus + netHandler.edgeMargin:
@@ -71,7 +66,7 @@ if __name__ == "__main__":
                 busStopElem.append(ET.Element("param",{"key":"routes_id","value":"%s" % routes_id}))
                 busStopElem.append(ET.Element("param",{"key":"position","value":"%f %f" % (stop_x, stop_y)}))
                 root.append(busStopElem)
-                stopLanes += [lane.getID()]
+                stopLanes.add(lane.getID())
                 if options.verbose:
                     stopsDone += 1
                     verbose.writeToConsole(verboseValue=stopsDone)
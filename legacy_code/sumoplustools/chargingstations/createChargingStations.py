@@ -1,11 +1,11 @@
 import os, sys
 import argparse
-import sumolib
 from xml.etree import ElementTree as ET
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools import netHandler
 from sumoplustools import verbose
+from sumoplustools import netCache
 
 def getWattage(level, connector="", network=""):
     watts = {
@@ -104,7 +104,7 @@ if __name__ == "__main__":
 
     global laneDetails
     laneDetails = {}
-    net = sumolib.net.readNet(options.net_file)
+    net = netCache.readNet(options.net_file)
 
     if options.json:
         import json
@@ -123,6 +123,8 @@ if __name__ == "__main__":
         import pandas as pd
         df = pd.read_csv(options.charging_stations)
 
+        # Closest lane of every station, in one query
+        lanes = netHandler.getClosestLaneOfPoints(net, df["Longitude"].astype(float).to_numpy(), df["Latitude"].astype(float).to_numpy(), 100, geoCoords=True)
         for i in range(len(df)):
             try:
                 lv1 = int(df.loc[i, "EV Level1 EVSE Num"])
@@ -141,7 +143,7 @@ if __name__ == "__main__":
             network = df.loc[i, "EV Network"]
             connector = df.loc[i, "EV Connector Types"]
 
-            lane = netHandler.getClosestLane(net, lon, lat, 100, geoCoords=True)
+            lane = lanes[i]
             if lane is None:
                 continue
             lane = lane.getID()
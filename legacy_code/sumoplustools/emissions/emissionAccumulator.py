@@ -0,0 +1,121 @@
+import numpy as np
+
+class EmissionAccumulator():
+    """
+    Sums emission outputs per (street, vehicle) pair over an interval.
+
+    Streets and vehicles are interned to integers and each pair is a row of a float64 matrix, grown by doubling,
+    where the outputs of a step are added with np.add.at. The pairs are found with a sorted array of their
+    keys (street << 32 | vehicle) instead of a dict lookup per vehicle.
+
+    Parameters
+    ----------
+    width : int
+        Number of emission outputs of each pair
+
+    streets : list
+        Street ids whose index is the street code given to add. Streets are interned as they are met if omitted
+
+    capacity : int
+        Initial number of rows of the matrix
+    """
+    def __init__(self, width, streets: list=None, capacity: int=1024):
+        self.width = width
+        self.streets = list(streets) if streets else []
+        self._streetIndex = {street: i for i, street in enumerate(self.streets)}
+        self._capacity = capacity
+        self.reset()
+
+    def reset(self):
+        """Forgets the sums and the vehicles, the streets are kept"""
+        self._vehicleIndex = {}
+        self.sums = np.zeros((self._capacity, self.width), dtype=np.float64)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._keyRows = np.empty(0, dtype=np.int64)
+        self._rowKeys = np.empty(self._capacity, dtype=np.int64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def streetCode(self, street) -> int:
+        code = self._streetIndex.get(street)
+        if code is None:
+            code = self._streetIndex[street] = len(self.streets)
+            self.streets.append(street)
+        return code
+
+    def vehicleCodes(self, vehicles) -> np.ndarray:
+        # A new vehicle gets the next code, dicts keep the order of insertion so the codes index list(_vehicleIndex)
+        index = self._vehicleIndex
+        setdefault = index.setdefault
+        return np.array([setdefault(vehicle, len(index)) for vehicle in vehicles], dtype=np.int64)
+
+    def _grow(self, size):
+        capacity = len(self.sums)
+        while capacity < size:
+            capacity *= 2
+        if capacity != len(self.sums):
+            sums = np.zeros((capacity, self.width), dtype=np.float64)
+            sums[:self.size] = self.sums[:self.size]
+            self.sums = sums
+            rowKeys = np.empty(capacity, dtype=np.int64)
+            rowKeys[:self.size] = self._rowKeys[:self.size]
+            self._rowKeys = rowKeys
+
+    def _rows(self, keys) -> np.ndarray:
+        positions = np.searchsorted(self._keys, keys)
+        found = positions < len(self._keys)
+        found[found] = self._keys[positions[found]] == keys[found]
+        if not found.all():
+            newKeys = np.unique(keys[~found])
+            self._grow(self.size + len(newKeys))
+            newRows = np.arange(self.size, self.size + len(newKeys), dtype=np.int64)
+            self._rowKeys[newRows] = newKeys
+            self.size += len(newKeys)
+            at = np.searchsorted(self._keys, newKeys)
+            self._keys = np.insert(self._keys, at, newKeys)
+            self._keyRows = np.insert(self._keyRows, at, newRows)
+            positions = np.searchsorted(self._keys, keys)
+        return self._keyRows[positions]
+
+    def add(self, streetCodes, vehicles, outputs):
+        """
+        Adds the outputs of a step.
+
+        Parameters
+        ----------
+        streetCodes : numpy.ndarray
+            Street code of each vehicle, see streetCode
+
+        vehicles : list
+            Vehicle ids
+
+        outputs : numpy.ndarray
+            One row of width outputs per vehicle
+        """
+        if len(vehicles) == 0:
+            return
+        keys = (np.asarray(streetCodes, dtype=np.int64) << 32) | self.vehicleCodes(vehicles)
+        # Rows first, the matrix may grow
+        rows = self._rows(keys)
+        np.add.at(self.sums, rows, outputs)
+
+    def addOne(self, street, vehicle, outputs):
+        self.add(np.array([self.streetCode(street)]), [vehicle], np.asarray(outputs, dtype=np.float64).reshape(1, self.width))
+
+    def toArrays(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Returns the street codes, the vehicle ids and the sums of every pair, as columns
+        """
+        keys = self._rowKeys[:self.size]
+        vehicles = np.asarray(list(self._vehicleIndex), dtype=object)[keys & 0xFFFFFFFF] if self.size else np.empty(0, dtype=object)
+        return keys >> 32, vehicles, self.sums[:self.size]
+
+    def toColumns(self) -> dict:
+        """
+        Returns the street ids, the vehicle ids and the sums of every pair, as columns
+        """
+        streetCodes, vehicles, sums = self.toArrays()
+        streets = np.asarray(self.streets, dtype=object)[streetCodes] if self.size else np.empty(0, dtype=object)
+        return {"streets": streets, "vehicles": vehicles, "sums": sums}
@@ -113,6 +113,41 @@ def splitEmissionFile(filepath):
         nf.close()
     return nf_path
 
+def _findBytes(f, pattern, position, blockSize=2**20):
+    """Returns the offset of the first pattern at or after position, None if there is none"""
+    f.seek(position)
+    overlap = b""
+    while True:
+        block = f.read(blockSize)
+        if not block:
+            return None
+        data = overlap + block
+        index = data.find(pattern)
+        if index >= 0:
+            return position - len(overlap) + index
+        position += len(block)
+        overlap = data[-(len(pattern) - 1):]
+
+def getEmissionFileShards(filepath, shardSize=2**27) -> list:
+    """
+    Splits the emission file by byte offsets without rewriting it.
+    Returns a list of (start, end) offsets of about shardSize bytes, every shard starting at a <timestep> tag and holding whole timesteps
+    """
+    size = os.path.getsize(os.path.abspath(filepath))
+    starts = []
+    with open(filepath, "rb") as f:
+        position = 0
+        while position < size:
+            start = _findBytes(f, b"<timestep", position)
+            if start is None:
+                break
+            starts.append(start)
+            position = start + shardSize
+        if len(starts) == 0:
+            return []
+        end = _findBytes(f, b"</emission-export>", starts[-1])
+    return list(zip(starts, starts[1:] + [size if end is None else end]))
+
 def getNextEmissionFile(filepath, index):
     filename = os.path.splitext(os.path.basename(filepath))[0]
     if not os.path.exists(os.path.join(_EMISION_FOLDER, filename + "_" + str(index) + ".xml")):
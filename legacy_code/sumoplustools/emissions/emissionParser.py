@@ -0,0 +1,179 @@
+from operator import itemgetter
+from xml.parsers import expat
+import numpy as np
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Emission attributes of the vehicles, in the column order of EmissionStep.emissions
+EMISSION_ATTRIBUTES = ["fuel", "CO2", "CO", "HC", "NOx", "PMx"]
+PARSERS = ["expat", "lxml"]
+_CHUNK_SIZE = 1 << 20
+# Root element wrapped around the timesteps of a shard
+_SHARD_HEAD = b"<emission-export>\n"
+_SHARD_TAIL = b"</emission-export>\n"
+
+class EmissionStep():
+    """
+    Vehicles of one timestep of a SUMO emission-output, as columns.
+
+    Attributes
+    ----------
+    time : float
+        Time of the step
+
+    ids : list
+        Vehicle ids
+
+    lanes : list
+        Lane of each vehicle
+
+    x, y : numpy.ndarray
+        Network coordinates of each vehicle
+
+    emissions : numpy.ndarray
+        One row per vehicle and one column per attribute of EMISSION_ATTRIBUTES
+    """
+    def __init__(self, time, ids, lanes, x, y, emissions):
+        self.time = time
+        self.ids = ids
+        self.lanes = lanes
+        self.x = x
+        self.y = y
+        self.emissions = emissions
+
+    def __len__(self):
+        return len(self.ids)
+
+class ShardReader():
+    """
+    Binary file object reading the bytes [start, end[ of an emission-output, see emissionIO.getEmissionFileShards.
+    The timesteps of the shard are wrapped in a root element so that they parse as a document
+    """
+    def __init__(self, xmlFile, start, end):
+        self.file = open(xmlFile, "rb")
+        self.file.seek(start)
+        self.remaining = end - start
+        self.head = _SHARD_HEAD
+        self.tail = _SHARD_TAIL
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.head) + self.remaining + len(self.tail)
+        data = self.head[:size]
+        self.head = self.head[len(data):]
+        if len(data) < size and self.remaining > 0:
+            chunk = self.file.read(min(size - len(data), self.remaining))
+            self.remaining = self.remaining - len(chunk) if chunk else 0
+            data += chunk
+        if len(data) < size and self.remaining == 0:
+            tail = self.tail[:size - len(data)]
+            self.tail = self.tail[len(tail):]
+            data += tail
+        return data
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def _openSource(xmlFile, start, end):
+    if start is None:
+        return open(xmlFile, "rb")
+    return ShardReader(xmlFile, start, end)
+
+def _toStep(time, ids, lanes, xs, ys, values) -> EmissionStep:
+    # The attributes are kept as strings and converted once per step by numpy
+    return EmissionStep(time, ids, lanes, np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64),
+                        np.array(values, dtype=np.float64).reshape(len(ids), len(EMISSION_ATTRIBUTES)))
+
+def _iterExpat(xmlFile, chunkSize, start, end):
+    getEmissions = itemgetter(*EMISSION_ATTRIBUTES)
+    steps = []
+    current = None
+
+    def startElement(name, attrs):
+        nonlocal current
+        if name == "vehicle":
+            if current is not None:
+                current[1].append(attrs["id"])
+                current[2].append(attrs["lane"])
+                current[3].append(attrs["x"])
+                current[4].append(attrs["y"])
+                current[5].extend(getEmissions(attrs))
+        elif name == "timestep":
+            current = (float(attrs["time"]), [], [], [], [], [])
+
+    def endElement(name):
+        nonlocal current
+        if name == "timestep":
+            steps.append(_toStep(*current))
+            current = None
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = startElement
+    parser.EndElementHandler = endElement
+    with _openSource(xmlFile, start, end) as f:
+        while True:
+            chunk = f.read(chunkSize)
+            parser.Parse(chunk, not chunk)
+            for step in steps:
+                yield step
+            steps.clear()
+            if not chunk:
+                break
+
+def _iterLxml(xmlFile, start, end):
+    getEmissions = itemgetter(*EMISSION_ATTRIBUTES)
+    with _openSource(xmlFile, start, end) as f:
+        for _, elem in etree.iterparse(f, events=("end",), tag="timestep"):
+            ids, lanes, xs, ys, values = [], [], [], [], []
+            for vehicle in elem.iterchildren("vehicle"):
+                attrs = vehicle.attrib
+                ids.append(attrs["id"])
+                lanes.append(attrs["lane"])
+                xs.append(attrs["x"])
+                ys.append(attrs["y"])
+                values.extend(getEmissions(attrs))
+            yield _toStep(float(elem.get("time")), ids, lanes, xs, ys, values)
+
+            # Free the parsed steps, the root would otherwise keep every one of them
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+def iterEmissionSteps(xmlFile, parser: str="expat", chunkSize: int=_CHUNK_SIZE, start: int=None, end: int=None):
+    """
+    Streams the timesteps of a SUMO emission-output file without building its tree.
+
+    Parameters
+    ----------
+    xmlFile : str
+        Path of the emission-output file
+
+    parser : str
+        "expat" (standard library, reads the file by chunks of chunkSize bytes) or "lxml" (iterparse filtered on the timesteps)
+
+    chunkSize : int
+        Bytes read at a time by the expat parser
+
+    start, end : int
+        Byte offsets of a shard of the file, see emissionIO.getEmissionFileShards. The whole file is parsed if omitted
+
+    Returns
+    -------
+    Iterator of EmissionStep, in the order of the file
+    """
+    if parser == "expat":
+        return _iterExpat(xmlFile, chunkSize, start, end)
+    if parser == "lxml":
+        if etree is None:
+            raise ImportError("the lxml parser needs the lxml package")
+        return _iterLxml(xmlFile, start, end)
+    raise ValueError('unknown parser "%s", use one of %s' % (parser, PARSERS))
@@ -1,14 +1,17 @@
 import os, sys
 import numpy as np
 from datetime import timedelta
-from xml.etree import ElementTree as ET
 import sumolib
 import geopandas as gpd
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools.emissions import emissionIO as eio
+from sumoplustools.emissions.emissionParser import iterEmissionSteps, EMISSION_ATTRIBUTES, PARSERS
+from sumoplustools.emissions.emissionAccumulator import EmissionAccumulator
 from sumoplustools.postgresql.psqlObjects import EmissionConnection
+from sumoplustools.netHandler import LaneToStreet
 from sumoplustools import verbose
+from sumoplustools import netCache
 
 class EmissionGenerator():
     # Global
@@ -22,15 +25,20 @@ class EmissionGenerator():
         self.sqlConnection = EmissionConnection()
         self.net = net
         self.mapNetToDF = self.sqlConnection.getNetToDFMap()
+        self.laneToStreet = LaneToStreet(net, self.mapNetToDF)
 
-        self._resetResolutionBuffer()
-        self._sql_buffer = []
+        self.runID = None
+        # Sums of the current interval per street and vehicle, in the order of eColumns
+        self._resolution_buffer = EmissionAccumulator(len(self.sqlConnection.eColumns), self.laneToStreet.streets)
+        self._resetSQLBuffer()
 
     def _resetResolutionBuffer(self):
-        self._resolution_buffer = {}
+        self._resolution_buffer.reset()
 
     def _resetSQLBuffer(self):
+        # Dataframes of the intervals not saved yet
         self._sql_buffer = []
+        self._sql_rows = 0
 
     def addOutputs(self, veh_id, edge_id, emission_output):
         """
@@ -47,12 +55,27 @@ class EmissionGenerator():
         emission_outputs : dict
             Names of outputs associated with their numerical value
         """
-        key = (self.mapNetToDF[edge_id], veh_id)
-        if key in self._resolution_buffer:
-            for eType in self._resolution_buffer[key]:
-                self._resolution_buffer[key][eType] += emission_output[eType]
-        else:
-            self._resolution_buffer[key] = emission_output
+        self.addStreetOutputs(veh_id, self.mapNetToDF[edge_id], emission_output)
+
+    def addStreetOutputs(self, veh_id, osm_id, emission_output):
+        """
+        Accumulates the outputs of the emissions per vehicle per street, see addOutputs
+        """
+        self._resolution_buffer.addOne(osm_id, veh_id, [emission_output[eType] for eType in self.sqlConnection.eColumns])
+
+    def addStep(self, step, stepLength):
+        """
+        Accumulates the outputs of the vehicles of a parsed timestep that consume fuel.
+
+        Parameters
+        ----------
+        step : EmissionStep
+            Timestep of the emission file, see emissionParser
+
+        stepLength : float
+            Time difference between two steps
+        """
+        _addStep(self._resolution_buffer, self.laneToStreet, step, stepLength)
 
     def saveToSQL(self, time, force=False):
         '''
@@ -67,27 +90,50 @@ class EmissionGenerator():
             Whether to force the save and ignore if full
         '''
         time = self.sqlConnection.initalDate + timedelta(seconds=time)
-        for key, value in self._resolution_buffer.items():
-            self._sql_buffer.append({self.sqlConnection.keyColumns[0]:time,self.sqlConnection.keyColumns[1]:key[0],self.sqlConnection.keyColumns[2]:key[1], **value})
+        if len(self._resolution_buffer) > 0:
+            # Built from the columns of the accumulator, run and time are broadcast to every row
+            columns = self._resolution_buffer.toColumns()
+            sql_df = gpd.pd.DataFrame({self.sqlConnection.runColumn:self.runID, self.sqlConnection.keyColumns[0]:time,
+                                       self.sqlConnection.keyColumns[1]:columns["streets"], self.sqlConnection.keyColumns[2]:columns["vehicles"],
+                                       **dict(zip(self.sqlConnection.eColumns, columns["sums"].T))})
+            self._sql_buffer.append(sql_df)
+            self._sql_rows += len(sql_df)
         
-        if len(self._sql_buffer) / (10**3) >= 100 or force: # self._sql_buffer.memory_usage(deep=True).sum() / (10**6) >= 5 self._sql_buffer.shape[0] / (10**3) >= 40
-            sql_df = gpd.pd.DataFrame.from_dict(self._sql_buffer)
-            self.sqlConnection.insertDataFrame(sql_df, self.sqlConnection.eTable)
+        if self._sql_rows / (10**3) >= 100 or (force and self._sql_buffer):
+            self.sqlConnection.insertEmissions(gpd.pd.concat(self._sql_buffer, ignore_index=True))
             self._resetSQLBuffer()
         self._resetResolutionBuffer()
     
     def clearSQLEmissions(self):
         self.sqlConnection.clearEmissionsTable()
 
+    def startRun(self, runID):
+        """
+        Saves the following emissions under the run, see SQLConnection.createRun
+
+        Parameters
+        ----------
+        runID : int
+            Id of the run
+        """
+        self.sqlConnection.startRun(runID)
+        self.runID = runID
+
     def saveToDataFrame(self, eTypes, filename, fromTime=None, toTime=None) -> gpd.GeoDataFrame:
-        df = self.sqlConnection.get_eTableDF_osm(eTypes=eTypes, fromTime=fromTime, toTime=toTime)
+        df = self.sqlConnection.get_eTableDF_osm(eTypes=eTypes, fromTime=fromTime, toTime=toTime, runID=self.runID)
         eio.saveDataFrame(df, filename)
         return df
 
 
+    def getEdgeID(self, laneID, x, y) -> str:
+        """
+        Returns the edge of the lane, see netHandler.LaneToStreet
+        """
+        return self.laneToStreet.getEdgeID(laneID, x, y)
+
     def collectEmissions(self, fromStep, toStep, timeInterval, stepLength, eTypes, xmlSource):
         """
-        Parses the XML Element Tree iterator and collects the emission data, saving it as numpy arrays to a temporary folder.\n
+        Collects the emission data of the parsed timesteps and saves it to the database.\n
         The file parses steps starting at fromStep and ending at toStep (not included).
 
         If the file starts at a time after fromStep, then data will only be collected from the initial file time.\n
@@ -111,21 +157,13 @@ class EmissionGenerator():
             List of strings containing the emission types that will be collected.
         
         xmlSource : Iterator
-            Iterator containing the XML Element Tree
+            Iterator of the EmissionStep of the file, see emissionParser.iterEmissionSteps
         """
-        def getSecond(arr):
-            return arr[1]
-        
         time = lastTime = fromStep
         
-        for _, elem in xmlSource:
-            if elem.tag != "timestep":
-                continue
-            
-            time = float(elem.get("time"))
+        for step in xmlSource:
+            time = step.time
             if time < fromStep:
-                elem.clear()
-                del elem
                 continue
             if time >= toStep:
                 break
@@ -134,55 +172,127 @@ class EmissionGenerator():
             if time - lastTime == timeInterval:
                 self.saveToSQL(lastTime)
                 lastTime = time
-           
-            for vehicle in elem.findall('vehicle'):
-                vehID = vehicle.attrib["id"]
-                fuel_output = float(vehicle.attrib["fuel"]) * stepLength
-
-                if fuel_output > 0.00:
-                    CO2_output = float(vehicle.attrib["CO2"]) * stepLength
-                    CO_output = float(vehicle.attrib["CO"]) * stepLength
-                    HC_output = float(vehicle.attrib["HC"]) * stepLength
-                    NOx_output = float(vehicle.attrib["NOx"]) * stepLength
-                    PMx_output = float(vehicle.attrib["PMx"]) * stepLength
-                    emission_output = {'Fuel':fuel_output, 'CO2':CO2_output, 'CO':CO_output, 'HC':HC_output, 'NOx':NOx_output, 'PMx':PMx_output}
-
-                    laneID = vehicle.attrib["lane"]
-                    if laneID[0] == ":":
-                        # vehicle is on a junction
-                        x = float(vehicle.attrib["x"])
-                        y = float(vehicle.attrib["y"])
-                        edges = []
-                        radius = 10
-                        while len(edges) == 0:
-                            edges = self.net.getNeighboringEdges(x, y, radius)
-                            radius *= 10
-                        
-                        closestEdge, _ = sorted(edges, key=getSecond)[0]
-                        edgeID = closestEdge.getID()
-                    else:
-                        # vehicle is on a street
-                        laneObj = self.net.getLane(laneID)
-                        edgeObj = laneObj.getEdge()
-                        edgeID = edgeObj.getID()
-                    
-                    self.addOutputs(vehID, edgeID, emission_output)
-
-            elem.clear()
-            del elem
+
+            self.addStep(step, stepLength)
         del xmlSource
 
         if time < fromStep:
-            raise Exception("No emissions between times %.2f - %.2f" % (fromStep. toStep))
+            raise Exception("No emissions between times %.2f - %.2f" % (fromStep, toStep))
         
         # Source does not have enough steps to complete an interval, so the partial interval is saved
         if time != lastTime and time <= toStep:
             self.saveToSQL(lastTime)
+        # Saves the interval still in the buffer, the steps of time == lastTime, then the rows waiting for SQL
+        if len(self._resolution_buffer):
+            self.saveToSQL(lastTime)
+        self.saveToSQL(lastTime, force=True)
+
+    def collectEmissionsParallel(self, fromStep, toStep, timeInterval, stepLength, eTypes, xmlFile, netFile, processes=None, parser="expat", shardSize=2**27):
+        """
+        Collects the emission data like collectEmissions, parsing the shards of the file in a pool of processes.\n
+        Each process sums the emissions of its shard per interval, street and vehicle. Shards are merged in the order of the file,
+        and an interval is saved once a later shard starts after it, so that only the interval split between two shards is kept
+        until its sums are added together.
+
+        Parameters
+        ----------
+        fromStep, toStep, timeInterval, stepLength, eTypes
+            See collectEmissions
+
+        xmlFile : str
+            Path of the emission-output file
+
+        netFile : str
+            Path of the SUMO network file, read once by each process
+
+        processes : int
+            Number of processes, the number of cores if omitted
+
+        parser : str
+            Parser of the shards, see emissionParser.iterEmissionSteps
+
+        shardSize : int
+            Approximate size in bytes of the shards, see emissionIO.getEmissionFileShards
+        """
+        import multiprocessing
+
+        shards = eio.getEmissionFileShards(xmlFile, shardSize)
+        tasks = [(xmlFile, start, end, parser, fromStep, toStep, timeInterval, stepLength) for start, end in shards]
+        # Accumulators of the intervals not saved yet, only the one spanning the end of the last shard between shards
+        intervals = {}
+        lastInterval = None
+        with multiprocessing.Pool(processes, initializer=_initShardWorker, initargs=(netFile, self.mapNetToDF)) as pool:
+            # In the order of the file, the steps of a shard come after those of the shards before it
+            for shardSums in pool.imap(_collectShard, tasks):
+                for interval, streetCodes, vehicles, sums in shardSums:
+                    if interval not in intervals:
+                        intervals[interval] = EmissionAccumulator(len(self.sqlConnection.eColumns), self.laneToStreet.streets)
+                    intervals[interval].add(streetCodes, vehicles, sums)
+                if not shardSums:
+                    continue
+                # The next shards start in the last interval of this one, the intervals before it are complete
+                lastInterval = max(interval for interval, *_ in shardSums)
+                for interval in sorted(interval for interval in intervals if interval < lastInterval):
+                    self._saveInterval(interval, intervals.pop(interval))
+
+        if lastInterval is None:
+            raise Exception("No emissions between times %.2f - %.2f" % (fromStep, toStep))
+
+        for interval in sorted(intervals):
+            self._saveInterval(interval, intervals.pop(interval))
+        # Saves the rows still waiting for SQL
+        self.saveToSQL(lastInterval, force=True)
+
+    def _saveInterval(self, interval, accumulator: EmissionAccumulator):
+        # Saves the sums of an interval of collectEmissionsParallel through the resolution buffer
+        buffer = self._resolution_buffer
+        self._resolution_buffer = accumulator
+        try:
+            self.saveToSQL(interval)
+        finally:
+            self._resolution_buffer = buffer
 
     def close(self):
         eio.removeProjectTempFolder()
         self.sqlConnection.close()
 
+# Lane to street table of a process of collectEmissionsParallel
+_shardLaneToStreet = None
+
+def _initShardWorker(netFile, mapNetToDF):
+    global _shardLaneToStreet
+    _shardLaneToStreet = LaneToStreet(netCache.readNet(netFile), mapNetToDF)
+
+def _addStep(accumulator: EmissionAccumulator, laneToStreet: LaneToStreet, step, stepLength):
+    # Columns ordered as _MAP_ETYPE_TO_INDEX
+    outputs = step.emissions * stepLength
+    rows = np.flatnonzero(outputs[:, 0] > 0.00)
+    if len(rows) == 0:
+        return
+    lanes = [step.lanes[i] for i in rows.tolist()]
+    streets = laneToStreet.getStreetIndexes(lanes, step.x[rows], step.y[rows])
+    if (streets < 0).any():
+        # Edge missing from NetToDF
+        raise KeyError(laneToStreet.getEdgeID(lanes[int(np.argmax(streets < 0))]))
+    accumulator.add(streets, [step.ids[i] for i in rows.tolist()], outputs[rows])
+
+def _collectShard(task) -> list:
+    """
+    Sums the emissions of the steps of one shard between fromStep and toStep.
+    Returns a list of (start of the interval, street codes, vehicle ids, sums), see EmissionAccumulator.toArrays
+    """
+    xmlFile, start, end, parser, fromStep, toStep, timeInterval, stepLength = task
+    intervals = {}
+    for step in iterEmissionSteps(xmlFile, parser, start=start, end=end):
+        if step.time < fromStep or step.time >= toStep:
+            continue
+        # Same intervals as collectEmissions, [fromStep + k * timeInterval, fromStep + (k + 1) * timeInterval[
+        interval = fromStep + np.floor((step.time - fromStep) / timeInterval + 1e-9) * timeInterval
+        if interval not in intervals:
+            intervals[interval] = EmissionAccumulator(len(EMISSION_ATTRIBUTES), _shardLaneToStreet.streets)
+        _addStep(intervals[interval], _shardLaneToStreet, step, stepLength)
+    return [(interval, *accumulator.toArrays()) for interval, accumulator in intervals.items()]
+
 def generateEmissionDataFrame(net: sumolib.net.Net, fromStep, toStep, timeInterval, stepLength, eTypes, xmlSource, filename=None):
     """
     Convenience function to create EmissinoGeneration object and call collectEmissions and saveDataFrame methods
@@ -192,24 +302,22 @@ def generateEmissionDataFrame(net: sumolib.net.Net, fromStep, toStep, timeInterv
     emissions.saveToDataFrame(fromTime=fromTime, toTime=toTime, eTypes=eTypes, filename=filename)
     emissions.close()
 
-def getFirstEmissionTime(xmlFile) -> float:
-    source = ET.iterparse(xmlFile)
-    for _, elem in source:
-        if elem.tag == "timestep":
-            return float(elem.get("time"))
-    del source
+def getFirstEmissionTime(xmlFile, parser: str="expat") -> float:
+    source = iterEmissionSteps(xmlFile, parser)
+    for step in source:
+        source.close()
+        return step.time
     raise Exception("Cannot locate first time step")
         
 
-def getStepLength(xmlFile) -> float:
+def getStepLength(xmlFile, parser: str="expat") -> float:
     times = []
-    source = ET.iterparse(xmlFile)
-    for _, elem in source:
-        if elem.tag == "timestep":
-            times += [float(elem.get("time"))]
+    source = iterEmissionSteps(xmlFile, parser)
+    for step in source:
+        times += [step.time]
         if len(times) > 1:
+            source.close()
             return times[1] - times[0]
-    del source
     return 0.0
 
 if __name__ == "__main__":
@@ -243,6 +351,12 @@ if __name__ == "__main__":
         argParser.add_argument("-i", "--time-interval",
                                 metavar='INT[:INT:INT]', type=str,
                                 help="save the emissions every interval. Can be in seconds or with format of 'hr:min:sec'. Interval equals 1 timestep if omitted")
+        argParser.add_argument("-p", "--parser",
+                                choices=PARSERS, default="expat",
+                                help="XML parser of the emission file, lxml needs the lxml package. Uses expat if omitted")
+        argParser.add_argument("-j", "--processes",
+                                metavar="INT", type=int, default=1,
+                                help="parses shards of the emission file in INT processes, 0 for one per core. Parses the whole file in this process if omitted")
         argParser.add_argument("-v", "--verbose",
                                 action='store_true', default=False,
                                 help="gives a description of the current task")
@@ -260,7 +374,7 @@ if __name__ == "__main__":
         verbose.writeToConsole()
     # Set net file
     try:
-        net = sumolib.net.readNet(options.net_file)
+        net = netCache.readNet(options.net_file)
     except ValueError:
         argParser.error('could not read "%s" as a SUMO network file' % os.path.abspath(options.net_file))
     if options.verbose:
@@ -274,8 +388,8 @@ if __name__ == "__main__":
         except KeyError:
             argParser.error('emission type of "%s" is not a valid emission' % str(eType))
     try:
-        xmlIter = ET.iterparse(options.emission_file)
-        step_length = getStepLength(options.emission_file)
+        xmlIter = iterEmissionSteps(options.emission_file, options.parser)
+        step_length = getStepLength(options.emission_file, options.parser)
     except FileNotFoundError:
         argParser.error('could not locate emission file "%s"' % os.path.abspath(options.emission_file))
 
@@ -290,7 +404,7 @@ if __name__ == "__main__":
             except IndexError:
                 argParser.error("--start-time is not in the correct format")
     else:
-        fromTime = getFirstEmissionTime(options.emission_file)
+        fromTime = getFirstEmissionTime(options.emission_file, options.parser)
 
     # Set end time
     # Using to end
@@ -340,6 +454,8 @@ if __name__ == "__main__":
         argParser.error("step interval cannot be less than 0")
     if timeInterval > toTime - fromTime:
         argParser.error("step interval greater than total time elapsed")
+    if options.processes < 0:
+        argParser.error("the number of processes cannot be less than 0")
     if timeInterval % step_length != 0:
         argParser.error('cannot have a time interval of "%.2f" if the time between steps is %.2f' % (timeInterval, step_length))
     
@@ -347,13 +463,19 @@ if __name__ == "__main__":
     if options.verbose:
         verbose.writeToConsole(done=True)
     emissions = EmissionGenerator(net)
-    emissions.clearSQLEmissions()
+    runID = emissions.sqlConnection.createRun(configFile=os.path.abspath(options.emission_file))
+    emissions.startRun(runID)
     if options.verbose:
         verbose.writeToConsole(done=True)
-    emissions.collectEmissions(fromStep=fromTime, toStep=toTime, timeInterval=timeInterval, stepLength=step_length, eTypes=eTypes, xmlSource=xmlIter)
+    if options.processes == 1:
+        emissions.collectEmissions(fromStep=fromTime, toStep=toTime, timeInterval=timeInterval, stepLength=step_length, eTypes=eTypes, xmlSource=xmlIter)
+    else:
+        emissions.collectEmissionsParallel(fromStep=fromTime, toStep=toTime, timeInterval=timeInterval, stepLength=step_length, eTypes=eTypes,
+                                           xmlFile=options.emission_file, netFile=options.net_file, processes=options.processes or None, parser=options.parser)
     if options.verbose:
         verbose.writeToConsole(done=True)
     emissions.saveToDataFrame(fromTime=fromTime, toTime=toTime, eTypes=eTypes, filename=options.output_file)
+    emissions.sqlConnection.finishRun(runID)
     if options.verbose:
         verbose.writeToConsole(done=True)
 
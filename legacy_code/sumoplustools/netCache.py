@@ -0,0 +1,635 @@
+import os, sys
+import argparse
+import gc
+import hashlib
+import heapq
+import json
+import shutil
+import tempfile
+import time
+import numpy as np
+import sumolib
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from sumoplustools.netHandler import GeoConverter
+from sumoplustools import spatialIndex
+
+# Bumped when the arrays of a snapshot change, older snapshots are built again
+FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "sumoplustools", "nets")
+_CHUNK_SIZE = 1 << 24
+_META_FILE = "meta.json"
+# Hash of each network file by path, with the size and modification time it was computed for
+_HASH_INDEX_FILE = "hashes.json"
+
+def getFileHash(filename) -> str:
+    """Returns the sha1 of the content of the file"""
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def _getCachedFileHash(filename, cacheDir) -> str:
+    # Hashing a large network takes about a second, it is skipped while the size and modification time are the same
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    indexFile = os.path.join(cacheDir, _HASH_INDEX_FILE)
+    try:
+        with open(indexFile) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    entry = index.get(path)
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+        return entry["hash"]
+
+    fileHash = getFileHash(path)
+    index[path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": fileHash}
+    tmpFile = indexFile + ".%i" % os.getpid()
+    with open(tmpFile, "w") as f:
+        json.dump(index, f)
+    os.replace(tmpFile, indexFile)
+    return fileHash
+
+def _writeStrings(filename, strings):
+    # Ids never hold a line break, the strings are joined by one and split back when read
+    np.save(filename, np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8))
+
+def _readStrings(filename, count) -> list:
+    if count == 0:
+        return []
+    return np.load(filename, mmap_mode="r").tobytes().decode("utf-8").split("\n")
+
+class _LazyArrays():
+    """Arrays of a snapshot by name, memory-mapped when first used"""
+    def __init__(self, snapshotDir):
+        self.snapshotDir = snapshotDir
+        self._arrays = {}
+
+    def __getitem__(self, name) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.load(os.path.join(self.snapshotDir, name + ".npy"), mmap_mode="r")
+        return array
+
+class _Vocabulary():
+    """Codes of the repeated strings (types, functions, states, ...) of a snapshot, None is -1"""
+    def __init__(self):
+        self.strings = []
+        self._codes = {}
+
+    def code(self, string) -> int:
+        if string is None:
+            return -1
+        code = self._codes.get(string)
+        if code is None:
+            code = self._codes[string] = len(self.strings)
+            self.strings.append(string)
+        return code
+
+def _points(shapes) -> (np.ndarray, np.ndarray):
+    # Vertices of every shape, without z, and the index of the first vertex of each shape
+    starts = np.zeros(len(shapes) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum([len(shape) for shape in shapes])
+    points = np.array([point[:2] for shape in shapes for point in shape], dtype=np.float64).reshape(-1, 2)
+    return points, starts
+
+def buildSnapshot(net: sumolib.net.Net, snapshotDir, source: str=None):
+    """
+    Writes the network parsed by sumolib as the arrays of a snapshot in snapshotDir, see CachedNet.
+    The directory is written next to snapshotDir then renamed, so that a snapshot is never read half written
+    """
+    vocabulary = _Vocabulary()
+    nodes = net.getNodes()
+    nodeIndex = {node.getID(): i for i, node in enumerate(nodes)}
+    edges = net.getEdges()
+    lanes = [lane for edge in edges for lane in edge.getLanes()]
+    laneIndex = {lane.getID(): i for i, lane in enumerate(lanes)}
+    vClasses = sorted(set().union(*[lane.getPermissions() for lane in lanes]))
+    if len(vClasses) > 64:
+        raise ValueError("the network has more than 64 vehicle classes")
+    vClassBit = {vClass: np.uint64(1) << np.uint64(i) for i, vClass in enumerate(vClasses)}
+
+    arrays = {}
+    arrays["nodeType"] = np.array([vocabulary.code(node.getType()) for node in nodes], dtype=np.int32)
+    arrays["nodeCoord"] = np.array([node.getCoord()[:2] for node in nodes], dtype=np.float64).reshape(-1, 2)
+    arrays["nodeShapePoints"], arrays["nodeShapeStart"] = _points([node.getShape() for node in nodes])
+
+    arrays["edgeFrom"] = np.array([nodeIndex[edge.getFromNode().getID()] for edge in edges], dtype=np.int32)
+    arrays["edgeTo"] = np.array([nodeIndex[edge.getToNode().getID()] for edge in edges], dtype=np.int32)
+    arrays["edgeType"] = np.array([vocabulary.code(edge.getType()) for edge in edges], dtype=np.int32)
+    arrays["edgeFunction"] = np.array([vocabulary.code(edge.getFunction()) for edge in edges], dtype=np.int32)
+    arrays["edgeName"] = np.array([vocabulary.code(edge.getName()) for edge in edges], dtype=np.int32)
+    arrays["edgePriority"] = np.array([edge.getPriority() for edge in edges], dtype=np.int32)
+    arrays["edgeSpeed"] = np.array([edge.getSpeed() for edge in edges], dtype=np.float64)
+    arrays["edgeLength"] = np.array([edge.getLength() for edge in edges], dtype=np.float64)
+    arrays["edgeLaneStart"] = np.zeros(len(edges) + 1, dtype=np.int32)
+    arrays["edgeLaneStart"][1:] = np.cumsum([len(edge.getLanes()) for edge in edges])
+    arrays["edgeShapePoints"], arrays["edgeShapeStart"] = _points([edge.getShape() for edge in edges])
+
+    edgeIndex = {edge.getID(): i for i, edge in enumerate(edges)}
+    arrays["laneEdge"] = np.array([edgeIndex[lane.getEdge().getID()] for lane in lanes], dtype=np.int32)
+    arrays["laneIndex"] = np.array([lane.getIndex() for lane in lanes], dtype=np.int32)
+    arrays["laneSpeed"] = np.array([lane.getSpeed() for lane in lanes], dtype=np.float64)
+    arrays["laneLength"] = np.array([lane.getLength() for lane in lanes], dtype=np.float64)
+    arrays["laneWidth"] = np.array([lane.getWidth() for lane in lanes], dtype=np.float64)
+    arrays["lanePermissions"] = np.array([sum(vClassBit[vClass] for vClass in lane.getPermissions()) for lane in lanes], dtype=np.uint64)
+    arrays["laneShapePoints"], arrays["laneShapeStart"] = _points([lane.getShape() for lane in lanes])
+
+    # Connections ordered by from lane, the connections of lane i are [laneConnectionStart[i], laneConnectionStart[i+1][
+    connections = [connection for lane in lanes for connection in lane.getOutgoing() if connection.getToLane().getID() in laneIndex]
+    arrays["connectionFromLane"] = np.array([laneIndex[c.getFromLane().getID()] for c in connections], dtype=np.int32)
+    arrays["connectionToLane"] = np.array([laneIndex[c.getToLane().getID()] for c in connections], dtype=np.int32)
+    arrays["connectionVia"] = np.array([vocabulary.code(c.getViaLaneID() or None) for c in connections], dtype=np.int32)
+    arrays["connectionDirection"] = np.array([vocabulary.code(c.getDirection()) for c in connections], dtype=np.int32)
+    arrays["connectionState"] = np.array([vocabulary.code(c.getState()) for c in connections], dtype=np.int32)
+    arrays["connectionTLS"] = np.array([vocabulary.code(c.getTLSID()) for c in connections], dtype=np.int32)
+    arrays["connectionLinkIndex"] = np.array([c.getTLLinkIndex() for c in connections], dtype=np.int32)
+    arrays["laneConnectionStart"] = np.searchsorted(arrays["connectionFromLane"], np.arange(len(lanes) + 1)).astype(np.int64)
+
+    meta = {"version": FORMAT_VERSION, "source": source, "location": dict(net._location), "locationOffset": list(net.getLocationOffset()),
+            "boundary": list(net.getBoundary()), "vClasses": vClasses, "nodes": len(nodes), "edges": len(edges), "lanes": len(lanes),
+            "vocabulary": len(vocabulary.strings)}
+
+    parentDir = os.path.dirname(os.path.abspath(snapshotDir))
+    os.makedirs(parentDir, exist_ok=True)
+    tmpDir = tempfile.mkdtemp(dir=parentDir)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmpDir, name + ".npy"), array)
+        _writeStrings(os.path.join(tmpDir, "nodeIDs.npy"), [node.getID() for node in nodes])
+        _writeStrings(os.path.join(tmpDir, "edgeIDs.npy"), [edge.getID() for edge in edges])
+        _writeStrings(os.path.join(tmpDir, "laneIDs.npy"), [lane.getID() for lane in lanes])
+        _writeStrings(os.path.join(tmpDir, "vocabulary.npy"), vocabulary.strings)
+        with open(os.path.join(tmpDir, _META_FILE), "w") as f:
+            json.dump(meta, f)
+        if os.path.isdir(snapshotDir):
+            shutil.rmtree(snapshotDir)
+        os.replace(tmpDir, snapshotDir)
+    except BaseException:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        raise
+
+def _readMeta(snapshotDir) -> dict:
+    try:
+        with open(os.path.join(snapshotDir, _META_FILE)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == FORMAT_VERSION else None
+
+def readNet(netFile, cacheDir: str=DEFAULT_CACHE_DIR, rebuild: bool=False):
+    """
+    Returns the network of the SUMO .net.xml file as a CachedNet, read from the snapshot of the file.
+    The snapshot is built with sumolib.net.readNet the first time the file is read, or when its content changed.
+
+    Parameters
+    ----------
+    netFile : str
+        Path of the SUMO network file
+
+    cacheDir : str
+        Directory of the snapshots, one sub directory per file hash
+
+    rebuild : bool
+        Whether to build the snapshot again even if it exists
+    """
+    os.makedirs(cacheDir, exist_ok=True)
+    snapshotDir = os.path.join(cacheDir, _getCachedFileHash(netFile, cacheDir))
+    if rebuild or _readMeta(snapshotDir) is None:
+        buildSnapshot(sumolib.net.readNet(netFile), snapshotDir, source=os.path.abspath(netFile))
+    return CachedNet(snapshotDir)
+
+def _addEnds(points, starts, first, last) -> (np.ndarray, np.ndarray):
+    # Shapes with the point first[i] before and last[i] after the vertices of shape i
+    count = len(starts) - 1
+    owner = np.repeat(np.arange(count), np.diff(starts))
+    newStarts = starts + 2 * np.arange(count + 1)
+    newPoints = np.empty((len(points) + 2 * count, 2), dtype=np.float64)
+    newPoints[np.arange(len(points)) + 2 * owner + 1] = points
+    newPoints[newStarts[:-1]] = first
+    newPoints[newStarts[1:] - 1] = last
+    return newPoints, newStarts
+
+class CachedNode():
+    __slots__ = ("_net", "_index")
+
+    def __init__(self, net, index):
+        self._net = net
+        self._index = index
+
+    def getID(self) -> str:
+        return self._net._nodeIDs[self._index]
+
+    def getType(self) -> str:
+        return self._net._string(self._net._arrays["nodeType"][self._index])
+
+    def getCoord(self) -> tuple:
+        return tuple(self._net._arrays["nodeCoord"][self._index].tolist())
+
+    def getShape(self) -> list:
+        return self._net._shape("node", self._index)
+
+    def getIncoming(self) -> list:
+        return [self._net._edges[i] for i in np.nonzero(self._net._arrays["edgeTo"] == self._index)[0]]
+
+    def getOutgoing(self) -> list:
+        return [self._net._edges[i] for i in np.nonzero(self._net._arrays["edgeFrom"] == self._index)[0]]
+
+    def __repr__(self):
+        return '<junction id="%s"/>' % self.getID()
+
+class CachedConnection():
+    __slots__ = ("_net", "_index")
+
+    def __init__(self, net, index):
+        self._net = net
+        self._index = index
+
+    def _value(self, name):
+        return self._net._arrays[name][self._index]
+
+    def getFromLane(self):
+        return self._net._lanes[self._value("connectionFromLane")]
+
+    def getToLane(self):
+        return self._net._lanes[self._value("connectionToLane")]
+
+    def getFrom(self):
+        return self.getFromLane().getEdge()
+
+    def getTo(self):
+        return self.getToLane().getEdge()
+
+    def getViaLaneID(self) -> str:
+        return self._net._string(self._value("connectionVia"))
+
+    def getDirection(self) -> str:
+        return self._net._string(self._value("connectionDirection"))
+
+    def getState(self) -> str:
+        return self._net._string(self._value("connectionState"))
+
+    def getTLSID(self) -> str:
+        return self._net._string(self._value("connectionTLS"))
+
+    def getTLLinkIndex(self) -> int:
+        return int(self._value("connectionLinkIndex"))
+
+    def __repr__(self):
+        return '<connection from="%s" to="%s"/>' % (self.getFromLane().getID(), self.getToLane().getID())
+
+class CachedLane():
+    __slots__ = ("_net", "_index")
+
+    def __init__(self, net, index):
+        self._net = net
+        self._index = index
+
+    def _value(self, name):
+        return self._net._arrays[name][self._index]
+
+    def getID(self) -> str:
+        return self._net._laneIDs[self._index]
+
+    def getEdge(self):
+        return self._net._edges[self._value("laneEdge")]
+
+    def getIndex(self) -> int:
+        return int(self._value("laneIndex"))
+
+    def getSpeed(self) -> float:
+        return float(self._value("laneSpeed"))
+
+    def getLength(self) -> float:
+        return float(self._value("laneLength"))
+
+    def getWidth(self) -> float:
+        return float(self._value("laneWidth"))
+
+    def getShape(self, includeJunctions=False) -> list:
+        shape = self._net._shape("lane", self._index)
+        return self.getEdge()._withJunctions(shape) if includeJunctions else shape
+
+    def getPermissions(self) -> set:
+        return self._net._permissions(self._value("lanePermissions"))
+
+    def allows(self, vClass) -> bool:
+        return bool(self._value("lanePermissions") & self._net._vClassBit(vClass))
+
+    def getOutgoing(self) -> list:
+        start, end = self._net._arrays["laneConnectionStart"][self._index:self._index + 2]
+        return [CachedConnection(self._net, i) for i in range(start, end)]
+
+    def __repr__(self):
+        return '<lane id="%s"/>' % self.getID()
+
+class CachedEdge():
+    __slots__ = ("_net", "_index")
+
+    def __init__(self, net, index):
+        self._net = net
+        self._index = index
+
+    def _value(self, name):
+        return self._net._arrays[name][self._index]
+
+    def getID(self) -> str:
+        return self._net._edgeIDs[self._index]
+
+    @property
+    def _type(self) -> str:
+        return self.getType()
+
+    def getType(self) -> str:
+        return self._net._string(self._value("edgeType"))
+
+    def getFunction(self) -> str:
+        return self._net._string(self._value("edgeFunction"))
+
+    def getName(self) -> str:
+        return self._net._string(self._value("edgeName"))
+
+    def getPriority(self) -> int:
+        return int(self._value("edgePriority"))
+
+    def getSpeed(self) -> float:
+        return float(self._value("edgeSpeed"))
+
+    def getLength(self) -> float:
+        return float(self._value("edgeLength"))
+
+    def getFromNode(self) -> CachedNode:
+        return self._net._nodes[self._value("edgeFrom")]
+
+    def getToNode(self) -> CachedNode:
+        return self._net._nodes[self._value("edgeTo")]
+
+    def _withJunctions(self, shape) -> list:
+        # As sumolib, the coordinates of the junctions are only added where the shape does not already end
+        first, last = self.getFromNode().getCoord(), self.getToNode().getCoord()
+        return ([first] if shape[0] != first else []) + shape + ([last] if shape[-1] != last else [])
+
+    def getShape(self, includeJunctions=False) -> list:
+        shape = self._net._shape("edge", self._index)
+        return self._withJunctions(shape) if includeJunctions else shape
+
+    def getBoundingBox(self, includeJunctions=True) -> tuple:
+        xs, ys = zip(*self.getShape(includeJunctions))
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def getLanes(self) -> list:
+        start, end = self._net._arrays["edgeLaneStart"][self._index:self._index + 2]
+        return self._net._lanes[start:end]
+
+    def getLane(self, idx) -> CachedLane:
+        return self.getLanes()[idx]
+
+    def getLaneNumber(self) -> int:
+        return len(self.getLanes())
+
+    def getPermissions(self) -> set:
+        return self._net._permissions(self._net._edgePermissions()[self._index])
+
+    def allows(self, vClass) -> bool:
+        return bool(self._net._edgePermissions()[self._index] & self._net._vClassBit(vClass))
+
+    def getOutgoing(self) -> dict:
+        outgoing = {}
+        for lane in self.getLanes():
+            for connection in lane.getOutgoing():
+                outgoing.setdefault(connection.getTo(), []).append(connection)
+        return outgoing
+
+    def getIncoming(self) -> dict:
+        incoming = {}
+        toEdge = self._net._arrays["laneEdge"][self._net._arrays["connectionToLane"]]
+        for i in np.nonzero(toEdge == self._index)[0]:
+            connection = CachedConnection(self._net, i)
+            incoming.setdefault(connection.getFrom(), []).append(connection)
+        return incoming
+
+    def __repr__(self):
+        return '<edge id="%s" from="%s" to="%s"/>' % (self.getID(), self.getFromNode().getID(), self.getToNode().getID())
+
+class CachedNet():
+    """
+    SUMO network read from a snapshot of numpy arrays, memory-mapped, written by buildSnapshot.
+    Exposes the part of the sumolib.net.Net API used by the tools: edges, lanes, nodes, connections, shapes,
+    types, allowed vehicle classes, projection, neighboring edges and lanes (with spatialIndex) and shortest paths.\n
+    The edge, lane and node objects are created once, on first use. Shapes are 2D and traffic light programs are not kept
+    """
+    def __init__(self, snapshotDir):
+        self.snapshotDir = snapshotDir
+        meta = _readMeta(snapshotDir)
+        if meta is None:
+            raise ValueError('"%s" is not a snapshot of version %i' % (snapshotDir, FORMAT_VERSION))
+        self._meta = meta
+        self._location = meta["location"]
+        self._vClasses = meta["vClasses"]
+        self._arrays = _LazyArrays(snapshotDir)
+        self._cache = {}
+
+    def _cached(self, name, build):
+        value = self._cache.get(name)
+        if value is None:
+            value = self._cache[name] = build()
+        return value
+
+    def _strings(self, name, count) -> list:
+        return self._cached(name, lambda: _readStrings(os.path.join(self.snapshotDir, name + ".npy"), count))
+
+    @property
+    def _nodeIDs(self) -> list:
+        return self._strings("nodeIDs", self._meta["nodes"])
+
+    @property
+    def _edgeIDs(self) -> list:
+        return self._strings("edgeIDs", self._meta["edges"])
+
+    @property
+    def _laneIDs(self) -> list:
+        return self._strings("laneIDs", self._meta["lanes"])
+
+    def _string(self, code):
+        return None if code < 0 else self._strings("vocabulary", self._meta["vocabulary"])[code]
+
+    def _objects(self, cls, count) -> list:
+        # None of the objects is garbage, the collections the allocations would trigger are skipped
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return [cls(self, i) for i in range(count)]
+        finally:
+            if enabled:
+                gc.enable()
+
+    @property
+    def _nodes(self) -> list:
+        return self._cached("nodes", lambda: self._objects(CachedNode, self._meta["nodes"]))
+
+    @property
+    def _edges(self) -> list:
+        return self._cached("edges", lambda: self._objects(CachedEdge, self._meta["edges"]))
+
+    @property
+    def _lanes(self) -> list:
+        return self._cached("lanes", lambda: self._objects(CachedLane, self._meta["lanes"]))
+
+    def _index(self, name, ids):
+        return self._cached(name, lambda: {objectID: i for i, objectID in enumerate(ids)})
+
+    def _shape(self, kind, index) -> list:
+        start, end = self._arrays[kind + "ShapeStart"][index:index + 2]
+        return [tuple(point) for point in self._arrays[kind + "ShapePoints"][start:end].tolist()]
+
+    def _vClassBit(self, vClass) -> np.uint64:
+        bits = self._cached("vClassBits", lambda: {vClass: np.uint64(1) << np.uint64(i) for i, vClass in enumerate(self._vClasses)})
+        return bits.get(vClass, np.uint64(0))
+
+    def _permissions(self, mask) -> set:
+        return {vClass for i, vClass in enumerate(self._vClasses) if int(mask) >> i & 1}
+
+    def _edgePermissions(self) -> np.ndarray:
+        def build():
+            lanePermissions = self._arrays["lanePermissions"]
+            if len(lanePermissions) == 0:
+                return np.zeros(self._meta["edges"], dtype=np.uint64)
+            return np.bitwise_or.reduceat(lanePermissions, self._arrays["edgeLaneStart"][:-1])
+        return self._cached("edgePermissions", build)
+
+    def getNodes(self) -> list:
+        return self._nodes
+
+    def hasNode(self, nodeID) -> bool:
+        return nodeID in self._index("nodeIndex", self._nodeIDs)
+
+    def getNode(self, nodeID) -> CachedNode:
+        return self._nodes[self._index("nodeIndex", self._nodeIDs)[nodeID]]
+
+    def getEdges(self, withInternal=True) -> list:
+        return self._edges
+
+    def hasEdge(self, edgeID) -> bool:
+        return edgeID in self._index("edgeIndex", self._edgeIDs)
+
+    def getEdge(self, edgeID) -> CachedEdge:
+        return self._edges[self._index("edgeIndex", self._edgeIDs)[edgeID]]
+
+    def getLane(self, laneID) -> CachedLane:
+        return self._lanes[self._index("laneIndex", self._laneIDs)[laneID]]
+
+    def getLocationOffset(self) -> list:
+        return list(self._meta["locationOffset"])
+
+    def getBoundary(self) -> list:
+        return list(self._meta["boundary"])
+
+    def _geoConverter(self) -> GeoConverter:
+        return self._cached("geoConverter", lambda: GeoConverter.fromNet(self))
+
+    def convertXY2LonLat(self, x, y):
+        lon, lat = self._geoConverter().convertXY2LonLat(x, y)
+        return (float(lon), float(lat)) if np.ndim(lon) == 0 else (lon, lat)
+
+    def convertLonLat2XY(self, lon, lat):
+        x, y = self._geoConverter().convertLonLat2XY(lon, lat)
+        return (float(x), float(y)) if np.ndim(x) == 0 else (x, y)
+
+    def getShapeArrays(self, kind) -> (np.ndarray, np.ndarray):
+        """
+        Returns the vertices of the shapes of the edges or of the lanes, kind being "edge" or "lane", with the junctions at both ends,
+        and the index of the first vertex of each shape. Used by spatialIndex to build its trees without an object per shape
+        """
+        def build():
+            edges = self._arrays["laneEdge"] if kind == "lane" else np.arange(self._meta["edges"])
+            nodeCoord = self._arrays["nodeCoord"]
+            first = nodeCoord[self._arrays["edgeFrom"][edges]]
+            last = nodeCoord[self._arrays["edgeTo"][edges]]
+            return _addEnds(self._arrays[kind + "ShapePoints"], self._arrays[kind + "ShapeStart"], first, last)
+        return self._cached(kind + "ShapeArrays", build)
+
+    def getNeighboringEdges(self, x, y, r=0.1, includeJunctions=True, allowFallback=True) -> list:
+        """Returns the (edge, distance) of the edges at less than r of (x, y), includeJunctions and allowFallback are ignored"""
+        _, indexes, distances = spatialIndex.getEdgeIndex(self).within([x], [y], r)
+        return [(self._edges[i], d) for i, d in zip(indexes.tolist(), distances.tolist())]
+
+    def getNeighboringLanes(self, x, y, r=0.1, includeJunctions=True, allowFallback=True) -> list:
+        """Returns the (lane, distance) of the lanes at less than r of (x, y), includeJunctions and allowFallback are ignored"""
+        _, indexes, distances = spatialIndex.getLaneIndex(self).within([x], [y], r)
+        return [(self._lanes[i], d) for i, d in zip(indexes.tolist(), distances.tolist())]
+
+    def _successors(self) -> (np.ndarray, np.ndarray):
+        # Edges reached by a connection from each edge, edge i leads to successors[successorStart[i]:successorStart[i+1]]
+        def build():
+            laneEdge = self._arrays["laneEdge"]
+            count = self._meta["edges"]
+            pairs = np.unique(laneEdge[self._arrays["connectionFromLane"]].astype(np.int64) * count + laneEdge[self._arrays["connectionToLane"]])
+            return pairs % count, np.searchsorted(pairs // count, np.arange(count + 1))
+        return self._cached("successors", build)
+
+    def getShortestPath(self, fromEdge, toEdge, maxCost=1e400, vClass=None, includeFromToCost=True) -> (tuple, float):
+        """
+        Returns the edges of the shortest path in length from fromEdge to toEdge and its cost, (None, 1e400) if there is none.
+        The path only goes through edges allowing vClass if given. The cost includes the lengths of fromEdge and toEdge if includeFromToCost
+        """
+        lengths = self._arrays["edgeLength"]
+        successors, successorStart = self._successors()
+        permissions = self._edgePermissions()
+        bit = None if vClass is None else self._vClassBit(vClass)
+        start, goal = fromEdge._index, toEdge._index
+        # Costs count the length of the edges entered after fromEdge
+        costs = {start: 0.0}
+        previous = {start: -1}
+        heap = [(0.0, start)]
+        done = set()
+        while heap:
+            cost, edge = heapq.heappop(heap)
+            if edge in done:
+                continue
+            if edge == goal:
+                path = []
+                while edge != -1:
+                    path.append(self._edges[edge])
+                    edge = previous[edge]
+                if includeFromToCost:
+                    cost += lengths[start]
+                elif goal != start:
+                    cost -= lengths[goal]
+                return tuple(reversed(path)), float(cost)
+            if cost > maxCost:
+                break
+            done.add(edge)
+            for successor in successors[successorStart[edge]:successorStart[edge + 1]].tolist():
+                if bit is not None and not permissions[successor] & bit:
+                    continue
+                newCost = cost + lengths[successor]
+                if newCost < costs.get(successor, np.inf):
+                    costs[successor] = newCost
+                    previous[successor] = edge
+                    heapq.heappush(heap, (newCost, successor))
+        return None, 1e400
+
+def fillOptions(argParser):
+    argParser.add_argument("-n", "--net-file",
+                            metavar="FILE", type=str, required=True,
+                            help="builds the snapshot of the SUMO network FILE")
+    argParser.add_argument("-d", "--cache-dir",
+                            metavar="DIR", type=str, default=DEFAULT_CACHE_DIR,
+                            help="directory of the snapshots")
+    argParser.add_argument("-r", "--rebuild",
+                            action="store_true", default=False,
+                            help="builds the snapshot again even if it exists")
+
+def parse_args(args=None):
+    argParser = argparse.ArgumentParser(description="Parse a SUMO network once into a memory-mappable snapshot read by the tools")
+    fillOptions(argParser)
+    return argParser.parse_args(args), argParser
+
+if __name__ == "__main__":
+    options, argParser = parse_args()
+
+    t0 = time.perf_counter()
+    net = readNet(options.net_file, options.cache_dir, options.rebuild)
+    print("%i edges, %i lanes and %i nodes in %s, read in %.2f s" % (net._meta["edges"], net._meta["lanes"], net._meta["nodes"], net.snapshotDir, time.perf_counter() - t0))
@@ -1,75 +1,209 @@
+import os, sys
 import numpy as np
 import sumolib
 from shapely.geometry import polygon
 
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from sumoplustools import spatialIndex
+
 sizeOfCar = 5.0
 sizeOfBus = 10.0
 edgeMargin = 5.0
 
 def last(elem):
     return elem[-1]
+
+def _toXY(net, x, y, geoCoords):
+    if geoCoords:
+        return net.convertLonLat2XY(x, y)
+    return x, y
+
 def getClosestEdge(net: sumolib.net.Net, x, y, radius=100, allows: str=None, geoCoords=False, noLimit=False) -> sumolib.net.edge.Edge:
     """
     Gets the closest SUMO edge object from the coordinate (lon, lat) within a given radius.
     If no limit is given then it finds the closest edge without limit to radius
     """
-    if geoCoords:
-        x, y = net.convertLonLat2XY(x, y)
-    edges = net.getNeighboringEdges(x, y, radius)
-    if len(edges) > 0:
-        edgeDist = sorted(edges, key=last)
-        for edge, _ in edgeDist:
-            if allows:
-                if edge.allows(allows):
-                    return edge
-            else:
-                return edge
-    if noLimit:
-        return getClosestEdge(net, x, y, radius=radius*10, allows=allows, noLimit=noLimit)
-    return None
+    return getClosestEdgeOfPoints(net, [x], [y], radius, allows, geoCoords, noLimit)[0]
 
 def getClosestEdges(net: sumolib.net.Net, x, y, radius=100, allows: str=None, geoCoords=False):
     """
     Gets the a list of SUMO edge objects within a given radius that are sorted by distance from the coordinate (lon, lat).
     """
-    if geoCoords:
-        x, y = net.convertLonLat2XY(x, y)
-    edgesDist = net.getNeighboringEdges(x, y,radius)
-    edgesDist = sorted(edgesDist, key=last)
-    return [edge for edge,_ in edgesDist if edge.allows(allows)]
+    return getClosestEdgesOfPoints(net, [x], [y], radius, allows, geoCoords)[0]
 
 def getClosestLane(net : sumolib.net.Net, x, y, radius=100, allows: str=None, geoCoords=False, noLimit=False):
     """
     Gets the closest SUMO lane object from the coordinate (lon, lat) within a given radius.
     If radius is < 0 then it finds the closest lane without limit to radius
     """
-    if geoCoords:
-        x, y = net.convertLonLat2XY(x, y)
-    lanes = net.getNeighboringLanes(x, y, radius)
-    if len(lanes) > 0:
-        laneDist= sorted(lanes, key=last)
-        for lane, _ in laneDist:
-            if allows:
-                if lane.allows(allows):
-                    return lane
-            else:
-                return lane
-    if noLimit:
-        return getClosestLane(net, x, y, radius=radius*10, allows=allows, noLimit=noLimit)
-    return None
+    return getClosestLaneOfPoints(net, [x], [y], radius, allows, geoCoords, noLimit)[0]
 
 def getClosestLanes(net: sumolib.net.Net, x, y, radius=100, allows: str=None, geoCoords=False):
     """
     Gets the a list of SUMO lane objects within a given radius that are sorted by distance from the coordinate (lon, lat).
     """
-    if geoCoords:
-        x, y = net.convertLonLat2XY(x, y)
-    lanesDist = net.getNeighboringLanes(x, y, radius)
-    lanesDist = sorted(lanesDist, key=last)
-    return [lane for lane,_ in lanesDist if lane.allows(allows)]
+    return getClosestLanesOfPoints(net, [x], [y], radius, allows, geoCoords)[0]
+
+def _closestOfPoints(index, x, y, radius, allows, noLimit) -> list:
+    indexes, _ = index.nearest(x, y, k=1, radius=radius, vClass=allows, noLimit=noLimit)
+    return [index.objects[i] if i >= 0 else None for i in indexes[:, 0].tolist()]
+
+def _withinOfPoints(index, x, y, radius, allows) -> list:
+    pointIndexes, objectIndexes, _ = index.within(x, y, radius, vClass=allows)
+    objects = [[] for _ in range(len(x))]
+    for point, i in zip(pointIndexes.tolist(), objectIndexes.tolist()):
+        objects[point].append(index.objects[i])
+    return objects
+
+def getClosestEdgeOfPoints(net: sumolib.net.Net, x, y, radius=100, allows: str=None, geoCoords=False, noLimit=False) -> list:
+    """
+    Gets the closest SUMO edge object of each coordinate of the arrays x and y within a given radius, None if there is none, in one query.
+    Only edges allowing the vehicle class allows are kept if given
+    """
+    x, y = _toXY(net, np.asarray(x, dtype=float), np.asarray(y, dtype=float), geoCoords)
+    return _closestOfPoints(spatialIndex.getEdgeIndex(net), x, y, radius, allows, noLimit)
+
+def getClosestEdgesOfPoints(net: sumolib.net.Net, x, y, radius=100, allows: str=None, geoCoords=False) -> list:
+    """
+    Gets the list of SUMO edge objects within a given radius sorted by distance of each coordinate of the arrays x and y, in one query
+    """
+    x, y = _toXY(net, np.asarray(x, dtype=float), np.asarray(y, dtype=float), geoCoords)
+    return _withinOfPoints(spatialIndex.getEdgeIndex(net), x, y, radius, allows)
+
+def getClosestLaneOfPoints(net: sumolib.net.Net, x, y, radius=100, allows: str=None, geoCoords=False, noLimit=False) -> list:
+    """
+    Gets the closest SUMO lane object of each coordinate of the arrays x and y within a given radius, None if there is none, in one query.
+    Only lanes allowing the vehicle class allows are kept if given
+    """
+    x, y = _toXY(net, np.asarray(x, dtype=float), np.asarray(y, dtype=float), geoCoords)
+    return _closestOfPoints(spatialIndex.getLaneIndex(net), x, y, radius, allows, noLimit)
+
+def getClosestLanesOfPoints(net: sumolib.net.Net, x, y, radius=100, allows: str=None, geoCoords=False) -> list:
+    """
+    Gets the list of SUMO lane objects within a given radius sorted by distance of each coordinate of the arrays x and y, in one query
+    """
+    x, y = _toXY(net, np.asarray(x, dtype=float), np.asarray(y, dtype=float), geoCoords)
+    return _withinOfPoints(spatialIndex.getLaneIndex(net), x, y, radius, allows)
 
 def convertLine(net: sumolib.net.Net, shape : polygon.LineString) -> polygon.LineString:
     lons, lats = shape.xy
     return polygon.LineString([net.convertLonLat2XY(lon,lat) for lon,lat in zip(lons,lats)])
 
-    
\ No newline at end of file
+def getEdgeLines(net: sumolib.net.Net, edges: list=None, geoCoords=True) -> np.ndarray:
+    """
+    Gets the shapes of the edges, every edge of the network if omitted, as an array of shapely LineStrings.
+    In geo coordinates (lon, lat) unless geoCoords is False, the vertices of every shape are converted in one call
+    """
+    import shapely
+    if edges is None:
+        edges = net.getEdges()
+    shapes = [edge.getShape() for edge in edges]
+    coords = np.array([point for shape in shapes for point in shape], dtype=float).reshape(-1, 2)
+    if geoCoords:
+        coords = np.column_stack(GeoConverter.fromNet(net).convertXY2LonLat(coords[:, 0], coords[:, 1]))
+    return shapely.linestrings(coords, indices=np.repeat(np.arange(len(shapes)), [len(shape) for shape in shapes]))
+
+class LaneToStreet():
+    """
+    Table from every lane, internal lane and edge of the network to its edge and to the street (NetToDF osm_id) of that edge.
+    Built once so that vehicles are placed on a street with a dict lookup instead of a spatial search.\n
+    An internal lane, and its internal edge, belong to the edge entering the connection it is the via lane of.
+    Internal lanes of no connection are placed on the closest edge the first time they are met
+    """
+    def __init__(self, net: sumolib.net.Net, netToDF: dict=None):
+        self.net = net
+        netToDF = netToDF or {}
+        # Edge index of each lane or edge id
+        self._rows = {}
+        self.edgeIDs = []
+        self._edgeIndex = {}
+        for edge in net.getEdges():
+            index = self._edgeIndex[edge.getID()] = len(self.edgeIDs)
+            self.edgeIDs.append(edge.getID())
+            self._rows[edge.getID()] = index
+            for lane in edge.getLanes():
+                self._rows[lane.getID()] = index
+        for edge in net.getEdges():
+            for connections in edge.getOutgoing().values():
+                for connection in connections:
+                    via = connection.getViaLaneID()
+                    if via:
+                        self._addInternalLane(via, self._edgeIndex[edge.getID()])
+
+        # Street index of each edge, -1 if the edge has no street
+        self.streets = sorted(set(netToDF.values()))
+        streetIndex = {osm_id: i for i, osm_id in enumerate(self.streets)}
+        self.edgeStreets = np.array([streetIndex.get(netToDF.get(edgeID), -1) for edgeID in self.edgeIDs], dtype=np.int32)
+
+    def __contains__(self, laneID) -> bool:
+        return laneID in self._rows
+
+    def _addInternalLane(self, laneID, index):
+        self._rows.setdefault(laneID, index)
+        # Internal edge of the lane, as returned by vehicle.getRoadID
+        self._rows.setdefault(laneID.rsplit("_", 1)[0], index)
+
+    def _search(self, laneID, x, y) -> int:
+        if x is None or y is None:
+            raise KeyError('lane "%s" is not in the network' % laneID)
+        index = self._rows[laneID] = self._edgeIndex[getClosestEdge(self.net, x, y, radius=10, noLimit=True).getID()]
+        return index
+
+    def getEdgeIndex(self, laneID, x=None, y=None) -> int:
+        """
+        Returns the index in edgeIDs of the edge of the lane. x and y are only used for internal lanes of no connection
+        """
+        index = self._rows.get(laneID)
+        return self._search(laneID, x, y) if index is None else index
+
+    def getEdgeID(self, laneID, x=None, y=None) -> str:
+        return self.edgeIDs[self.getEdgeIndex(laneID, x, y)]
+
+    def getStreet(self, laneID, x=None, y=None) -> str:
+        """
+        Returns the osm_id of the street of the lane. Raises a KeyError if its edge has no street
+        """
+        street = self.edgeStreets[self.getEdgeIndex(laneID, x, y)]
+        if street < 0:
+            raise KeyError(self.getEdgeID(laneID, x, y))
+        return self.streets[street]
+
+    def getStreetIndexes(self, laneIDs, x, y) -> np.ndarray:
+        """
+        Returns the index in streets of the street of each lane, -1 for the lanes whose edge has no street
+        """
+        rows = self._rows
+        edges = np.fromiter((rows[laneID] if laneID in rows else self._search(laneID, laneX, laneY) for laneID, laneX, laneY in zip(laneIDs, x, y)),
+                            dtype=np.int32, count=len(laneIDs))
+        return self.edgeStreets[edges]
+
+class GeoConverter():
+    """
+    Converts between SUMO network coordinates and geo coordinates (lon, lat) for whole arrays in one call.
+    Built once from the projection parameters and the offset of the network, as done by net.convertXY2LonLat
+    """
+    def __init__(self, projParameter: str, netOffset):
+        import pyproj
+        if projParameter == "!":
+            raise ValueError("the network has no geo projection")
+        self.proj = pyproj.Proj(projParameter)
+        self.offsetX, self.offsetY = float(netOffset[0]), float(netOffset[1])
+
+    @classmethod
+    def fromNet(cls, net: sumolib.net.Net):
+        return cls(net._location["projParameter"], net.getLocationOffset())
+
+    def convertXY2LonLat(self, x, y) -> (np.ndarray, np.ndarray):
+        """
+        Returns the arrays of longitudes and latitudes of the SUMO coordinates in the arrays x and y
+        """
+        x = np.asarray(x, dtype=float) - self.offsetX
+        y = np.asarray(y, dtype=float) - self.offsetY
+        return self.proj(x, y, inverse=True)
+
+    def convertLonLat2XY(self, lon, lat) -> (np.ndarray, np.ndarray):
+        """
+        Returns the arrays of SUMO coordinates of the geo coordinates in the arrays lon and lat
+        """
+        x, y = self.proj(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        return x + self.offsetX, y + self.offsetY
@@ -1,11 +1,11 @@
 import os, sys
 import argparse
-import sumolib
 import xml.etree.ElementTree as ET
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools import netHandler
 from sumoplustools import verbose
+from sumoplustools import netCache
 
 def fillOptions(argParser):
     argParser.add_argument("-p", "--parking-file", 
@@ -29,7 +29,7 @@ def parse_args(args=None):
 if __name__ == "__main__":
     options, argParser = parse_args()
     
-    net = sumolib.net.readNet(options.network_file)
+    net = netCache.readNet(options.network_file)
     root = ET.Element('additional')
 
     sizeOfCar = 5
@@ -47,19 +47,15 @@ if __name__ == "__main__":
 
                 root.append(ET.Element('parkingArea',{'id':'parkingArea_%s' % laneID, 'lane':laneID, 'roadsideCapacity':'%i' % capacity, 'startPos':str(margin), 'endPos':str(-margin), 'friendlyPos':"1"}))
     else:
-        def second(elem):
-            return elem[1]
-
         edgesDone = []
         for spot in parkingSpots:
             capacity = getCapacity(spot)
             lat,lon = getLocation(spot)
             x, y = net.convertLonLat2XY(lon, lat)
             radius = 100
-            edges = net.getNeighboringEdge(x, y, radius)
+            edges = netHandler.getClosestEdges(net, x, y, radius)
             if len(edges) > 0:
-                edgeDist = sorted(edges, key=second)
-                for edge, _ in edgeDist:
+                for edge in edges:
                     if edge not in edgesDone:
                         edgesDone += [edge.getID()]
                         laneID = edge.getLane(idx=0).getID()
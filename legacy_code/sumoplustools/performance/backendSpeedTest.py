@@ -0,0 +1,61 @@
+import os, sys
+import argparse
+import time
+import sumolib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools.traciModules.sumoConnection import BACKENDS, startConnection
+
+_DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Lachine", "lachine.sumocfg")
+
+def runBackend(backend, sumoCmd, steps, readVehicles=False) -> (float, int):
+    """
+    Runs the simulation for the given number of steps with the backend.\n
+    Returns the elapsed seconds and the number of steps done
+    """
+    connection = startConnection(sumoCmd, backend=backend, label="speedTest_%s" % backend)
+    done = 0
+    t0 = time.perf_counter()
+    while done < steps and connection.simulation.getMinExpectedNumber() > 0:
+        connection.simulationStep()
+        if readVehicles:
+            # Same reads as the collection loops
+            for vehID in connection.vehicle.getIDList():
+                connection.vehicle.getPosition(vehID)
+                connection.vehicle.getRoadID(vehID)
+                connection.vehicle.getFuelConsumption(vehID)
+        done += 1
+    elapsed = time.perf_counter() - t0
+    connection.close()
+    return elapsed, done
+
+def fillOptions(argParser):
+    argParser.add_argument("-c", "--sumo-config-file",
+                            metavar="FILE", type=str, default=_DEFAULT_CONFIG,
+                            help="runs the simulation from FILE. Uses the Lachine scenario if omitted")
+    argParser.add_argument("-n", "--steps",
+                            metavar="INT", type=int, default=3600,
+                            help="number of simulation steps run by each backend")
+    argParser.add_argument("-b", "--backends",
+                            metavar="STR[,STR]", type=str, default=",".join(BACKENDS),
+                            help="backends to compare, separated by a comma")
+    argParser.add_argument("-r", "--read-vehicles",
+                            action="store_true", default=False,
+                            help="read the position, edge and fuel of every vehicle each step")
+
+def parse_args(args=None):
+    argParser = argparse.ArgumentParser(description="Compare the steps per second of the TraCI socket and libsumo backends")
+    fillOptions(argParser)
+    return argParser.parse_args(args), argParser
+
+if __name__ == "__main__":
+    options, argParser = parse_args()
+
+    sumoCmd = [sumolib.checkBinary("sumo"), "-c", options.sumo_config_file, "--no-step-log", "true", "--verbose", "false"]
+    print("%-10s %8s %10s %10s" % ("backend", "steps", "seconds", "steps/s"))
+    for backend in options.backends.split(","):
+        backend = backend.strip()
+        if backend not in BACKENDS:
+            argParser.error('unknown backend "%s"' % backend)
+        elapsed, steps = runBackend(backend, sumoCmd, options.steps, options.read_vehicles)
+        print("%-10s %8i %10.2f %10.1f" % (backend, steps, elapsed, steps / elapsed))
@@ -0,0 +1,126 @@
+import os, sys
+import argparse
+import multiprocessing
+import random
+import tempfile
+import time
+from xml.etree import ElementTree as ET
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools.emissions.emissionIO import getEmissionFileShards
+from sumoplustools.emissions.emissionParser import iterEmissionSteps, EMISSION_ATTRIBUTES, PARSERS, etree
+
+_VEHICLE = ('        <vehicle id="veh%i" eclass="HBEFA3/PC_G_EU4" CO2="%.2f" CO="%.2f" HC="%.2f" NOx="%.2f" PMx="%.2f" fuel="%.2f" electricity="0.00" '
+            'noise="%.2f" route="r%i" type="DEFAULT_VEHTYPE" waiting="0.00" lane="%s" pos="%.2f" speed="%.2f" angle="%.2f" x="%.2f" y="%.2f"/>\n')
+
+def writeSyntheticFile(filename, sizeMB, vehicles, seed=0):
+    """
+    Writes an emission-output of about sizeMB megabytes with the given number of vehicles per step.\n
+    Returns the number of steps written
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(vehicles):
+        # One vehicle in ten is inside a junction
+        lane = ":j%i_0_0" % i if i % 10 == 0 else "e%i_0" % i
+        lines.append(_VEHICLE % (i, rnd.uniform(0, 8000), rnd.uniform(0, 200), rnd.uniform(0, 2), rnd.uniform(0, 4), rnd.uniform(0, 0.2),
+                                 rnd.uniform(0, 3000), rnd.uniform(50, 80), i, lane, rnd.uniform(0, 100), rnd.uniform(0, 20),
+                                 rnd.uniform(0, 360), rnd.uniform(0, 40000), rnd.uniform(0, 40000)))
+    block = "".join(lines).encode()
+    size = sizeMB * 10**6
+    steps = 0
+    with open(filename, "wb") as f:
+        f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<emission-export>\n')
+        written = 0
+        while written < size:
+            f.write(b'    <timestep time="%.2f">\n' % steps)
+            f.write(block)
+            f.write(b'    </timestep>\n')
+            written += len(block)
+            steps += 1
+        f.write(b'</emission-export>\n')
+    return steps
+
+def parseElementTree(filename) -> int:
+    # Same work as the former collectEmissions loop
+    vehicles = 0
+    for _, elem in ET.iterparse(filename):
+        if elem.tag != "timestep":
+            continue
+        for vehicle in elem.findall('vehicle'):
+            vehicle.attrib["id"]
+            vehicle.attrib["lane"]
+            [float(vehicle.attrib[attr]) for attr in EMISSION_ATTRIBUTES]
+            vehicles += 1
+        elem.clear()
+    return vehicles
+
+def parseSteps(filename, parser) -> int:
+    return sum(len(step) for step in iterEmissionSteps(filename, parser))
+
+def _parseShard(task) -> int:
+    filename, start, end, parser = task
+    return sum(len(step) for step in iterEmissionSteps(filename, parser, start=start, end=end))
+
+def parseShards(filename, parser, processes) -> int:
+    # Same split as generateEmissions.py --processes
+    tasks = [(filename, start, end, parser) for start, end in getEmissionFileShards(filename)]
+    with multiprocessing.Pool(processes) as pool:
+        return sum(pool.imap_unordered(_parseShard, tasks))
+
+def fillOptions(argParser):
+    argParser.add_argument("-e", "--emission-file",
+                            metavar="FILE", type=str,
+                            help="parses FILE. Writes a synthetic emission-output to a temporary file if omitted")
+    argParser.add_argument("-s", "--size",
+                            metavar="INT", type=int, default=5000,
+                            help="size in MB of the synthetic emission-output")
+    argParser.add_argument("--vehicles",
+                            metavar="INT", type=int, default=5000,
+                            help="number of vehicles per step of the synthetic emission-output")
+    argParser.add_argument("-p", "--parsers",
+                            metavar="STR[,STR]", type=str, default=",".join(["etree"] + PARSERS),
+                            help="parsers to compare, separated by a comma. etree is the ElementTree loop used before emissionParser")
+    argParser.add_argument("-j", "--processes",
+                            metavar="INT[,INT]", type=str, default="2,%i" % os.cpu_count(),
+                            help="numbers of processes parsing the shards of the file with expat, separated by a comma")
+
+def parse_args(args=None):
+    argParser = argparse.ArgumentParser(description="Compare the MB/s of the emission-output parsers")
+    fillOptions(argParser)
+    return argParser.parse_args(args), argParser
+
+if __name__ == "__main__":
+    options, argParser = parse_args()
+
+    parsers = options.parsers.split(",")
+    for parser in parsers:
+        if parser not in ["etree"] + PARSERS:
+            argParser.error('unknown parser "%s"' % parser)
+    if "lxml" in parsers and etree is None:
+        print("lxml is not installed, skipping it")
+        parsers.remove("lxml")
+
+    filename = options.emission_file
+    if filename is None:
+        filename = os.path.join(tempfile.mkdtemp(), "emissions.xml")
+        print("writing %i MB to %s" % (options.size, filename))
+        writeSyntheticFile(filename, options.size, options.vehicles)
+    sizeMB = os.path.getsize(filename) / 10**6
+
+    try:
+        print("%10s %12s %10s %10s" % ("parser", "vehicles", "seconds", "MB/s"))
+        for parser in parsers:
+            t0 = time.perf_counter()
+            vehicles = parseElementTree(filename) if parser == "etree" else parseSteps(filename, parser)
+            elapsed = time.perf_counter() - t0
+            print("%10s %12i %10.1f %10.1f" % (parser, vehicles, elapsed, sizeMB / elapsed))
+        for processes in [int(n) for n in options.processes.split(",") if n]:
+            t0 = time.perf_counter()
+            vehicles = parseShards(filename, "expat", processes)
+            elapsed = time.perf_counter() - t0
+            print("%10s %12i %10.1f %10.1f" % ("expat x%i" % processes, vehicles, elapsed, sizeMB / elapsed))
+    finally:
+        if options.emission_file is None:
+            os.remove(filename)
+            os.rmdir(os.path.dirname(filename))
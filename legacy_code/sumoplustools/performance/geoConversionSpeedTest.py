@@ -0,0 +1,61 @@
+import os, sys
+import argparse
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools.netHandler import GeoConverter
+
+# Projection and offset of the Montreal network, used if no network file is given
+_DEFAULT_PROJ = "+proj=utm +zone=18 +ellps=WGS84 +datum=WGS84 +units=m +no_defs"
+_DEFAULT_OFFSET = (-580000.0, -5030000.0)
+
+def perVehicle(converter: GeoConverter, xs, ys):
+    # Same work as net.convertXY2LonLat called once per vehicle
+    proj = converter.proj
+    return [proj(x - converter.offsetX, y - converter.offsetY, inverse=True) for x, y in zip(xs.tolist(), ys.tolist())]
+
+def vectorized(converter: GeoConverter, xs, ys):
+    return converter.convertXY2LonLat(xs, ys)
+
+def timeIt(func, repeat, *args) -> float:
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def fillOptions(argParser):
+    argParser.add_argument("-n", "--net-file",
+                            metavar="FILE", type=str,
+                            help="uses the projection of the SUMO network in FILE. Uses the Montreal projection if omitted")
+    argParser.add_argument("--vehicles",
+                            metavar="INT[,INT]", type=str, default="10000,100000",
+                            help="number of vehicles converted per step, separated by a comma")
+    argParser.add_argument("-r", "--repeat",
+                            metavar="INT", type=int, default=5,
+                            help="number of runs per measure, the best one is reported")
+
+def parse_args(args=None):
+    argParser = argparse.ArgumentParser(description="Compare the per step cost of converting vehicle positions one by one and as arrays")
+    fillOptions(argParser)
+    return argParser.parse_args(args), argParser
+
+if __name__ == "__main__":
+    options, argParser = parse_args()
+
+    if options.net_file:
+        import sumolib
+        converter = GeoConverter.fromNet(sumolib.net.readNet(options.net_file))
+    else:
+        converter = GeoConverter(_DEFAULT_PROJ, _DEFAULT_OFFSET)
+
+    rng = np.random.default_rng(0)
+    print("%10s %16s %16s %8s" % ("vehicles", "per vehicle (ms)", "vectorized (ms)", "speedup"))
+    for nVehicles in [int(n) for n in options.vehicles.split(",")]:
+        xs = rng.uniform(0, 40000, nVehicles)
+        ys = rng.uniform(0, 40000, nVehicles)
+        loop = timeIt(perVehicle, options.repeat, converter, xs, ys)
+        vector = timeIt(vectorized, options.repeat, converter, xs, ys)
+        print("%10i %16.2f %16.2f %7.1fx" % (nVehicles, loop * 1000, vector * 1000, loop / vector))
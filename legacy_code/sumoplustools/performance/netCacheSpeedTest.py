@@ -0,0 +1,48 @@
+import os, sys
+import argparse
+import tempfile
+import shutil
+import time
+import sumolib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools import netCache
+
+_DEFAULT_NET = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Lachine", "lachine.net.xml")
+
+def timeRead(read) -> (float, object):
+    t0 = time.perf_counter()
+    net = read()
+    # Same first uses as the tools, the edges and a lookup by id
+    edges = net.getEdges()
+    net.getEdge(edges[-1].getID())
+    return time.perf_counter() - t0, net
+
+def fillOptions(argParser):
+    argParser.add_argument("-n", "--net-file",
+                            metavar="FILE", type=str, default=_DEFAULT_NET,
+                            help="reads the SUMO network FILE. Uses the Lachine network if omitted")
+    argParser.add_argument("-r", "--repeat",
+                            metavar="INT", type=int, default=3,
+                            help="number of reads from the snapshot")
+
+def parse_args(args=None):
+    argParser = argparse.ArgumentParser(description="Compare the time to read a SUMO network with sumolib and from its netCache snapshot")
+    fillOptions(argParser)
+    return argParser.parse_args(args), argParser
+
+if __name__ == "__main__":
+    options, argParser = parse_args()
+
+    cacheDir = tempfile.mkdtemp()
+    try:
+        print("%-20s %10s" % ("read", "seconds"))
+        elapsed, _ = timeRead(lambda: sumolib.net.readNet(options.net_file))
+        print("%-20s %10.2f" % ("sumolib", elapsed))
+        elapsed, _ = timeRead(lambda: netCache.readNet(options.net_file, cacheDir))
+        print("%-20s %10.2f" % ("snapshot, built", elapsed))
+        for i in range(options.repeat):
+            elapsed, _ = timeRead(lambda: netCache.readNet(options.net_file, cacheDir))
+            print("%-20s %10.2f" % ("snapshot %i" % (i + 1), elapsed))
+    finally:
+        shutil.rmtree(cacheDir)
@@ -0,0 +1,54 @@
+import os, sys
+import argparse
+import time
+import numpy as np
+import sumolib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools import netHandler
+
+_DEFAULT_NET = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Lachine", "lachine.net.xml")
+
+def closestEdgeOfPoint(net: sumolib.net.Net, x, y, radius, allows):
+    # Search of getClosestEdge before the spatial index, the radius growing tenfold until an edge is found
+    while True:
+        for edge, _ in sorted(net.getNeighboringEdges(x, y, radius), key=netHandler.last):
+            if not allows or edge.allows(allows):
+                return edge
+        radius *= 10
+
+def fillOptions(argParser):
+    argParser.add_argument("-n", "--net-file",
+                            metavar="FILE", type=str, default=_DEFAULT_NET,
+                            help="reads the SUMO network FILE. Uses the Lachine network if omitted")
+    argParser.add_argument("-p", "--points",
+                            metavar="INT", type=int, default=10000,
+                            help="number of random points in the boundary of the network")
+    argParser.add_argument("-a", "--allows",
+                            metavar="STR", type=str, default="bus",
+                            help="vehicle class the edges must allow")
+
+def parse_args(args=None):
+    argParser = argparse.ArgumentParser(description="Compare the time to find the closest edge of points one by one with sumolib and in one query of the spatial index")
+    fillOptions(argParser)
+    return argParser.parse_args(args), argParser
+
+if __name__ == "__main__":
+    options, argParser = parse_args()
+
+    net = sumolib.net.readNet(options.net_file)
+    xmin, ymin, xmax, ymax = net.getBoundary()
+    rng = np.random.default_rng(0)
+    xs, ys = rng.uniform(xmin, xmax, options.points), rng.uniform(ymin, ymax, options.points)
+
+    print("%-20s %10s %12s" % ("search", "seconds", "points/s"))
+    t0 = time.perf_counter()
+    expected = [closestEdgeOfPoint(net, x, y, 10, options.allows) for x, y in zip(xs.tolist(), ys.tolist())]
+    elapsed = time.perf_counter() - t0
+    print("%-20s %10.2f %12.0f" % ("one by one", elapsed, options.points / elapsed))
+    t0 = time.perf_counter()
+    edges = netHandler.getClosestEdgeOfPoints(net, xs, ys, radius=10, allows=options.allows, noLimit=True)
+    elapsed = time.perf_counter() - t0
+    print("%-20s %10.2f %12.0f" % ("spatial index", elapsed, options.points / elapsed))
+    mismatches = sum(edge is not other for edge, other in zip(edges, expected))
+    print("%i of %i points got another closest edge (ties at equal distance)" % (mismatches, options.points))
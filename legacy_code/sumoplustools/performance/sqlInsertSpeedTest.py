@@ -0,0 +1,74 @@
+import os, sys
+import argparse
+import time
+from datetime import timedelta
+import numpy as np
+import geopandas as gpd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools.postgresql.psqlObjects import EmissionConnection
+
+_TABLE = "InsertSpeedTest"
+METHODS = ["execute_values", "copy"]
+
+def makeEmissions(sql: EmissionConnection, rows, seed=0) -> gpd.pd.DataFrame:
+    """Returns rows of emissions shaped like the buffer of EmissionGenerator.saveToSQL"""
+    rnd = np.random.default_rng(seed)
+    emissions = {sql.runColumn: np.zeros(rows, dtype=np.int64),
+                 sql.keyColumns[0]: sql.initalDate + timedelta(seconds=60),
+                 sql.keyColumns[1]: rnd.integers(0, 10**6, rows).astype(str).astype(object),
+                 sql.keyColumns[2]: np.char.add("veh", rnd.integers(0, 10**5, rows).astype(str)).astype(object)}
+    for col in sql.eColumns:
+        emissions[col] = rnd.uniform(0, 1000, rows)
+    return gpd.pd.DataFrame(emissions)
+
+def insertRows(sql: EmissionConnection, method, emissions, batchSize) -> float:
+    """Inserts the emissions by batches with the method, returns the elapsed seconds"""
+    sql.execute('TRUNCATE public."%s"' % _TABLE)
+    t0 = time.perf_counter()
+    for start in range(0, len(emissions), batchSize):
+        batch = emissions.iloc[start:start + batchSize]
+        if method == "copy":
+            sql.copyDataFrame(batch, _TABLE)
+        else:
+            sql.insertDataFrame(batch, _TABLE)
+    return time.perf_counter() - t0
+
+def fillOptions(argParser):
+    argParser.add_argument("-r", "--rows",
+                            metavar="INT", type=int, default=10**6,
+                            help="number of synthetic emission rows inserted by each method")
+    argParser.add_argument("-b", "--batch-size",
+                            metavar="INT", type=int, default=10**5,
+                            help="rows per call, the size of the buffers of the emission and visual writers")
+    argParser.add_argument("-m", "--methods",
+                            metavar="STR[,STR]", type=str, default=",".join(METHODS),
+                            help="methods to compare, separated by a comma")
+
+def parse_args(args=None):
+    argParser = argparse.ArgumentParser(description="Compare the rows per second of execute_values and COPY in a scratch table of the database")
+    fillOptions(argParser)
+    return argParser.parse_args(args), argParser
+
+if __name__ == "__main__":
+    options, argParser = parse_args()
+
+    methods = options.methods.split(",")
+    for method in methods:
+        if method not in METHODS:
+            argParser.error('unknown method "%s"' % method)
+
+    sql = EmissionConnection()
+    emissions = makeEmissions(sql, options.rows)
+    # Same columns as the emissions table, without its partitions
+    sql.dropTable(_TABLE)
+    sql.createTable(_TABLE, '%s integer, "%s" timestamp without time zone, %s text, %s text, %s' % (sql.runColumn, sql.keyColumns[0],
+                    sql.keyColumns[1], sql.keyColumns[2], ", ".join('"%s" numeric' % col for col in sql.eColumns)))
+    try:
+        print("%15s %10s %10s %12s" % ("method", "rows", "seconds", "rows/s"))
+        for method in methods:
+            elapsed = insertRows(sql, method, emissions, options.batch_size)
+            print("%15s %10i %10.2f %12.0f" % (method, len(emissions), elapsed, len(emissions) / elapsed))
+    finally:
+        sql.dropTable(_TABLE)
+        sql.close()
@@ -1,14 +1,44 @@
+import io
+import os
+import re
 import psycopg2, psycopg2.extras
 from datetime import datetime, timedelta
 import geopandas as gpd
 
+# Time resolutions of the emission rollups, in seconds, by table suffix
+ROLLUP_RESOLUTIONS = {"1min": 60, "15min": 900, "1h": 3600}
+# Null marker of the text streamed by copyDataFrame, and the escapes of its text values
+COPY_NULL = "\\N"
+_COPY_SPECIAL = re.compile(r"[\\\t\n\r]")
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_INTEGER_TYPES = ["smallint", "integer", "bigint"]
+_FLOAT_TYPES = ["numeric", "real", "double precision"]
+# Registry of the runs, the same table as the runs of the agents of the app backend (agent_schema.RUNS_DDL)
+RUNS_DDL = """CREATE TABLE IF NOT EXISTS public.runs (
+    run_id serial PRIMARY KEY,
+    config_file text,
+    seed integer,
+    started_at timestamp with time zone DEFAULT now(),
+    finished_at timestamp with time zone
+)"""
+
 class SQLConnection():
     def __init__(self):
-        self.conn = psycopg2.connect(database="SUMO Montreal", user="postgres", password="sumogroup4", host="127.0.0.1", port="5432")
+        # The POSTGRES_* variables of the app point the tools to its database, so that both share the runs registry
+        self.conn = psycopg2.connect(database=os.environ.get("POSTGRES_DB", "SUMO Montreal"), user=os.environ.get("POSTGRES_USER", "postgres"),
+            password=os.environ.get("POSTGRES_PASSWORD", "sumogroup4"), host=os.environ.get("POSTGRES_HOST", "127.0.0.1"), port=os.environ.get("POSTGRES_PORT", "5432"))
         self.cursor = self.conn.cursor()
         self.initalDate = datetime.fromisoformat("2000-01-01")
         self.referenceTable = "GeoCoordinates"
         self.net2DFTable = "NetToDF"
+        self.runTable = "runs"
+        self.runColumn = "run_id"
+        # Tables partitioned by run, one partition per run
+        self.runPartitionedTables = ["Emissions", "VehicleData"]
+        # Tables holding the rows of every run
+        self.runTables = ["Emissions_%s" % resolution for resolution in ROLLUP_RESOLUTIONS]
+        # Column types of the tables copied to, see getColumnTypes
+        self._columnTypes = {}
     
     def execute(self, query):
         try:
@@ -25,6 +55,14 @@ class SQLConnection():
             self.conn.rollback()
             raise
         self.conn.commit()
+
+    def copy_expert(self, query, file):
+        try:
+            self.cursor.copy_expert(query, file)
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
     
     def insertDataFrame(self, dataframe, tableName):
         if not dataframe.empty:
@@ -32,6 +70,31 @@ class SQLConnection():
             temp_cols = '","'.join(list(dataframe.columns))
             command  = '''INSERT INTO public."%s"("%s") VALUES %%s''' % (tableName, temp_cols)
             self.execute_values(command, tuples)
+
+    def getColumnTypes(self, tableName) -> dict:
+        """Returns the data type of each column of the table, as named by information_schema. Cached per table"""
+        if tableName not in self._columnTypes:
+            self.execute('''SELECT column_name, data_type FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = '%s' ''' % tableName)
+            self._columnTypes[tableName] = dict(self.retrieveSelectedQuery())
+        return self._columnTypes[tableName]
+
+    def copyDataFrame(self, dataframe, tableName):
+        """
+        Inserts the dataframe with COPY, streamed from an in-memory text buffer, instead of an INSERT of every row.
+        Each column is written as the type of the column of the table of the same name, missing values are NULL
+        """
+        if dataframe.empty:
+            return
+        types = self.getColumnTypes(tableName)
+        missing = [col for col in dataframe.columns if col not in types]
+        if missing:
+            raise KeyError('columns %s are not in table "%s"' % (missing, tableName))
+
+        columns = [_toCopyColumn(dataframe[col], types[col]) for col in dataframe.columns]
+        buffer = io.StringIO("\n".join(map("\t".join, zip(*columns))) + "\n")
+        command = '''COPY public."%s"("%s") FROM STDIN''' % (tableName, '","'.join(dataframe.columns))
+        self.copy_expert(command, buffer)
     
     def retrieveSelectedQuery(self) -> list:
         return self.cursor.fetchall()
@@ -74,6 +137,99 @@ class SQLConnection():
         dataframe = gpd.pd.DataFrame(self.getReferenceDF().drop('geometry',axis=1))
         self.insertDataFrame(dataframe, tableName)
 
+    def tableExists(self, tableName) -> bool:
+        self.execute("""SELECT to_regclass('public."%s"')""" % tableName)
+        return self.retrieveSelectedQuery()[0][0] is not None
+
+    def isPartitioned(self, tableName) -> bool:
+        """Returns True if the table is partitioned, False if it is a regular table or does not exist"""
+        self.execute("""SELECT relkind FROM pg_class WHERE oid = to_regclass('public."%s"')""" % tableName)
+        records = self.retrieveSelectedQuery()
+        return len(records) > 0 and records[0][0] == 'p'
+
+    def _runPartitionedTableCommand(self, tableName, cols) -> str:
+        return '''CREATE TABLE IF NOT EXISTS public."%s"(%s integer NOT NULL%s) PARTITION BY LIST (%s);
+        ALTER TABLE public."%s"
+            OWNER to postgres;''' % (tableName, self.runColumn, ("" if cols == "" else ", %s" % cols), self.runColumn, tableName)
+
+    def createRunPartitionedTable(self, tableName, cols="") -> int:
+        """
+        Creates the table partitioned by run if it does not exist.
+        A table of the same name that is not partitioned is kept as the partition of a run of its own, see migrateToRunPartitions.
+        Returns the id of that run, None if there was no such table
+        """
+        runID = self.migrateToRunPartitions(tableName, cols)
+        self.execute(self._runPartitionedTableCommand(tableName, cols))
+        return runID
+
+    def migrateToRunPartitions(self, tableName, cols="") -> int:
+        """
+        Moves a table that is not partitioned by run, saved before runs existed, into a new run registered as migrated:
+        the table becomes the partition of the run in the new partitioned table of the same name.
+        Nothing is changed if any step fails. Returns the id of the run, None if the table is missing or already partitioned
+        """
+        if not self.tableExists(tableName) or self.isPartitioned(tableName):
+            return None
+        self.createRunsTable()
+        try:
+            self.cursor.execute('''INSERT INTO public."%s"(config_file) VALUES (%%s) RETURNING %s''' % (self.runTable, self.runColumn),
+                ("migrated from %s" % tableName,))
+            runID = self.cursor.fetchone()[0]
+            partition = self.getRunPartition(tableName, runID)
+            self.cursor.execute('''ALTER TABLE public."%s" RENAME TO "%s"''' % (tableName, partition))
+            self.cursor.execute('''ALTER TABLE public."%s" ADD COLUMN %s integer NOT NULL DEFAULT %i''' % (partition, self.runColumn, runID))
+            self.cursor.execute(self._runPartitionedTableCommand(tableName, cols))
+            self.cursor.execute('''ALTER TABLE public."%s" ATTACH PARTITION public."%s" FOR VALUES IN (%i)''' % (tableName, partition, runID))
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return runID
+
+    def getRunPartition(self, tableName, runID) -> str:
+        return "%s_r%i" % (tableName, int(runID))
+
+    def createRunPartition(self, tableName, runID):
+        self.execute('''CREATE TABLE IF NOT EXISTS public."%s" PARTITION OF public."%s" FOR VALUES IN (%i)'''
+            % (self.getRunPartition(tableName, runID), tableName, int(runID)))
+
+    def createRunsTable(self):
+        self.execute(RUNS_DDL)
+
+    def createRun(self, configFile: str=None, seed: int=None) -> int:
+        """
+        Registers a new run with its metadata and returns its id
+        """
+        self.createRunsTable()
+        try:
+            self.cursor.execute('''INSERT INTO public."%s"(config_file, seed) VALUES (%%s, %%s) RETURNING %s''' % (self.runTable, self.runColumn), (configFile, seed))
+            runID = self.cursor.fetchone()[0]
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return runID
+
+    def finishRun(self, runID):
+        self.execute('''UPDATE public."%s" SET finished_at = now() WHERE %s = %i''' % (self.runTable, self.runColumn, int(runID)))
+
+    def getRunsDF(self) -> gpd.pd.DataFrame:
+        self.createRunsTable()
+        return self.getDataFrame('''SELECT * FROM public."%s" ORDER BY %s''' % (self.runTable, self.runColumn))
+
+    def deleteRun(self, runID):
+        """
+        Deletes the run by dropping its partition in every table partitioned by run
+        and its rows in the other tables
+        """
+        for tableName in self.runPartitionedTables:
+            self.dropTable(self.getRunPartition(tableName, runID))
+        for tableName in self.runTables:
+            if self.tableExists(tableName):
+                self.execute('''DELETE FROM public."%s" WHERE %s = %i''' % (tableName, self.runColumn, int(runID)))
+        self.createRunsTable()
+        self.execute('''DELETE FROM public."%s" WHERE %s = %i''' % (self.runTable, self.runColumn, int(runID)))
+
     def getNetToDFMap(self):
         net2df = {}
         table = self.net2DFTable
@@ -99,45 +255,132 @@ class EmissionConnection(SQLConnection):
         name = {"FUEL":"Fuel", "CO":"CO", "CO2":"CO2", "HC":"HC", "NOX":"NOx","PMX":"PMx"}
         return name[eType.upper()]
     
+    def createEmissionsTable(self):
+        migratedRun = self.createRunPartitionedTable(self.eTable, '"%s" timestamp without time zone, %s text, %s text, "%s" numeric, "%s" numeric, "%s" numeric, "%s" numeric, "%s" numeric, "%s" numeric'
+            % (self.keyColumns[0], self.keyColumns[1], self.keyColumns[2], self.eColumns[0], self.eColumns[1], self.eColumns[2], self.eColumns[3], self.eColumns[4], self.eColumns[5]))
+        if migratedRun is not None:
+            self.rebuildRollups(migratedRun)
+
     def clearEmissionsTable(self):
+        """Drops the emissions of every run"""
         self.dropTable(self.eTable)
-        self.createTable(self.eTable, '"%s" timestamp without time zone, %s text, %s text, "%s" numeric, "%s" numeric, "%s" numeric, "%s" numeric, "%s" numeric, "%s" numeric'
-            % (self.keyColumns[0], self.keyColumns[1], self.keyColumns[2], self.eColumns[0], self.eColumns[1], self.eColumns[2], self.eColumns[3], self.eColumns[4], self.eColumns[5]))
-    
-    def get_eTableDF_osm(self, eTypes: list, osm_ids: list=None, fromTime: float=None, toTime: float=None) -> gpd.GeoDataFrame:
-        ecol = ""
-        sumCol = ""
-        for col in [self.get_eTypeCol(etype) for etype in eTypes]:
-            ecol += 'COALESCE(etype."%s",0) "%s", ' % (col, col)
-            sumCol += 'SUM(etype."%s") "%s", ' % (col, col)
+        for resolution in ROLLUP_RESOLUTIONS:
+            self.dropTable(self.getRollupTable(resolution))
+        self.createEmissionsTable()
+        self.createRollupTables()
 
-        cond = ""
+    def startRun(self, runID):
+        """Creates the partition where the emissions of the run are saved"""
+        self.createEmissionsTable()
+        self.createRunPartition(self.eTable, runID)
+        self.createRollupTables()
+
+    def getRollupTable(self, resolution: str) -> str:
+        return "%s_%s" % (self.eTable, resolution)
+
+    def createRollupTables(self):
+        """Creates the tables of the emissions summed per run, street and time bucket of each resolution"""
+        eCols = ", ".join('"%s" numeric' % col for col in self.eColumns)
+        for resolution in ROLLUP_RESOLUTIONS:
+            self.execute('''CREATE TABLE IF NOT EXISTS public."%s"(%s integer NOT NULL, "%s" timestamp without time zone NOT NULL, %s text NOT NULL, %s,
+                PRIMARY KEY (%s, "%s", %s))''' % (self.getRollupTable(resolution), self.runColumn, self.keyColumns[0], self.keyColumns[1], eCols,
+                self.runColumn, self.keyColumns[0], self.keyColumns[1]))
+
+    def updateRollups(self, emissions: gpd.pd.DataFrame):
+        """
+        Adds the emissions to the rollups of every resolution.
+        The dataframe has the run, time and street of each row and one column per emission type
+        """
+        if emissions.empty:
+            return
+        time, osm = self.keyColumns[0], self.keyColumns[1]
+        eCols = [col for col in self.eColumns if col in emissions.columns]
+        for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+            # Buckets are aligned on the initial date, that is midnight
+            bucket = gpd.pd.to_datetime(emissions[time]).dt.floor("%is" % seconds)
+            rollup = emissions.groupby([emissions[self.runColumn], bucket, emissions[osm]])[eCols].sum().reset_index()
+            tuples = [tuple(x) for x in rollup.to_numpy()]
+            command = '''INSERT INTO public."%s" AS rollup("%s") VALUES %%s
+                ON CONFLICT (%s, "%s", %s) DO UPDATE SET %s''' % (self.getRollupTable(resolution), '","'.join(rollup.columns),
+                self.runColumn, time, osm, ", ".join('"%s" = COALESCE(rollup."%s",0) + COALESCE(EXCLUDED."%s",0)' % (col, col, col) for col in eCols))
+            self.execute_values(command, tuples)
+
+    def rebuildRollups(self, runID: int):
+        """Computes the rollups of the run again from its emissions, for runs saved before the rollups existed"""
+        self.createRollupTables()
+        time, osm = self.keyColumns[0], self.keyColumns[1]
+        sumCol = ", ".join('SUM("%s")' % col for col in self.eColumns)
+        eCols = '","'.join(self.eColumns)
+        for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+            table = self.getRollupTable(resolution)
+            self.execute('''DELETE FROM public."%s" WHERE %s = %i''' % (table, self.runColumn, int(runID)))
+            self.execute('''INSERT INTO public."%s"(%s, "%s", %s, "%s")
+                SELECT %s, to_timestamp(floor(extract(epoch from "%s") / %i) * %i) AT TIME ZONE 'UTC', %s, %s
+                FROM public."%s" WHERE %s = %i GROUP BY 1, 2, 3''' % (table, self.runColumn, time, osm, eCols,
+                self.runColumn, time, seconds, seconds, osm, sumCol, self.eTable, self.runColumn, int(runID)))
+
+    def getRollupResolution(self, fromTime: float=None, toTime: float=None) -> str:
+        """
+        Returns the coarsest resolution whose buckets are aligned with both bounds, None if there is none.
+        A bound of None is aligned with every resolution
+        """
+        for resolution, seconds in sorted(ROLLUP_RESOLUTIONS.items(), key=lambda item: -item[1]):
+            if all(bound is None or bound % seconds == 0 for bound in (fromTime, toTime)):
+                if self.tableExists(self.getRollupTable(resolution)):
+                    return resolution
+        return None
+
+    def insertEmissions(self, emissions: gpd.pd.DataFrame):
+        """Inserts the emissions with their run and time, and adds them to the rollups"""
+        self.copyDataFrame(emissions, self.eTable)
+        self.updateRollups(emissions)
+
+    def get_eTableDF_osm(self, eTypes: list, osm_ids: list=None, fromTime: float=None, toTime: float=None, runID: int=None, useRollups: bool=True) -> gpd.GeoDataFrame:
+        """
+        Returns the emissions summed per street between fromTime and toTime, in seconds, both included.
+        When both times are multiples of a rollup resolution, the sums before toTime are read from its rollup
+        and the emissions at toTime from the raw emissions
+        """
+        cols = [self.get_eTypeCol(etype) for etype in eTypes]
+        ecol = ", ".join('COALESCE(etype."%s",0) "%s"' % (col, col) for col in cols)
+        sumCol = ", ".join('SUM(etype."%s") "%s"' % (col, col) for col in cols)
+
+        cond = []
         if fromTime:
-           fromTime = self.initalDate + timedelta(days=fromTime // (3600 * 24), seconds=fromTime % (3600 * 24))
-           cond = '''WHERE etype."Time" >= '%s' ''' % str(fromTime)
-        if toTime:
-            toTime = self.initalDate + timedelta(days=toTime // (3600 * 24), seconds=toTime % (3600 * 24))
-            if fromTime:
-                cond = '''WHERE etype."Time" BETWEEN '%s' AND '%s' ''' % (str(fromTime), str(toTime))
-            else:
-                cond = '''WHERE etype."Time" <= '%s' ''' % str(toTime)
-        
+            fromDate = self.initalDate + timedelta(days=fromTime // (3600 * 24), seconds=fromTime % (3600 * 24))
+            cond.append('''etype."Time" >= '%s' ''' % str(fromDate))
+        if runID is not None:
+            cond.append("etype.%s = %i" % (self.runColumn, int(runID)))
         if osm_ids:
-            if cond != "":
-                cond += " AND etype.osm_id IN ('%s')" % ("','".join(osm_ids))
-            else:
-                cond = "WHERE etype.osm_id IN ('%s')" % ("','".join(osm_ids))
-        
+            cond.append("etype.osm_id IN ('%s')" % ("','".join(osm_ids)))
+        toDate = None
+        if toTime:
+            toDate = str(self.initalDate + timedelta(days=toTime // (3600 * 24), seconds=toTime % (3600 * 24)))
+
+        resolution = self.getRollupResolution(fromTime or None, toTime or None) if useRollups else None
+        if resolution is None:
+            upper = [] if toDate is None else ['''etype."Time" <= '%s' ''' % toDate]
+            source = '''public."%s" etype %s''' % (self.eTable, _where(cond + upper))
+        elif toDate is None:
+            source = '''public."%s" etype %s''' % (self.getRollupTable(resolution), _where(cond))
+        else:
+            # The bucket of toTime also holds the emissions after it, they are read raw instead
+            eCols = ", ".join('etype."%s"' % col for col in cols)
+            source = '''(SELECT etype.osm_id, %s FROM public."%s" etype %s
+                UNION ALL
+                SELECT etype.osm_id, %s FROM public."%s" etype %s) etype''' % (
+                eCols, self.getRollupTable(resolution), _where(cond + ['''etype."Time" < '%s' ''' % toDate]),
+                eCols, self.eTable, _where(cond + ['''etype."Time" = '%s' ''' % toDate]))
+
         command = '''SELECT reference."osm_id", %s, reference."geometry"
         FROM public."%s" reference LEFT OUTER JOIN (
-            SELECT etype.osm_id, %s from public."%s" etype
-            %s
+            SELECT etype.osm_id, %s from %s
             group by etype.osm_id) etype
-        ON reference."osm_id" = etype."osm_id"''' % (ecol.strip(' ,'), self.referenceTable, sumCol.strip(' ,'), self.eTable, cond)
-        
+        ON reference."osm_id" = etype."osm_id"''' % (ecol, self.referenceTable, sumCol, source)
+
         return self.getGeoDataFrame(command)
 
-    def get_eTableDF_veh(self, eTypes: list, veh_ids: list=None, fromTime: float=None, toTime: float=None) -> gpd.pd.DataFrame:
+    def get_eTableDF_veh(self, eTypes: list, veh_ids: list=None, fromTime: float=None, toTime: float=None, runID: int=None) -> gpd.pd.DataFrame:
         sumCol = ""
         for col in [self.get_eTypeCol(etype) for etype in eTypes]:
             sumCol += 'SUM(etype."%s") "%s", ' % (col, col)
@@ -153,6 +396,12 @@ class EmissionConnection(SQLConnection):
             else:
                 cond = '''WHERE etype."Time" <= '%s' ''' % str(toTime)
         
+        if runID is not None:
+            if cond != "":
+                cond += " AND etype.%s = %i" % (self.runColumn, int(runID))
+            else:
+                cond = "WHERE etype.%s = %i" % (self.runColumn, int(runID))
+
         if veh_ids:
             if cond != "":
                 cond += " AND etype.veh_id IN ('%s')" % ("','".join(veh_ids))
@@ -165,10 +414,11 @@ class EmissionConnection(SQLConnection):
         
         return self.getDataFrame(command)
     
-    def insertTimeStep(self, time : float, emissions: gpd.pd.DataFrame):
+    def insertTimeStep(self, time : float, emissions: gpd.pd.DataFrame, runID: int):
         date = self.initalDate + timedelta(seconds=time)
         emissions.insert(0, "Time", date)
-        self.insertDataFrame(emissions, self.eTable)
+        emissions.insert(0, self.runColumn, runID)
+        self.insertEmissions(emissions)
 
 class VisualConnection(SQLConnection):
     def __init__(self):
@@ -176,13 +426,24 @@ class VisualConnection(SQLConnection):
         self.vehTable = "VehicleData"
         self.columns = ["Time", "veh_id", "osm_id", "lon", "lat", "speed", "direction", "vtype", "vclass"]
 
+    def createVehicleTable(self):
+        self.createRunPartitionedTable(self.vehTable, '"%s" timestamp without time zone, "%s" text, "%s" text, "%s" numeric, "%s" numeric, "%s" numeric, "%s" numeric, "%s" text, "%s" text'
+            % (self.columns[0], self.columns[1], self.columns[2], self.columns[3], self.columns[4], self.columns[5], self.columns[6], self.columns[7], self.columns[8]))
+
     def clearVehicleTable(self):
+        """Drops the vehicle data of every run"""
         self.dropTable(self.vehTable)
-        self.createTable(self.vehTable, '"%s" timestamp without time zone, "%s" text, "%s" text, "%s" numeric, "%s" numeric, "%s" numeric, "%s" numeric, "%s" text, "%s" text'
-            % (self.columns[0], self.columns[1], self.columns[2], self.columns[3], self.columns[4], self.columns[5], self.columns[6], self.columns[7], self.columns[8]))
+        self.createVehicleTable()
+
+    def startRun(self, runID):
+        """Creates the partition where the vehicle data of the run is saved"""
+        self.createVehicleTable()
+        self.createRunPartition(self.vehTable, runID)
     
-    def getVehDF(self, veh_id, fromTime: float=None, toTime: float=None):
+    def getVehDF(self, veh_id, fromTime: float=None, toTime: float=None, runID: int=None):
         cond = '''WHERE vehicle."%s" = '%s' ''' % (self.columns[1], veh_id)
+        if runID is not None:
+            cond += ''' AND vehicle.%s = %i ''' % (self.runColumn, int(runID))
         if fromTime:
            fromTime = self.initalDate + timedelta(days=fromTime // (3600 * 24), seconds=fromTime % (3600 * 24))
            cond += ''' AND vehicle."%s" >= '%s' ''' % (self.columns[0], str(fromTime))
@@ -195,6 +456,31 @@ class VisualConnection(SQLConnection):
         return self.getDataFrame(command)
 
 
+def _where(conditions: list) -> str:
+    return "WHERE " + " AND ".join(conditions) if conditions else ""
+
+def _toCopyColumn(column: gpd.pd.Series, dataType: str) -> list:
+    """Returns the values of the column in the text format of COPY for a column of the data type, missing values are COPY_NULL"""
+    if dataType in _INTEGER_TYPES:
+        values = map(str, gpd.pd.to_numeric(column).fillna(0).astype("int64").tolist())
+    elif dataType in _FLOAT_TYPES:
+        values = map(repr, gpd.pd.to_numeric(column).astype("float64").tolist())
+    elif dataType.startswith("timestamp"):
+        values = gpd.pd.to_datetime(column).astype(str).tolist()
+    elif dataType == "USER-DEFINED":
+        # PostGIS geometry, read from its hexadecimal WKB
+        values = gpd.GeoSeries(column).to_wkb(hex=True).tolist()
+    else:
+        values = [str(value) for value in column.tolist()]
+        # Escaping is rarely needed, one search of the joined values is cheaper than a translate of each value
+        if _COPY_SPECIAL.search("".join(values)):
+            values = [value.translate(_COPY_ESCAPES) for value in values]
+    missing = column.isna().tolist()
+    if not any(missing):
+        return list(values)
+    return [COPY_NULL if isMissing else value for value, isMissing in zip(values, missing)]
+
+
 def initializeReferenceTable(dataframe: gpd.GeoDataFrame):
     '''
     Initializes the SQL database with the reference table for the map.
@@ -219,7 +505,8 @@ def initializeNetToDFTable(net, dataframe):
     Initializes the SQL database with the conversion from a SUMO network edge to a dataframe street.
     The dataframe must have a column named 'osm_id' that is a unique id for each street".
     '''
-    from shapely.geometry.polygon import LineString
+    import shapely
+    from sumoplustools import netHandler
     sql = SQLConnection()
     table = sql.net2DFTable
     
@@ -229,18 +516,15 @@ def initializeNetToDFTable(net, dataframe):
         OWNER to postgres;''' % (table, table)
     sql.execute(command)
 
-    # Instantiate index class
-    idx = dataframe.sindex
+    # Map each edge to the street at the smallest distance of its shape, for all the edges at once
     edges = net.getEdges()
-    
-    # Map each edge to a street
-    # Very long to process: ~8.5 mins
-    for edge in edges:
-        edgeLine = LineString([net.convertXY2LonLat(x,y) for x,y in edge.getShape()])
-        for closestIndex in idx.nearest(edgeLine.bounds):
-            command = '''INSERT INTO public."%s" VALUES('%s', %s)''' % (table, edge.getID(), dataframe.loc[closestIndex, "osm_id"])
-            sql.execute(command)
-            break
+    edgeLines = netHandler.getEdgeLines(net, edges)
+    tree = shapely.STRtree(dataframe.geometry.to_numpy())
+    edgeIndexes, streetIndexes = tree.query_nearest(edgeLines, all_matches=False)
+    mapping = gpd.pd.DataFrame({"edge_id": [edges[i].getID() for i in edgeIndexes],
+                                "osm_id": dataframe["osm_id"].to_numpy()[streetIndexes]})
+    sql.copyDataFrame(mapping, table)
+    sql.close()
 
 
 '''
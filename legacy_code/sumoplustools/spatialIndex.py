@@ -0,0 +1,169 @@
+import numpy as np
+import shapely
+
+# dwithin queries need GEOS 3.10, query_nearest and the vectorized functions Shapely 2, see requirements.txt
+MIN_GEOS_VERSION = (3, 10, 0)
+
+def _requireShapely():
+    # Shapely 1 has no geos_version at the top of the package
+    geosVersion = getattr(shapely, "geos_version", None)
+    if geosVersion is None or geosVersion < MIN_GEOS_VERSION:
+        raise ImportError("spatialIndex needs Shapely>=2.0 with GEOS>=%s, found Shapely %s with GEOS %s"
+            % (".".join(map(str, MIN_GEOS_VERSION)), shapely.__version__, "unknown" if geosVersion is None else ".".join(map(str, geosVersion))))
+
+def _shapeArrays(objects, includeJunctions=True) -> (np.ndarray, np.ndarray):
+    # Vertices of the shape of every object and the index of the first vertex of each one
+    shapes = [obj.getShape(includeJunctions) for obj in objects]
+    starts = np.zeros(len(shapes) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum([len(shape) for shape in shapes])
+    points = np.array([point[:2] for shape in shapes for point in shape], dtype=np.float64).reshape(-1, 2)
+    return points, starts
+
+class SpatialIndex():
+    """
+    STRtree over the shapes of network objects, edges or lanes, answering nearest queries for arrays of points in one call.
+    Distances are to the polyline of the shape, with the junctions at both ends as sumolib.net.Net.getNeighboringEdges.\n
+    The objects allowing a vehicle class get a tree of their own, built on the first query filtered on that class,
+    so that the nearest allowed object is found without looking at the others.
+
+    Parameters
+    ----------
+    objects : list
+        Edges or lanes, sumolib or netCache ones
+
+    points, starts : numpy.ndarray
+        Vertices (x, y) of all the shapes, the shape of objects[i] being points[starts[i]:starts[i+1]]
+    """
+    def __init__(self, objects, points, starts):
+        _requireShapely()
+        self.objects = objects
+        counts = np.diff(starts)
+        self.geometries = shapely.linestrings(points, indices=np.repeat(np.arange(len(objects)), counts))
+        xmin, ymin = points.min(axis=0) if len(points) else (0.0, 0.0)
+        xmax, ymax = points.max(axis=0) if len(points) else (0.0, 0.0)
+        self.bounds = (xmin, ymin, xmax, ymax)
+        # Trees and indexes in objects of their geometries, by vehicle class, None for all the objects
+        self._trees = {None: (shapely.STRtree(self.geometries), np.arange(len(objects)))}
+
+    @classmethod
+    def fromObjects(cls, objects, includeJunctions=True):
+        return cls(objects, *_shapeArrays(objects, includeJunctions))
+
+    def _tree(self, vClass) -> (shapely.STRtree, np.ndarray):
+        tree = self._trees.get(vClass)
+        if tree is None:
+            indexes = np.array([i for i, obj in enumerate(self.objects) if obj.allows(vClass)], dtype=np.int64)
+            tree = self._trees[vClass] = (shapely.STRtree(self.geometries[indexes]), indexes)
+        return tree
+
+    def _maxDistance(self, x, y) -> float:
+        # Distance from the farthest point to the farthest corner of the bounds, every object is closer than that
+        xmin, ymin, xmax, ymax = self.bounds
+        return float(np.hypot(np.maximum(np.abs(x - xmin), np.abs(x - xmax)), np.maximum(np.abs(y - ymin), np.abs(y - ymax))).max())
+
+    def within(self, x, y, radius, vClass: str=None) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Returns the objects at less than radius of each point, sorted by point and by distance, as three arrays:
+        the index of the point in x and y, the index of the object in objects and the distance
+
+        Parameters
+        ----------
+        x, y : numpy.ndarray
+            Coordinates of the points, in the coordinates of the network
+
+        radius : float or numpy.ndarray
+            Distance within which objects are returned, for all the points or for each one
+
+        vClass : str
+            Only objects allowing the vehicle class are returned if given
+        """
+        points = shapely.points(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        tree, indexes = self._tree(vClass)
+        pointIndexes, treeIndexes = tree.query(points, predicate="dwithin", distance=radius)
+        objectIndexes = indexes[treeIndexes]
+        distances = shapely.distance(points[pointIndexes], self.geometries[objectIndexes])
+        found = distances < (radius[pointIndexes] if np.ndim(radius) else radius)
+        pointIndexes, objectIndexes, distances = pointIndexes[found], objectIndexes[found], distances[found]
+        order = np.lexsort((distances, pointIndexes))
+        return pointIndexes[order], objectIndexes[order], distances[order]
+
+    def nearest(self, x, y, k: int=1, radius: float=100, vClass: str=None, noLimit: bool=False) -> (np.ndarray, np.ndarray):
+        """
+        Returns the k nearest objects of each point within radius, as the arrays (len(x), k) of the indexes in objects
+        and of the distances, sorted by distance. Missing objects have the index -1 and the distance inf
+
+        Parameters
+        ----------
+        x, y : numpy.ndarray
+            Coordinates of the points, in the coordinates of the network
+
+        k : int
+            Number of objects per point
+
+        radius : float
+            Distance within which objects are searched
+
+        vClass : str
+            Only objects allowing the vehicle class are returned if given
+
+        noLimit : bool
+            Whether to search beyond radius for the points with less than k objects within it
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        indexes = np.full((len(x), k), -1, dtype=np.int64)
+        distances = np.full((len(x), k), np.inf)
+        if len(x) == 0 or len(self._tree(vClass)[1]) == 0:
+            return indexes, distances
+
+        tree, treeObjects = self._tree(vClass)
+        points = shapely.points(x, y)
+        (pointIndexes, treeIndexes), found = tree.query_nearest(points, max_distance=None if noLimit else radius,
+                                                               return_distance=True, all_matches=False)
+        keep = noLimit | (found < radius)
+        indexes[pointIndexes[keep], 0] = treeObjects[treeIndexes[keep]]
+        distances[pointIndexes[keep], 0] = found[keep]
+        if k == 1:
+            return indexes, distances
+
+        # Each point searches from the distance of its nearest object, doubled until it has k objects
+        pending = pointIndexes[keep]
+        radii = np.full(len(x), float(radius))
+        if noLimit:
+            radii[pending] = np.maximum(radius, 2 * distances[pending, 0])
+        maxDistance = self._maxDistance(x, y)
+        while len(pending) > 0:
+            pointIndexes, objectIndexes, found = self.within(x[pending], y[pending], radii[pending], vClass)
+            # Rank of each object among those of its point, the points being sorted
+            rank = np.arange(len(pointIndexes)) - np.searchsorted(pointIndexes, pointIndexes)
+            take = rank < k
+            indexes[pending[pointIndexes[take]], rank[take]] = objectIndexes[take]
+            distances[pending[pointIndexes[take]], rank[take]] = found[take]
+            if not noLimit:
+                break
+            pending = pending[(np.bincount(pointIndexes, minlength=len(pending)) < k) & (radii[pending] <= maxDistance)]
+            radii[pending] *= 2
+        return indexes, distances
+
+def getEdgeIndex(net) -> SpatialIndex:
+    """Returns the spatial index of the edges of the network, built on first use and kept on the network"""
+    index = getattr(net, "_edgeSpatialIndex", None)
+    if index is None:
+        if hasattr(net, "getShapeArrays"):
+            index = SpatialIndex(net.getEdges(), *net.getShapeArrays("edge"))
+        else:
+            index = SpatialIndex.fromObjects(net.getEdges())
+        net._edgeSpatialIndex = index
+    return index
+
+def getLaneIndex(net) -> SpatialIndex:
+    """Returns the spatial index of the lanes of the network, built on first use and kept on the network"""
+    index = getattr(net, "_laneSpatialIndex", None)
+    if index is None:
+        lanes = [lane for edge in net.getEdges() for lane in edge.getLanes()]
+        if hasattr(net, "getShapeArrays"):
+            index = SpatialIndex(lanes, *net.getShapeArrays("lane"))
+        else:
+            index = SpatialIndex.fromObjects(lanes)
+        net._laneSpatialIndex = index
+    return index
@@ -1,11 +1,11 @@
 import os, sys
 import argparse
-import sumolib
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from sumoplustools import netHandler
 from sumoplustools import verbose
 from sumoplustools.stopsigns import stopHandler
+from sumoplustools import netCache
 
 def fillOptions(argParser):
     argParser.add_argument("-n", "--sumo-network-file", 
@@ -35,7 +35,7 @@ if __name__ == "__main__":
     from xml.etree import ElementTree as ET
 
     routeTree = ET.parse(options.route_file)
-    net = sumolib.net.readNet(options.sumo_network_file)
+    net = netCache.readNet(options.sumo_network_file)
 
     root = routeTree.getroot()
     for vehicle in root.findall("vehicle"):
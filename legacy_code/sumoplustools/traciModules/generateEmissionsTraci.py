@@ -1,10 +1,9 @@
 import os, sys
-import traci
 import sumolib
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools.traciModules.sumoConnection import SumoConnection
 from sumoplustools.emissions.generateEmissions import EmissionGenerator
-from sumoplustools import netHandler
 
 class TraciEmissions(EmissionGenerator):
     def __init__(self, net : sumolib.net.Net):
@@ -14,7 +13,7 @@ class TraciEmissions(EmissionGenerator):
     def resetLastSave(self):
         self._lastSave = None
     
-    def verifyEmissionCollection(self, fromStep, toStep, timeInterval, eTypes, connection: traci.Connection) -> bool:
+    def verifyEmissionCollection(self, fromStep, toStep, timeInterval, eTypes, connection: SumoConnection) -> bool:
         '''
         Pre condition to verify if vehicle emissions should be collected for the current time.\n
         Saves the vehicles emissions if appropriate to the current time.\n
@@ -35,8 +34,8 @@ class TraciEmissions(EmissionGenerator):
         eTypes : List
             List of strings containing the emission types that will be collected
 
-        connection : traci.Connection
-            Socket connection to the TraCI server
+        connection : SumoConnection
+            Connection to SUMO, either a TraCI socket or libsumo
         '''
         if connection.simulation.getTime() < fromStep or connection.simulation.getTime() > toStep:
             return False
@@ -53,7 +52,7 @@ class TraciEmissions(EmissionGenerator):
 
         return True
 
-    def collectVehicleEmissions(self, vehID, connection: traci.Connection):
+    def collectVehicleEmissions(self, vehID, connection: SumoConnection):
         '''
         Collects the emission data of the vehicle at the current time.
         '''
@@ -66,15 +65,12 @@ class TraciEmissions(EmissionGenerator):
             PMx_output = connection.vehicle.getPMxEmission(vehID) * connection.simulation.getDeltaT()
             emission_output = {'Fuel':fuel_output, 'CO2':CO2_output, 'CO':CO_output, 'HC':HC_output, 'NOx':NOx_output, 'PMx':PMx_output}
 
-            edgeID = connection.vehicle.getRoadID(vehID)
-            if edgeID[0] == ":":
-                # Vehicle is on a junction
-                x, y = connection.vehicle.getPosition(vehID)
-                edgeID = netHandler.getClosestEdge(self.net, x, y, noLimit=True).getID()
+            # Edges and internal edges are looked up, the position is only needed for an internal edge of no connection
+            roadID = connection.vehicle.getRoadID(vehID)
+            x, y = (None, None) if roadID in self.laneToStreet else connection.vehicle.getPosition(vehID)
+            self.addStreetOutputs(vehID, self.laneToStreet.getStreet(roadID, x, y), emission_output)
 
-            self.addOutputs(vehID, edgeID, emission_output)
-
-    def collectEmissions(self, fromStep, toStep, timeInterval, eTypes, connection: traci.Connection):
+    def collectEmissions(self, fromStep, toStep, timeInterval, eTypes, connection: SumoConnection):
         """
         Collects the emission data of the current time step.\n
         Only if the current time step falls within fromStep and toStep (not included) is the emission data collected.
@@ -97,8 +93,8 @@ class TraciEmissions(EmissionGenerator):
         eTypes : List
             List of strings containing the emission types that will be collected
 
-        connection : traci.Connection
-            Socket connection to the TraCI server
+        connection : SumoConnection
+            Connection to SUMO, either a TraCI socket or libsumo
         """
         if not self.verifyEmissionCollection(fromStep, toStep, timeInterval, eTypes, connection):
             return
@@ -108,6 +104,7 @@ class TraciEmissions(EmissionGenerator):
             self.collectVehicleEmissions(vehID, connection)
 
     def close(self):
-        if not self._sql_buffer.empty:
+        # The steps since the last save are still in the resolution buffer
+        if len(self._resolution_buffer) or self._sql_buffer:
             self.saveToSQL(self._lastSave, force=True)
         super().close()
\ No newline at end of file
@@ -1,10 +1,11 @@
 import os, sys
 from datetime import timedelta
-import traci
 import sumolib
+import numpy as np
 import geopandas as gpd
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools.traciModules.sumoConnection import SumoConnection
 from sumoplustools.postgresql.psqlObjects import VisualConnection
 from sumoplustools import netHandler
 
@@ -12,8 +13,10 @@ class TraciVisuals():
     def __init__(self, net: sumolib.net.Net):
         self.sqlConnection = VisualConnection()
         self.net = net
+        self.geoConverter = netHandler.GeoConverter.fromNet(net)
         self.mapNetToDF = self.sqlConnection.getNetToDFMap()
 
+        self.runID = None
         self._json_output = {}
         self._sql_buffer = []
         self._lastSave = None
@@ -40,7 +43,7 @@ class TraciVisuals():
             Names of outputs associated with their numerical value
         """
         time = self.sqlConnection.initalDate + timedelta(seconds=time)
-        self._sql_buffer.append({self.sqlConnection.columns[0]:time, self.sqlConnection.columns[1]:veh_id, **visual_output})
+        self._sql_buffer.append({self.sqlConnection.runColumn:self.runID, self.sqlConnection.columns[0]:time, self.sqlConnection.columns[1]:veh_id, **visual_output})
         
 
     def saveToSQL(self, force=False):
@@ -54,18 +57,30 @@ class TraciVisuals():
         '''
         if len(self._sql_buffer) / (10**3) >= 100 or force:
             sql_df = gpd.pd.DataFrame.from_dict(self._sql_buffer)
-            self.sqlConnection.insertDataFrame(sql_df, self.sqlConnection.vehTable)
+            self.sqlConnection.copyDataFrame(sql_df, self.sqlConnection.vehTable)
             self._resetSQLBuffer()
     
     def clearSQLVisuals(self):
         self.sqlConnection.clearVehicleTable()
 
+    def startRun(self, runID):
+        """
+        Saves the following visuals under the run, see SQLConnection.createRun
+
+        Parameters
+        ----------
+        runID : int
+            Id of the run
+        """
+        self.sqlConnection.startRun(runID)
+        self.runID = runID
+
     def saveToDataFrame(self, veh_id, filename, fromTime=None, toTime=None) -> gpd.pd.DataFrame:
-        df = self.sqlConnection.getVehDF(veh_id, fromTime, toTime)
+        df = self.sqlConnection.getVehDF(veh_id, fromTime, toTime, self.runID)
         df.to_csv(filename)
         return df
     
-    def verifyVisualCollection(self, fromStep, toStep, connection: traci.Connection) -> bool:
+    def verifyVisualCollection(self, fromStep, toStep, connection: SumoConnection) -> bool:
         '''
         Pre condition to verify if vehicle visualization should be collected for the current time.\n
         Saves the vehicles visualization if appropriate to the current time.\n
@@ -79,8 +94,8 @@ class TraciVisuals():
         toStep : float
             Time step that collecting visual data will stop at
 
-        connection : traci.Connection
-            Socket connection to the TraCI server
+        connection : SumoConnection
+            Connection to SUMO, either a TraCI socket or libsumo
         '''
         if connection.simulation.getTime() < fromStep or connection.simulation.getTime() > toStep:
             return False
@@ -96,14 +111,29 @@ class TraciVisuals():
 
         return True
 
-    def collectVehicleVisuals(self, vehID, connection: traci.Connection):
+    def collectVehicleVisuals(self, vehID, connection: SumoConnection):
         '''
         Collects the visualization data of the vehicle at the current time.
         '''
+        x, y = connection.vehicle.getPosition(vehID)
+        lon, lat = self.geoConverter.convertXY2LonLat(x, y)
+        self._addVehicleVisuals(vehID, x, y, float(lon), float(lat), connection)
+
+    def collectVehiclesVisuals(self, vehIDs, connection: SumoConnection):
+        '''
+        Collects the visualization data of the vehicles at the current time.
+        The positions of all vehicles are converted to geo coordinates in one call.
+        '''
+        if len(vehIDs) == 0:
+            return
+        xs, ys = np.array([connection.vehicle.getPosition(vehID) for vehID in vehIDs], dtype=float).T
+        lons, lats = self.geoConverter.convertXY2LonLat(xs, ys)
+        for vehID, x, y, lon, lat in zip(vehIDs, xs.tolist(), ys.tolist(), lons.tolist(), lats.tolist()):
+            self._addVehicleVisuals(vehID, x, y, lon, lat, connection)
+
+    def _addVehicleVisuals(self, vehID, x, y, lon, lat, connection: SumoConnection):
         cols = self.sqlConnection.columns
 
-        x, y = connection.vehicle.getPosition(vehID)
-        lon, lat = self.net.convertXY2LonLat(x,y)
         speed = connection.vehicle.getSpeed(vehID)
         direction = connection.vehicle.getSlope(vehID)
         vtype = connection.vehicle.getTypeID(vehID)
@@ -133,7 +163,7 @@ class TraciVisuals():
 
         self.addOutputs(connection.simulation.getTime(), vehID, visual_output)
 
-    def collectVisuals(self, fromStep, toStep, timeInterval, eTypes, connection : traci.Connection):
+    def collectVisuals(self, fromStep, toStep, timeInterval, eTypes, connection: SumoConnection):
         """
         Collects the visualization data of the current time step.\n
         Only if the current time step falls within fromStep and toStep (not included) is the visualization data collected.
@@ -156,15 +186,13 @@ class TraciVisuals():
         eTypes : List
             List of strings containing the visual types that will be collected
 
-        connection : traci.Connection
-            Socket connection to the TraCI server
+        connection : SumoConnection
+            Connection to SUMO, either a TraCI socket or libsumo
         """
         if not self.verifyVisualCollection(fromStep, toStep, connection):
             return
 
-        # Loops for each vehicle in the network
-        for vehID in connection.vehicle.getIDList():
-            self.collectVehicleVisuals(vehID, connection)
+        self.collectVehiclesVisuals(connection.vehicle.getIDList(), connection)
 
     def close(self):
         if len(self._sql_buffer) != 0:
@@ -6,9 +6,11 @@ import numpy as np
 from xml.etree import ElementTree as ET
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from sumoplustools.traciModules.sumoConnection import BACKENDS, startConnection, getDefaultBackend
 from sumoplustools.traciModules.routeToCharge import RerouteChargingDomain
 from sumoplustools.traciModules.generateEmissionsTraci import TraciEmissions
 from sumoplustools.traciModules.generateVisualsTraci import TraciVisuals
+from sumoplustools import netCache
 
 def fillOptions(argParser):
     generalGroup = argParser.add_argument_group("General")
@@ -24,6 +26,12 @@ def fillOptions(argParser):
     generalGroup.add_argument("-t", "--traci-commands",
                             metavar='"--CMD ARG[,] "*', type=str,
                             help="TraCI commands to be added when TraCI starts. Commands can be seperated by a ',' (comma) or a ' ' (space)")
+    generalGroup.add_argument("-b", "--backend",
+                            type=str, choices=BACKENDS, default=getDefaultBackend(),
+                            help="connect to SUMO through a TraCI socket or run it in-process with libsumo. Defaults to the SUMO_BACKEND environment variable, otherwise traci")
+    generalGroup.add_argument("--seed",
+                            metavar="INT", type=int,
+                            help="random seed of SUMO, saved with the run in the database")
 
     visualGroup = argParser.add_argument_group("Generate Visuals")
     visualGroup.add_argument("-v", "--generate-visuals",
@@ -91,6 +99,8 @@ if __name__ == "__main__":
     options, argParser = parse_args()
 
     extraCmd = []
+    if options.gui and options.backend == "libsumo":
+        argParser.error("the SUMO GUI cannot be used with the libsumo backend")
     if options.gui:
         binary = "sumo-gui"
         if options.start_on_open:
@@ -102,7 +112,8 @@ if __name__ == "__main__":
         traciCmds = options.traci_commands.split(",")
         for cmd in traciCmds:
             extraCmd += cmd.trim().split()
-
+    if options.seed is not None:
+        extraCmd += ["--seed", str(options.seed)]
 
     # Initialize variables
     sumoBinary = sumolib.checkBinary(binary)
@@ -112,19 +123,23 @@ if __name__ == "__main__":
 
     # Establish connection to SUMO server and set connection
     try:
-        traci.start(sumoCmd, label=connLabel)
-        connection = traci.getConnection(label=connLabel)
-    except traci.FatalTraCIError as err:
+        connection = startConnection(sumoCmd, backend=options.backend, label=connLabel)
+    except (traci.FatalTraCIError, traci.TraCIException) as err:
         argParser.error("TraCI Error: " + str(err.args))
+    except ImportError as err:
+        argParser.error("could not load the %s backend: %s" % (options.backend, str(err)))
 
     if options.reroute_charging:
         rcd = RerouteChargingDomain(sumocfgFile, connection)
+
+    # Emissions and visuals of this simulation are saved under a single run
+    runID = None
     
     if options.generate_emissions:
         # Set net file
         try:
             root = ET.parse(options.sumo_config_file).getroot()
-            net = sumolib.net.readNet(os.path.abspath(os.path.join(os.path.dirname(options.sumo_config_file), root.find("input").find("net-file").get("value"))))
+            net = netCache.readNet(os.path.abspath(os.path.join(os.path.dirname(options.sumo_config_file), root.find("input").find("net-file").get("value"))))
         except:
             argParser.error('could not locate SUMO network file from the configuration file %s' % os.path.abspath(options.sumo_config_file))
 
@@ -206,14 +221,15 @@ if __name__ == "__main__":
 
         # Validate Emission Inputs Complete #
         t_emissions = TraciEmissions(net)
-        t_emissions.clearSQLEmissions()
+        runID = t_emissions.sqlConnection.createRun(configFile=os.path.abspath(sumocfgFile), seed=options.seed)
+        t_emissions.startRun(runID)
     
     if options.generate_visuals:
         # Set net file
         try:
             if not 'net' in locals():
                 root = ET.parse(options.sumo_config_file).getroot()
-                net = sumolib.net.readNet(os.path.abspath(os.path.join(os.path.dirname(options.sumo_config_file), root.find("input").find("net-file").get("value"))))
+                net = netCache.readNet(os.path.abspath(os.path.join(os.path.dirname(options.sumo_config_file), root.find("input").find("net-file").get("value"))))
         except:
             argParser.error('could not locate SUMO network file from the configuration file %s' % os.path.abspath(options.sumo_config_file))
 
@@ -269,7 +285,9 @@ if __name__ == "__main__":
 
         # Validate Emission Inputs Complete #
         t_visuals = TraciVisuals(net)
-        t_visuals.clearSQLVisuals()
+        if runID is None:
+            runID = t_visuals.sqlConnection.createRun(configFile=os.path.abspath(sumocfgFile), seed=options.seed)
+        t_visuals.startRun(runID)
 
     # Main loop through the simulation #
     while connection.simulation.getMinExpectedNumber() > 0:
@@ -280,23 +298,27 @@ if __name__ == "__main__":
         if options.generate_visuals:
             collectVisuals = t_visuals.verifyVisualCollection(fromStep=v_fromTime, toStep=v_toTime, connection=connection)
 
-        for vehID in connection.vehicle.getIDList():
-            if options.generate_emissions and collectEmissions:
+        vehIDs = connection.vehicle.getIDList()
+        if options.generate_emissions and collectEmissions:
+            for vehID in vehIDs:
                 t_emissions.collectVehicleEmissions(vehID, connection)
-            if options.generate_visuals and collectVisuals:
-                t_visuals.collectVehicleVisuals(vehID, connection)
+        if options.generate_visuals and collectVisuals:
+            t_visuals.collectVehiclesVisuals(vehIDs, connection)
 
         connection.simulationStep()
 
     if options.generate_emissions:
         if options.emission_output_file:
             t_emissions.saveToDataFrame(fromTime=e_fromTime, toTime=e_toTime, eTypes=eTypes, filename=options.emission_output_file)
+        t_emissions.sqlConnection.finishRun(runID)
         t_emissions.close()
     if options.generate_visuals:
+        if not options.generate_emissions:
+            t_visuals.sqlConnection.finishRun(runID)
         t_visuals.close()
 
     # Close the simulation
     try:
         connection.close()
-    except traci.FatalTraCIError:
+    except connection.FatalTraCIError:
         pass
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import traci
+
+BACKENDS = ("traci", "libsumo")
+BACKEND_ENV = "SUMO_BACKEND"
+
+def getDefaultBackend() -> str:
+    """Returns the backend set in the SUMO_BACKEND environment variable, 'traci' if not set"""
+    return os.environ.get(BACKEND_ENV, "traci")
+
+class SumoConnection():
+    """
+    Shared interface over a TraCI socket connection and the in-process libsumo module.\n
+    Exposes the domains used by the traci modules (vehicle, simulation, lane, route, edge)
+    along with simulationStep() and close(), so the helpers do not depend on the backend.
+    """
+    def __init__(self, backend: str, conn):
+        self.backend = backend
+        self._conn = conn
+        self.vehicle = conn.vehicle
+        self.simulation = conn.simulation
+        self.lane = conn.lane
+        self.route = conn.route
+        self.edge = conn.edge
+        if backend == "libsumo":
+            self.TraCIException = conn.TraCIException
+            self.FatalTraCIError = getattr(conn, "FatalTraCIError", conn.TraCIException)
+        else:
+            self.TraCIException = traci.TraCIException
+            self.FatalTraCIError = traci.FatalTraCIError
+
+    @property
+    def inProcess(self) -> bool:
+        return self.backend == "libsumo"
+
+    def simulationStep(self, step=0.):
+        return self._conn.simulationStep(step)
+
+    def close(self):
+        self._conn.close()
+
+def startConnection(sumoCmd: list, backend: str=None, label: str="default") -> SumoConnection:
+    """
+    Starts SUMO with the given command and returns the connection to it.\n
+    The backend is either 'traci' (socket connection) or 'libsumo' (in-process). Uses SUMO_BACKEND if omitted.\n
+    Raises a ValueError if the backend is unknown. A failure to start raises traci.TraCIException or traci.FatalTraCIError
+    whatever the backend, libsumo errors being wrapped in them
+    """
+    if backend is None:
+        backend = getDefaultBackend()
+    if backend not in BACKENDS:
+        raise ValueError('unknown SUMO backend "%s", use one of %s' % (backend, ", ".join(BACKENDS)))
+
+    if backend == "libsumo":
+        import libsumo
+        try:
+            libsumo.start(sumoCmd)
+        # older libsumo builds have no FatalTraCIError, () catches nothing
+        except getattr(libsumo, "FatalTraCIError", ()) as err:
+            raise traci.FatalTraCIError(str(err)) from err
+        except libsumo.TraCIException as err:
+            raise traci.TraCIException(str(err)) from err
+        return SumoConnection(backend, libsumo)
+
+    traci.start(sumoCmd, label=label)
+    return SumoConnection(backend, traci.getConnection(label))